@@ -0,0 +1,35 @@
+"""nullable task execution references for API jobs
+
+Revision ID: 3f2a9c1d7e4b
+Revises: bdad84ddff9d
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e4b'
+down_revision = 'bdad84ddff9d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('task_executions', 'scheduled_task_id',
+               existing_type=sa.Integer(),
+               nullable=True)
+    op.alter_column('task_executions', 'connection_id',
+               existing_type=sa.Integer(),
+               nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM task_executions WHERE scheduled_task_id IS NULL OR connection_id IS NULL")
+    op.alter_column('task_executions', 'connection_id',
+               existing_type=sa.Integer(),
+               nullable=False)
+    op.alter_column('task_executions', 'scheduled_task_id',
+               existing_type=sa.Integer(),
+               nullable=False)
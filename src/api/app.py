@@ -1,10 +1,11 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
 from src.api.routes.review import router as review_router
 from src.api.routes.config import router as config_router
 from src.api.routes.rules import router as rules_router
@@ -12,13 +13,29 @@ from src.api.routes.connections import router as connections_router
 from src.api.routes.monitoring import router as monitoring_router
 from src.api.routes.scheduler import router as scheduler_router
 from src.api.routes.logs import router as logs_router
+from src.api.routes.jobs import router as jobs_router
+from src.api.middleware import RateLimitMiddleware
 from src.core.config import settings
+from src.core.constants import (
+    REVIEW_SERVICE_WARMUP_RETRY_DELAY,
+    TRACING_SHUTDOWN_TIMEOUT,
+)
+from src.services.review_service import (
+    get_shared_review_service,
+    init_review_service,
+    is_review_service_ready,
+    llm_configured,
+)
+
+logger = logging.getLogger(__name__)
 
 API_V1_PREFIX = "/api/v1"
 API_V1_DOCS = f"{API_V1_PREFIX}/docs"
 API_V1_REDOC = f"{API_V1_PREFIX}/redoc"
 API_V1_OPENAPI = f"{API_V1_PREFIX}/openapi.json"
 
+_startup_state = {"indexes_ready": False}
+
 
 def check_faiss_index() -> bool:
     """Проверить существование FAISS индекса."""
@@ -28,6 +45,75 @@ def check_faiss_index() -> bool:
     return os.path.exists(faiss_path)
 
 
+def build_missing_indexes():
+    """Построить индексы для типов правил, у которых их еще нет на диске."""
+    rules_base_dir = settings.kb_rules_dir
+    if not os.path.exists(rules_base_dir):
+        logger.warning(f"Базовая директория правил {rules_base_dir} не найдена")
+        return
+
+    missing = []
+    for item in sorted(os.listdir(rules_base_dir)):
+        rule_dir = os.path.join(rules_base_dir, item)
+        index_path = os.path.join(settings.faiss_persist_dir, item, "index.faiss")
+        if os.path.isdir(rule_dir) and not os.path.exists(index_path):
+            missing.append((item, rule_dir))
+    if not missing:
+        return
+
+    # Импорт тянет langchain и модель эмбеддингов, поэтому только по необходимости
+    from src.kb.ingest import ingest_rules
+
+    for item, rule_dir in missing:
+        logger.info(f"Загрузка правил типа '{item}' из {rule_dir}")
+        try:
+            ingest_rules(rule_dir, item)
+        except Exception as e:
+            logger.error(f"Не удалось построить индекс правил '{item}': {e}")
+
+
+async def prepare_services():
+    """Фоновая подготовка: недостающие индексы, затем прогрев сервиса анализа."""
+    await asyncio.to_thread(build_missing_indexes)
+    _startup_state["indexes_ready"] = True
+    await warm_up_review_service()
+
+
+async def warm_up_review_service():
+    """Прогреть общий ReviewService в фоне, повторяя попытки при ошибках."""
+    if not llm_configured():
+        logger.warning("GIGACHAT_API_KEY не задан, прогрев сервиса анализа пропущен")
+        return
+
+    while True:
+        try:
+            await asyncio.to_thread(init_review_service)
+            return
+        except Exception as e:
+            logger.error(
+                f"Не удалось инициализировать сервис анализа: {e}, "
+                f"повтор через {REVIEW_SERVICE_WARMUP_RETRY_DELAY} с"
+            )
+            await asyncio.sleep(REVIEW_SERVICE_WARMUP_RETRY_DELAY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Жизненный цикл приложения.
+
+    Тяжелая подготовка идет в фоне, поэтому процесс сразу начинает отвечать
+    на /health/live, а /health/ready сообщает о готовности к анализу.
+    """
+    warmup_task = asyncio.create_task(prepare_services())
+    yield
+    if not warmup_task.done():
+        warmup_task.cancel()
+
+    from src.core.tracing import shutdown_tracing
+
+    await asyncio.to_thread(shutdown_tracing, TRACING_SHUTDOWN_TIMEOUT)
+
+
 def create_application() -> FastAPI:
     """Создание и настройка FastAPI приложения."""
 
@@ -39,6 +125,7 @@ def create_application() -> FastAPI:
         openapi_url=API_V1_OPENAPI,
         docs_url=API_V1_DOCS,
         redoc_url=API_V1_REDOC,
+        lifespan=lifespan,
     )
 
     app.add_middleware(
@@ -49,10 +136,7 @@ def create_application() -> FastAPI:
         allow_headers=["*"],
     )
 
-    limiter = Limiter(key_func=get_remote_address)
-    app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-    app.add_middleware(SlowAPIMiddleware)
+    app.add_middleware(RateLimitMiddleware)
 
     app.include_router(review_router, prefix=API_V1_PREFIX)
     app.include_router(config_router, prefix=API_V1_PREFIX)
@@ -61,6 +145,7 @@ def create_application() -> FastAPI:
     app.include_router(monitoring_router, prefix=API_V1_PREFIX)
     app.include_router(scheduler_router, prefix=API_V1_PREFIX)
     app.include_router(logs_router, prefix=API_V1_PREFIX)
+    app.include_router(jobs_router, prefix=API_V1_PREFIX)
 
     app.include_router(review_router, prefix="/api")
     app.include_router(config_router, prefix="/api")
@@ -69,6 +154,7 @@ def create_application() -> FastAPI:
     app.include_router(monitoring_router, prefix="/api")
     app.include_router(scheduler_router, prefix="/api")
     app.include_router(logs_router, prefix="/api")
+    app.include_router(jobs_router, prefix="/api")
 
     @app.get("/")
     async def root():
@@ -91,17 +177,44 @@ def create_application() -> FastAPI:
         from datetime import datetime
 
         static_exists = Path(settings.static_dir).exists()
+        review_service = get_shared_review_service()
 
         return {
             "status": "healthy",
             "version": settings.app_version,
             "debug": settings.debug,
             "faiss_index_loaded": check_faiss_index(),
+            "review_service_ready": is_review_service_ready(),
+            "runtime": review_service.runtime_stats() if review_service else {},
             "static_files_available": static_exists,
             "environment": os.getenv("ENVIRONMENT", "development"),
             "timestamp": datetime.now(),
         }
 
+    @app.get("/health/live")
+    async def liveness_check():
+        """Процесс запущен и обрабатывает запросы (без обращения к зависимостям)."""
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    async def readiness_check():
+        """Готовность к обработке запросов анализа."""
+        indexes_ready = _startup_state["indexes_ready"]
+        if not is_review_service_ready():
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={
+                    "status": "starting",
+                    "indexes_ready": indexes_ready,
+                    "review_service_ready": False,
+                },
+            )
+        return {
+            "status": "ready",
+            "indexes_ready": indexes_ready,
+            "review_service_ready": True,
+        }
+
     @app.get("/api/versions")
     async def api_versions():
         """Получить информацию о доступных версиях API."""
@@ -2,29 +2,47 @@
 Инъекция зависимостей для FastAPI.
 """
 
-from typing import Generator
 from fastapi import HTTPException, status
-from src.services.review_service import ReviewService
+from src.services.review_service import (
+    ReviewService,
+    get_shared_review_service,
+    llm_configured,
+)
+from src.services import database_service, vault_service
 from src.services.database_service import DatabaseService
+from src.services.vault_service import VaultService
 from src.core.config import settings
 
 
-def get_review_service() -> Generator[ReviewService, None, None]:
-    """Зависимость для ReviewService."""
-    api_key = settings.gigachat_api_key
-    if not api_key:
+def get_review_service() -> ReviewService:
+    """Зависимость для ReviewService.
+
+    Возвращает общий для процесса сервис, созданный при старте приложения.
+    """
+    if not llm_configured():
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="GIGACHAT_API_KEY не найден.",
         )
 
-    service = ReviewService(api_key=api_key)
-    yield service
+    service = get_shared_review_service()
+    if service is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис анализа еще не готов, повторите запрос позже.",
+            headers={"Retry-After": "5"},
+        )
+    return service
 
 
 def get_database_service() -> DatabaseService:
-    """Зависимость для DatabaseService."""
-    return DatabaseService()
+    """Зависимость для DatabaseService (создается при первом запросе)."""
+    return database_service.get_database_service()
+
+
+def get_vault_service() -> VaultService:
+    """Зависимость для VaultService (создается при первом запросе)."""
+    return vault_service.get_vault_service()
 
 
 def get_environment() -> str:
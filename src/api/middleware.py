@@ -0,0 +1,118 @@
+"""
+Middleware приложения FastAPI.
+"""
+
+import hashlib
+import hmac
+import logging
+import math
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.core.config import settings
+from src.core.constants import (
+    INTERNAL_TOKEN_HEADER,
+    RATE_LIMIT_DEFAULT_COST,
+    RATE_LIMIT_ENDPOINT_COSTS,
+    RATE_LIMIT_EXEMPT_SUFFIXES,
+    RATE_LIMIT_WRITE_COST,
+)
+from src.core.rate_limit import get_api_limiter
+
+logger = logging.getLogger(__name__)
+
+_API_PREFIXES = ("/api/v1", "/api")
+
+
+def request_cost(method: str, path: str) -> Optional[int]:
+    """Стоимость запроса в токенах (None — запрос не ограничивается)."""
+    for prefix in _API_PREFIXES:
+        if path.startswith(prefix + "/"):
+            path = path[len(prefix) :]
+            break
+    else:
+        # Вне API: корень, /health*, статика
+        return None
+    if path.endswith(RATE_LIMIT_EXEMPT_SUFFIXES):
+        return None
+
+    for cost_method, cost_prefix, cost in RATE_LIMIT_ENDPOINT_COSTS:
+        if method == cost_method and path.startswith(cost_prefix):
+            return cost
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return RATE_LIMIT_DEFAULT_COST
+    return RATE_LIMIT_WRITE_COST
+
+
+@lru_cache(maxsize=1)
+def _api_key_hashes(raw: str) -> FrozenSet[str]:
+    return frozenset(h.strip().lower() for h in raw.split(",") if h.strip())
+
+
+def client_identity(scope: Scope) -> str:
+    """Ключ клиента: известный API-ключ из заголовка, иначе IP-адрес.
+
+    Непроверенный ключ не учитывается: иначе клиент получал бы новую
+    корзину на каждое случайное значение заголовка.
+    """
+    headers = Headers(scope=scope)
+    api_key = headers.get(settings.rate_limit_client_header)
+    if api_key:
+        digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        if digest in _api_key_hashes(settings.rate_limit_api_keys):
+            return "key:" + digest[:32]
+    if settings.rate_limit_trust_forwarded:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def is_internal_request(scope: Scope) -> bool:
+    """Вызов воркера с общим токеном: задание уже оплачено при постановке."""
+    token = settings.internal_api_token
+    if not token:
+        return False
+    received = Headers(scope=scope).get(INTERNAL_TOKEN_HEADER, "")
+    return hmac.compare_digest(received.encode("utf-8"), token.encode("utf-8"))
+
+
+class RateLimitMiddleware:
+    """Ограничение запросов по клиентам с учетом стоимости эндпоинтов."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        cost = request_cost(scope["method"], scope["path"])
+        if cost is None or is_internal_request(scope):
+            await self.app(scope, receive, send)
+            return
+
+        identity = client_identity(scope)
+        allowed, retry_after = await get_api_limiter().aconsume(identity, cost)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        logger.info(
+            "Превышен лимит запросов: %s %s %s",
+            identity,
+            scope["method"],
+            scope["path"],
+        )
+        response = JSONResponse(
+            status_code=429,
+            content={"detail": "Превышен лимит запросов, повторите позже"},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
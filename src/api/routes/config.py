@@ -1,6 +1,7 @@
 import ssl
 from fastapi import APIRouter, HTTPException, Depends
 from src.api.schemas import ConfigRequest
+from src.core.agents.gateway import CircuitOpenError
 from src.services.review_service import ReviewService
 from src.api.dependencies import get_review_service
 
@@ -13,7 +14,7 @@ async def analyze_config(
 ):
     """Эндпоинт для анализа конфигурации PostgreSQL."""
     try:
-        result = service.analyze_config(
+        result = await service.aanalyze_config(
             {
                 "config": request.config,
                 "server_info": request.server_info,
@@ -22,6 +23,12 @@ async def analyze_config(
         )
         return result
 
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
     except ssl.SSLError as e:
         raise HTTPException(
             status_code=500,
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 import logging
 from src.api.schemas import ConnectionCreate, ConnectionResponse, ConnectionUpdate
-from src.services.vault_service import VaultService
+from src.services.vault_service import get_vault_service
 from src.services.database_service import DatabaseService
 from src.models.base import get_db
 from src.repositories.connections import ConnectionRepository
@@ -14,8 +14,6 @@ router = APIRouter(prefix="/connections", tags=["connections"])
 
 CONNECTION_NOT_FOUND = "Подключение не найдено"
 
-vault_service = VaultService()
-
 
 def get_connection_or_404(connection_id: int, db: Session) -> Dict[str, Any]:
     """Получить подключение по ID или вызвать HTTPException."""
@@ -44,7 +42,7 @@ async def create_connection(
             "password": connection_data.password,
         }
 
-        success = vault_service.store_credentials(vault_path, credentials)
+        success = get_vault_service().store_credentials(vault_path, credentials)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -122,7 +120,7 @@ async def update_connection(
         update_data = {k: v for k, v in update_data.items() if k not in vault_fields}
 
         if vault_updates:
-            current_credentials = vault_service.get_credentials(
+            current_credentials = get_vault_service().get_credentials(
                 existing_connection["vault_path"]
             )
 
@@ -130,7 +128,7 @@ async def update_connection(
                 updated_credentials = current_credentials.copy()
                 updated_credentials.update(vault_updates)
 
-                vault_service.store_credentials(
+                get_vault_service().store_credentials(
                     existing_connection["vault_path"], updated_credentials
                 )
 
@@ -163,7 +161,7 @@ async def delete_connection(connection_id: int, db: Session = Depends(get_db)):
     try:
         existing_connection = get_connection_or_404(connection_id, db)
 
-        vault_service.delete_credentials(existing_connection["vault_path"])
+        get_vault_service().delete_credentials(existing_connection["vault_path"])
 
         database_service = DatabaseService(db)
         success = database_service.delete_connection(connection_id)
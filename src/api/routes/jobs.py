@@ -0,0 +1,163 @@
+"""
+API роуты для асинхронных заданий анализа.
+
+Задание сохраняется в task_executions и ставится в очередь воркера Redis;
+клиент сразу получает идентификатор и опрашивает статус (или ждет webhook),
+не удерживая соединение на время работы LLM.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, HTTPException, Request, status
+from pydantic import BaseModel
+from src.api.routes.logs import LogAnalysisRequest
+from src.api.schemas import ConfigRequest, ReviewRequest
+from src.core.utils.webhook import validate_webhook_url
+from src.scheduler.models import JOB_TASK_TYPES, TaskQueueItem, TaskType
+from src.services.database_service import get_database_service
+from src.services.scheduler_service import get_scheduler_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+JOB_NOT_FOUND = "Задание не найдено"
+
+
+class ReviewJobRequest(ReviewRequest):
+    webhook_url: Optional[str] = None
+
+
+class ConfigJobRequest(ConfigRequest):
+    webhook_url: Optional[str] = None
+
+
+class LogsJobRequest(LogAnalysisRequest):
+    webhook_url: Optional[str] = None
+
+
+class JobCreatedResponse(BaseModel):
+    job_id: int
+    status: str
+    status_url: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: int
+    job_type: str
+    status: str
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error_message: Optional[str] = None
+
+
+async def _enqueue_job(
+    request: Request, task_type: TaskType, payload: Dict[str, Any]
+) -> JobCreatedResponse:
+    webhook_url = payload.pop("webhook_url", None)
+    if webhook_url:
+        try:
+            await asyncio.to_thread(validate_webhook_url, webhook_url)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+            )
+    parameters = {"payload": payload, "webhook_url": webhook_url}
+    database_service = get_database_service()
+    try:
+        execution_id = database_service.create_task_execution(
+            task_type.value, None, parameters=parameters
+        )
+    except Exception as e:
+        logger.error(f"Ошибка создания задания {task_type.value}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Не удалось создать задание: {str(e)}",
+        )
+
+    try:
+        await get_scheduler_service().enqueue_item_async(
+            TaskQueueItem(
+                execution_id=execution_id,
+                task_type=task_type,
+                parameters=parameters,
+            )
+        )
+    except Exception as e:
+        logger.error(f"Ошибка постановки задания {execution_id} в очередь: {e}")
+        database_service.update_task_execution(
+            execution_id,
+            status="failed",
+            completed_at=datetime.now(),
+            error_message=str(e),
+        )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Очередь заданий недоступна, повторите запрос позже",
+        )
+
+    return JobCreatedResponse(
+        job_id=execution_id,
+        status="pending",
+        status_url=str(request.url_for("get_job", job_id=execution_id)),
+    )
+
+
+@router.post(
+    "/review",
+    response_model=JobCreatedResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_review_job(request: Request, job: ReviewJobRequest):
+    """Поставить в очередь проверку SQL-запроса."""
+    return await _enqueue_job(request, TaskType.SQL_REVIEW, job.model_dump())
+
+
+@router.post(
+    "/config",
+    response_model=JobCreatedResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_config_job(request: Request, job: ConfigJobRequest):
+    """Поставить в очередь анализ конфигурации."""
+    return await _enqueue_job(request, TaskType.CONFIG_ANALYSIS, job.model_dump())
+
+
+@router.post(
+    "/logs",
+    response_model=JobCreatedResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_logs_job(request: Request, job: LogsJobRequest):
+    """Поставить в очередь анализ логов."""
+    return await _enqueue_job(request, TaskType.LOGS_ANALYSIS, job.model_dump())
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: int):
+    """Статус задания; результат — после завершения."""
+    try:
+        execution = get_database_service().get_task_execution(job_id)
+    except Exception as e:
+        logger.error(f"Ошибка получения задания {job_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка получения задания: {str(e)}",
+        )
+
+    job_types = {task_type.value for task_type in JOB_TASK_TYPES}
+    if not execution or execution["task_type"] not in job_types:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=JOB_NOT_FOUND)
+
+    return JobStatusResponse(
+        job_id=execution["id"],
+        job_type=execution["task_type"],
+        status=execution["status"],
+        started_at=execution.get("started_at"),
+        completed_at=execution.get("completed_at"),
+        result=execution.get("result"),
+        error_message=execution.get("error_message"),
+    )
@@ -6,6 +6,7 @@ import ssl
 from fastapi import APIRouter, HTTPException, Depends
 from typing import Dict, Any
 from pydantic import BaseModel
+from src.core.agents.gateway import CircuitOpenError
 from src.services.review_service import ReviewService
 from src.api.dependencies import get_review_service
 
@@ -31,7 +32,7 @@ async def analyze_logs(
 ):
     """Анализ логов PostgreSQL."""
     try:
-        result = service.analyze_logs(
+        result = await service.aanalyze_logs(
             {
                 "logs": request.logs,
                 "server_info": request.server_info,
@@ -46,6 +47,12 @@ async def analyze_logs(
             analysis_summary=result.get("analysis_summary", {}),
         )
 
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
     except ssl.SSLError as e:
         raise HTTPException(
             status_code=503,
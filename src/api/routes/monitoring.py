@@ -8,21 +8,19 @@ from src.api.schemas import (
     TaskExecution,
     ConnectionStatus,
 )
-from src.services.database_service import database_service
-from src.services.vault_service import VaultService
+from src.services.database_service import get_database_service
+from src.services.vault_service import get_vault_service
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/monitoring", tags=["monitoring"])
 
-vault_service = VaultService()
-
 
 @router.get("/tasks/executions", response_model=List[TaskExecution])
 async def get_task_executions(task_id: Optional[int] = None, limit: int = 50):
     """Получить историю выполнения задач."""
     try:
-        executions = database_service.get_task_executions(task_id, limit)
+        executions = get_database_service().get_task_executions(task_id, limit)
         return executions
     except Exception as e:
         logger.error(f"Error getting task executions: {e}")
@@ -36,13 +34,13 @@ async def get_task_executions(task_id: Optional[int] = None, limit: int = 50):
 async def get_task_executions_by_id(task_id: int, limit: int = 20):
     """Получить историю выполнения конкретной задачи."""
     try:
-        task = database_service.get_task_by_id(task_id)
+        task = get_database_service().get_task_by_id(task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Task not found"
             )
 
-        executions = database_service.get_task_executions(task_id, limit)
+        executions = get_database_service().get_task_executions(task_id, limit)
         return executions
     except HTTPException:
         raise
@@ -58,15 +56,15 @@ async def get_task_executions_by_id(task_id: int, limit: int = 20):
 async def execute_task_manually(task_id: int):
     """Запустить задачу вручную."""
     try:
-        task = database_service.get_task_by_id(task_id)
+        task = get_database_service().get_task_by_id(task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Task not found"
             )
 
-        execution = database_service.create_task_execution(task_id)
+        execution = get_database_service().create_task_execution(task_id)
 
-        task = database_service.get_task_by_id(task_id)
+        task = get_database_service().get_task_by_id(task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена"
@@ -95,7 +93,7 @@ async def execute_task_manually(task_id: int):
             await scheduler.close()
 
         except Exception as task_error:
-            database_service.update_task_execution(
+            get_database_service().update_task_execution(
                 execution["id"], "failed", error_message=str(task_error)
             )
             raise
@@ -119,7 +117,7 @@ async def execute_task_manually(task_id: int):
 async def get_connections_status():
     """Получить статус всех подключений."""
     try:
-        statuses = database_service.get_connection_status()
+        statuses = get_database_service().get_connection_status()
         return statuses
     except Exception as e:
         logger.error(f"Error getting connection statuses: {e}")
@@ -133,16 +131,16 @@ async def get_connections_status():
 async def get_connection_status(connection_id: int):
     """Получить статус конкретного подключения."""
     try:
-        connection = database_service.get_connection_by_id(connection_id)
+        connection = get_database_service().get_connection_by_id(connection_id)
         if not connection:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Connection not found"
             )
 
-        statuses = database_service.get_connection_status(connection_id)
+        statuses = get_database_service().get_connection_status(connection_id)
         if not statuses:
             await check_connection_health(connection_id)
-            statuses = database_service.get_connection_status(connection_id)
+            statuses = get_database_service().get_connection_status(connection_id)
 
         return statuses[0] if statuses else None
     except HTTPException:
@@ -159,15 +157,15 @@ async def get_connection_status(connection_id: int):
 async def check_connection_health(connection_id: int):
     """Проверить состояние подключения к БД."""
     try:
-        connection = database_service.get_connection_by_id(connection_id)
+        connection = get_database_service().get_connection_by_id(connection_id)
         if not connection:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Connection not found"
             )
 
-        credentials = vault_service.get_credentials(connection["vault_path"])
+        credentials = get_vault_service().get_credentials(connection["vault_path"])
         if not credentials:
-            database_service.update_connection_status(
+            get_database_service().update_connection_status(
                 connection_id, False, "Failed to get credentials from Vault"
             )
             raise HTTPException(
@@ -197,7 +195,7 @@ async def check_connection_health(connection_id: int):
 
             response_time = int((time.time() - start_time) * 1000)
 
-            database_service.update_connection_status(
+            get_database_service().update_connection_status(
                 connection_id, True, None, response_time, server_version
             )
 
@@ -212,7 +210,7 @@ async def check_connection_health(connection_id: int):
             response_time = int((time.time() - start_time) * 1000)
             error_message = str(db_error)
 
-            database_service.update_connection_status(
+            get_database_service().update_connection_status(
                 connection_id, False, error_message, response_time
             )
 
@@ -227,7 +225,7 @@ async def check_connection_health(connection_id: int):
         raise
     except Exception as e:
         logger.error(f"Error checking connection {connection_id}: {e}")
-        database_service.update_connection_status(connection_id, False, str(e))
+        get_database_service().update_connection_status(connection_id, False, str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error checking connection: {str(e)}",
@@ -245,7 +243,7 @@ async def get_running_tasks():
             WHERE te.status = 'running'
             ORDER BY te.started_at DESC
         """
-        running_tasks = database_service.execute_query(query)
+        running_tasks = get_database_service().execute_query(query)
         return running_tasks
     except Exception as e:
         logger.error(f"Error getting running tasks: {e}")
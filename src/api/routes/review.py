@@ -1,14 +1,21 @@
+import asyncio
+import json
 import uuid
 import ssl
 import logging
+from typing import Any, AsyncIterator, Dict, List
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 
 from src.api.schemas import (
     ReviewRequest,
     BatchReviewRequest,
     BatchReviewResponse,
 )
+from src.core.config import settings
+from src.core.agents.gateway import CircuitOpenError
 from src.core.constants import SCORE_THRESHOLD_PASS
+from src.core.utils.sql_fingerprint import fingerprint_sql, normalize_sql
 from src.services.review_service import ReviewService
 from src.api.dependencies import get_review_service
 
@@ -25,9 +32,9 @@ async def review_sql(
         thread_id = request.thread_id or str(uuid.uuid4())
         environment = request.environment or "test"
 
-        logger.info(f"Starting SQL review for thread_id: {thread_id}")
+        logger.info("Starting SQL review for thread_id: %s", thread_id)
 
-        result = service.review(
+        result = await service.areview(
             {
                 "sql": request.sql,
                 "query_plan": request.query_plan,
@@ -35,10 +42,11 @@ async def review_sql(
                 "server_info": request.server_info,
                 "thread_id": thread_id,
                 "environment": environment,
+                "fast_mode": request.fast_mode,
             }
         )
 
-        logger.info(f"Review result type: {type(result)}, result: {result}")
+        logger.debug("Review result: %s", result)
 
         if not isinstance(result, dict):
             logger.error(f"Expected dict result, got {type(result)}: {result}")
@@ -49,8 +57,15 @@ async def review_sql(
             }
 
         result["thread_id"] = thread_id
+        result["query_fingerprint"] = fingerprint_sql(request.sql).fingerprint
         return result
 
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
     except ssl.SSLError as e:
         logger.error(f"SSL Error in SQL review: {e}", exc_info=True)
         raise HTTPException(
@@ -61,54 +76,219 @@ async def review_sql(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse_event(event: str, data: Any) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@router.post("/stream")
+async def review_sql_stream(
+    request: ReviewRequest, service: ReviewService = Depends(get_review_service)
+):
+    """Проверка SQL-запроса с потоковой отдачей этапов анализа (SSE).
+
+    События: rules_retrieved, prompt_composed, token (фрагменты ответа LLM),
+    result (итоговый результат) или error.
+    """
+    thread_id = request.thread_id or str(uuid.uuid4())
+    payload = {
+        "sql": request.sql,
+        "query_plan": request.query_plan,
+        "tables": request.tables,
+        "server_info": request.server_info,
+        "thread_id": thread_id,
+        "environment": request.environment or "test",
+        "fast_mode": request.fast_mode,
+    }
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in service.astream_review(payload):
+                data = event.get("data")
+                if event["event"] == "result":
+                    data = dict(data or {})
+                    data["thread_id"] = thread_id
+                    data["query_fingerprint"] = fingerprint_sql(request.sql).fingerprint
+                yield _sse_event(event["event"], data)
+        except CircuitOpenError as e:
+            yield _sse_event(
+                "error",
+                {
+                    "thread_id": thread_id,
+                    "detail": str(e),
+                    "retry_after": int(e.retry_after),
+                },
+            )
+        except Exception as e:
+            logger.error(f"Error in streaming SQL review: {e}", exc_info=True)
+            yield _sse_event("error", {"thread_id": thread_id, "detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _batch_payload(
+    query: ReviewRequest, thread_id: str, environment: str
+) -> Dict[str, Any]:
+    return {
+        "sql": query.sql,
+        "query_plan": query.query_plan,
+        "tables": query.tables,
+        "server_info": query.server_info,
+        "thread_id": thread_id,
+        "environment": environment,
+        "fast_mode": query.fast_mode,
+    }
+
+
+def _batch_item_result(result: Any, thread_id: str) -> Dict[str, Any]:
+    """Привести результат элемента пакета (или его ошибку) к формату ответа."""
+    if isinstance(result, Exception):
+        return {
+            "thread_id": thread_id,
+            "failed": True,
+            "error": str(result),
+            "errors": [],
+            "overall_score": 0,
+        }
+
+    if not isinstance(result, dict):
+        logger.error(f"Expected dict result in batch, got {type(result)}: {result}")
+        result = {
+            "errors": [],
+            "overall_score": 70,
+            "notes": f"Review completed, result: {str(result)}",
+        }
+
+    result = dict(result)
+    result["thread_id"] = thread_id
+    return result
+
+
+async def _review_batch_item(
+    service: ReviewService,
+    semaphore: asyncio.Semaphore,
+    query: ReviewRequest,
+    environment: str,
+) -> Dict[str, Any]:
+    """Проверить один запрос пакета, не прерывая весь пакет при ошибке."""
+    thread_id = query.thread_id or str(uuid.uuid4())
+
+    async with semaphore:
+        try:
+            result = await service.areview(
+                _batch_payload(query, thread_id, environment)
+            )
+        except Exception as e:
+            logger.error(f"Error in batch item review: {e}", exc_info=True)
+            result = e
+
+    return _batch_item_result(result, thread_id)
+
+
+async def _review_batch_packed(
+    service: ReviewService, queries: List[ReviewRequest], environment: str
+) -> List[Dict[str, Any]]:
+    """Проверить запросы пакета с упаковкой небольших в общие вызовы LLM."""
+    thread_ids = [q.thread_id or str(uuid.uuid4()) for q in queries]
+    try:
+        results = await service.areview_packed(
+            [
+                _batch_payload(query, thread_id, environment)
+                for query, thread_id in zip(queries, thread_ids)
+            ],
+            environment,
+        )
+    except Exception as e:
+        logger.error(f"Error in packed batch review: {e}", exc_info=True)
+        results = [e] * len(queries)
+
+    return [
+        _batch_item_result(result, thread_id)
+        for result, thread_id in zip(results, thread_ids)
+    ]
+
+
+def _batch_dedup_key(query: ReviewRequest) -> str:
+    """Ключ дедупликации: отпечаток запроса и контекст, влияющий на ревью."""
+    return json.dumps(
+        [
+            normalize_sql(query.sql, keep_like_shape=True),
+            (query.query_plan or "").strip(),
+            query.tables or [],
+            query.server_info or {},
+            query.fast_mode,
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+
+
 @router.post("/batch", response_model=BatchReviewResponse)
 async def review_batch(
     request: BatchReviewRequest, service: ReviewService = Depends(get_review_service)
 ):
-    """Проверка нескольких SQL-запросов в пакетном режиме."""
+    """Проверка нескольких SQL-запросов в пакетном режиме.
+
+    Запросы, отличающиеся только литералами, пробелами и комментариями,
+    проверяются один раз. При pack=true небольшие запросы с похожими правилами
+    проверяются общим вызовом LLM. Уникальные запросы проверяются параллельно (не более
+    settings.review_batch_concurrency одновременно), порядок результатов
+    совпадает с порядком запросов.
+    """
     try:
-        results = []
-        total_score = 0
+        semaphore = asyncio.Semaphore(max(1, settings.review_batch_concurrency))
 
+        unique: Dict[str, ReviewRequest] = {}
+        keys = []
         for query in request.queries:
-            thread_id = query.thread_id or str(uuid.uuid4())
-            result = service.review(
-                {
-                    "sql": query.sql,
-                    "query_plan": query.query_plan,
-                    "tables": query.tables,
-                    "server_info": query.server_info,
-                    "thread_id": thread_id,
-                    "environment": request.environment,
-                }
-            )
+            key = _batch_dedup_key(query)
+            unique.setdefault(key, query)
+            keys.append(key)
 
-            if not isinstance(result, dict):
-                logger.error(
-                    f"Expected dict result in batch, got {type(result)}: {result}"
+        if len(unique) < len(keys):
+            logger.info("Пакет: %d запросов, уникальных %d", len(keys), len(unique))
+
+        if request.pack:
+            reviewed = await _review_batch_packed(
+                service, list(unique.values()), request.environment
+            )
+        else:
+            reviewed = await asyncio.gather(
+                *(
+                    _review_batch_item(service, semaphore, query, request.environment)
+                    for query in unique.values()
                 )
-                result = {
-                    "errors": [],
-                    "overall_score": 70,
-                    "notes": f"Review completed, result: {str(result)}",
-                }
+            )
+        by_key = dict(zip(unique.keys(), reviewed))
 
-            result["thread_id"] = thread_id
+        results = []
+        for query, key in zip(request.queries, keys):
+            result = dict(by_key[key])
+            if unique[key] is not query:
+                result["thread_id"] = query.thread_id or str(uuid.uuid4())
+                result["duplicate_of"] = by_key[key]["thread_id"]
+            result["query_fingerprint"] = fingerprint_sql(query.sql).fingerprint
             results.append(result)
-            total_score += result.get("overall_score", 0)
 
-        overall_score = total_score / len(results) if results else 0
-        passed = overall_score >= SCORE_THRESHOLD_PASS
+        succeeded = [r for r in results if not r.get("failed")]
+        failed_count = len(results) - len(succeeded)
+        total_score = sum(r.get("overall_score", 0) for r in succeeded)
+
+        overall_score = total_score / len(succeeded) if succeeded else 0
+        passed = failed_count == 0 and overall_score >= SCORE_THRESHOLD_PASS
 
         return BatchReviewResponse(
-            results=results, overall_score=overall_score, passed=passed
+            results=results,
+            overall_score=overall_score,
+            passed=passed,
+            failed_count=failed_count,
         )
 
-    except ssl.SSLError as e:
-        logger.error(f"SSL Error in batch review: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка SSL соединения при пакетном анализе SQL: {str(e)}",
-        )
     except Exception as e:
+        logger.error(f"Error in batch review: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
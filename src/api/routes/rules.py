@@ -3,7 +3,7 @@ from typing import List, Optional
 from pathlib import Path
 import logging
 from src.api.schemas import IngestRequest
-from src.kb.ingest import ingest_rules
+from src.services.review_service import get_shared_review_service
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -38,8 +38,15 @@ class RuleUpdate(BaseModel):
 async def ingest_rules_endpoint(request: IngestRequest):
     """Загрузка правил из директории."""
     try:
-        ingest_rules(request.rules_dir)
-        return {"message": "Rules ingested successfully"}
+        from src.kb.ingest import ingest_rules
+
+        stats = ingest_rules(request.rules_dir, request.rule_type, request.full_rebuild)
+
+        service = get_shared_review_service()
+        if service is not None:
+            service.reload_rules(request.rule_type)
+
+        return {"message": "Rules ingested successfully", "stats": stats}
     except Exception as e:
         logger.error(f"Error ingesting rules: {e}")
         raise HTTPException(status_code=500, detail=str(e))
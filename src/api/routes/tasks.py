@@ -2,8 +2,8 @@ from fastapi import APIRouter, HTTPException, status
 from typing import List, Dict, Any
 import logging
 from src.api.schemas import TaskCreate, TaskResponse, TaskUpdate
-from src.services.scheduler_service import SchedulerService
-from src.services.database_service import DatabaseService
+from src.services.scheduler_service import get_scheduler_service
+from src.services.database_service import get_database_service
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +11,10 @@ router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 TASK_NOT_FOUND = "Задача не найдена"
 
-database_service = DatabaseService()
-scheduler_service = SchedulerService()
-
 
 def get_task_or_404(task_id: int) -> Dict[str, Any]:
     """Получить задачу по ID или вызвать HTTPException."""
-    task = database_service.get_task_by_id(task_id)
+    task = get_database_service().get_task_by_id(task_id)
     if not task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=TASK_NOT_FOUND
@@ -38,7 +35,7 @@ async def create_task(task_data: TaskCreate):
             "is_active": task_data.is_active,
         }
 
-        task = database_service.create_task(task_dict)
+        task = get_database_service().create_task(task_dict)
 
         queue_task = {
             "task_id": task["id"],
@@ -46,7 +43,7 @@ async def create_task(task_data: TaskCreate):
             "connection_id": task_data.connection_id,
             "parameters": task_data.parameters,
         }
-        scheduler_service.add_task_to_queue(queue_task)
+        get_scheduler_service().add_task_to_queue(queue_task)
 
         logger.info(f"Создана новая задача: {task['name']}")
         return TaskResponse(**task)
@@ -63,7 +60,7 @@ async def create_task(task_data: TaskCreate):
 async def get_tasks():
     """Получить список всех задач."""
     try:
-        tasks = database_service.get_tasks()
+        tasks = get_database_service().get_tasks()
         return [TaskResponse(**task) for task in tasks]
     except Exception as e:
         logger.error(f"Ошибка получения задач: {e}")
@@ -96,7 +93,7 @@ async def update_task(task_id: int, task_data: TaskUpdate):
         get_task_or_404(task_id)
 
         update_data = task_data.dict(exclude_unset=True)
-        updated_task = database_service.update_task(task_id, update_data)
+        updated_task = get_database_service().update_task(task_id, update_data)
 
         logger.info(f"Обновлена задача: {updated_task['name']}")
         return TaskResponse(**updated_task)
@@ -119,7 +116,7 @@ async def delete_task(task_id: int):
 
         task_name = existing_task["name"]
 
-        success = database_service.delete_task(task_id)
+        success = get_database_service().delete_task(task_id)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -151,9 +148,9 @@ async def run_task_now(task_id: int):
             "connection_id": task["connection_id"],
             "parameters": task["parameters"],
         }
-        scheduler_service.add_task_to_queue(queue_task)
+        get_scheduler_service().add_task_to_queue(queue_task)
 
-        database_service.update_task_last_run(task_id)
+        get_database_service().update_task_last_run(task_id)
 
         logger.info(f"Задача {task_id} добавлена в очередь для немедленного выполнения")
         return {"message": "Задача добавлена в очередь"}
@@ -61,6 +61,7 @@ class ReviewRequest(BaseModel):
     server_info: Dict[str, str]
     thread_id: Optional[str] = None
     environment: Optional[str] = None
+    fast_mode: bool = False
 
     @validator("environment")
     def validate_environment(cls, v):
@@ -87,6 +88,7 @@ class BatchReviewRequest(BaseModel):
 
     queries: List[ReviewRequest]
     environment: str = "test"
+    pack: bool = False
 
     @validator("environment")
     def validate_environment(cls, v):
@@ -104,12 +106,15 @@ class BatchReviewResponse(BaseModel):
     results: List[Dict[str, Any]]
     overall_score: float
     passed: bool
+    failed_count: int = 0
 
 
 class IngestRequest(BaseModel):
     """Модель запроса для загрузки правил."""
 
     rules_dir: str
+    rule_type: str = "sql"
+    full_rebuild: bool = False
 
 
 class ReviewResponse(BaseModel):
@@ -2,64 +2,90 @@
 Базовые классы и интерфейсы агентов
 """
 
+import hashlib
+import json
+import logging
 import ssl
+import threading
+import time
 import requests
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional
 from langchain_gigachat import GigaChat
-from langsmith import Client
-from langfuse import get_client
+from src.core.config import settings
+from src.core.agents.fake_llm import FakeChatModel
+from src.core.agents.gateway import LLMGateway
+from src.core.agents.router import ROUTE_DEFAULT, Route, RouteMetrics
+from src.core.prompt_budget import count_tokens
+from src.core.utils.singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
 
 
 class BaseAgent(ABC):
     """Базовый класс для агентов."""
 
     def __init__(self, api_key: str, model_name: str = "GigaChat"):
-        if not api_key:
-            raise ValueError("API key is required")
+        if settings.llm_backend == "fake":
+            # Локальная заглушка: ключ API и тестовый запрос не нужны
+            self.model = FakeChatModel()
+            self.model_name = self.model.model
+        else:
+            if not api_key:
+                raise ValueError("API key is required")
+            self.model = self._create_gigachat(api_key, model_name)
+            self.model_name = model_name
+        self._api_key = api_key
+
+    def _create_model(self, model_name: str):
+        """Создать дополнительную модель (для маршрутизации запросов)."""
+        if settings.llm_backend == "fake":
+            return FakeChatModel(model=model_name)
+        return self._create_gigachat(self._api_key, model_name)
 
+    @staticmethod
+    def _create_gigachat(api_key: str, model_name: str) -> GigaChat:
         # Сначала пробуем с включенной проверкой SSL
         try:
-            self.model = GigaChat(
+            model = GigaChat(
                 model=model_name,
                 credentials=api_key,
                 verify_ssl_certs=True,
                 profanity_check=False,
                 streaming=False,
                 max_tokens=2048,
-                timeout=300,
+                timeout=settings.llm_timeout,
             )
             # Проверяем соединение простым запросом
             test_messages = [{"role": "user", "content": "test"}]
-            self.model.invoke(test_messages)
+            model.invoke(test_messages)
             print("GigaChat initialized with SSL verification enabled")
         except (ssl.SSLError, requests.exceptions.SSLError) as e:
             print(f"SSL verification failed: {e}")
             print("Initializing GigaChat with SSL verification disabled...")
-            self.model = GigaChat(
+            model = GigaChat(
                 model=model_name,
                 credentials=api_key,
                 verify_ssl_certs=False,
                 profanity_check=False,
                 streaming=False,
                 max_tokens=2048,
-                timeout=300,
+                timeout=settings.llm_timeout,
             )
             print("GigaChat initialized with SSL verification disabled")
         except Exception as e:
             print(f"Failed to initialize GigaChat: {e}")
             # Последняя попытка с отключенной проверкой SSL
-            self.model = GigaChat(
+            model = GigaChat(
                 model=model_name,
                 credentials=api_key,
                 verify_ssl_certs=False,
                 profanity_check=False,
                 streaming=False,
                 max_tokens=2048,
-                timeout=300,
+                timeout=settings.llm_timeout,
             )
-        self.langsmith_client = Client()
-        self.langfuse_client = get_client()
+        return model
 
     @abstractmethod
     def review(
@@ -85,33 +111,139 @@ class BaseAgent(ABC):
 class LLMService:
     """Сервис для операций с LLM."""
 
-    def __init__(self, model: GigaChat):
+    def __init__(
+        self,
+        model: GigaChat,
+        model_name: str = None,
+        model_factory: Callable[[str], Any] = None,
+    ):
         self.model = model
+        self.model_name = model_name or getattr(model, "model", None) or "GigaChat"
+        # Прочие модели маршрутизатора создаются при первом обращении
+        self._models = {self.model_name: model}
+        self._model_factory = model_factory
+        self._models_lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._aflight = AsyncSingleFlight()
+        self.gateway = LLMGateway()
+        self.routes = RouteMetrics()
+
+    def _get_model(self, model_name: Optional[str] = None):
+        name = model_name or self.model_name
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if self._model_factory is None:
+            raise ValueError(f"Модель {name} не настроена")
+        with self._models_lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self._models[name] = self._model_factory(name)
+        return model
+
+    def _flight_key(self, messages: List, model_name: Optional[str] = None) -> str:
+        """Ключ single-flight: хэш модели и содержимого сообщений."""
+        parts = [model_name or self.model_name]
+        for m in messages:
+            if isinstance(m, dict):
+                parts.append([m.get("role"), m.get("content")])
+            else:
+                parts.append([getattr(m, "type", ""), getattr(m, "content", "")])
+        raw = json.dumps(parts, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _route(self, route: Optional[Route]) -> Route:
+        if route is not None:
+            return route
+        return Route(ROUTE_DEFAULT, self.model_name)
+
+    def _record(self, route: Route, started: float, response: str = None):
+        self.routes.record(
+            route,
+            time.monotonic() - started,
+            count_tokens(response) if response is not None else 0,
+            failed=response is None,
+        )
+
+    def invoke_with_messages(self, messages: List, route: Route = None) -> str:
+        """Invoke LLM with messages.
+
+        Одновременные вызовы с одинаковыми сообщениями выполняются один раз
+        и занимают один слот шлюза. route — модель, выбранная ModelRouter.
+        """
+        route = self._route(route)
+        leader = False
+
+        def call():
+            nonlocal leader
+            leader = True
+            started, response = time.monotonic(), None
+            try:
+                response = self.gateway.call(
+                    lambda: self._invoke(messages, route.model_name)
+                )
+                return response
+            finally:
+                self._record(route, started, response)
+
+        try:
+            if not settings.llm_singleflight_enabled:
+                return call()
+            return self._flight.do(self._flight_key(messages, route.model_name), call)
+        finally:
+            # Вызов модели учитывает только лидер, ожидающие считаются отдельно
+            if not leader:
+                self.routes.record_shared(route)
+
+    async def ainvoke_with_messages(self, messages: List, route: Route = None) -> str:
+        """Асинхронный вызов LLM, не блокирующий цикл событий."""
+        route = self._route(route)
+        leader = False
+
+        async def call():
+            nonlocal leader
+            leader = True
+            started, response = time.monotonic(), None
+            try:
+                response = await self.gateway.acall(
+                    lambda: self._ainvoke(messages, route.model_name)
+                )
+                return response
+            finally:
+                self._record(route, started, response)
+
+        try:
+            if not settings.llm_singleflight_enabled:
+                return await call()
+            return await self._aflight.do(
+                self._flight_key(messages, route.model_name), call
+            )
+        finally:
+            if not leader:
+                self.routes.record_shared(route)
+
+    def stats(self) -> Dict[str, Any]:
+        sync_stats = self._flight.counters.stats()
+        async_stats = self._aflight.counters.stats()
+        return {
+            "model": self.model_name,
+            "calls": sync_stats["calls"] + async_stats["calls"],
+            "coalesced": sync_stats["shared"] + async_stats["shared"],
+            "gateway": self.gateway.stats(),
+            "routes": self.routes.stats(),
+        }
 
-    def invoke_with_messages(self, messages: List) -> str:
-        """Invoke LLM with messages."""
+    def _invoke(self, messages: List, model_name: Optional[str] = None) -> str:
         try:
-            response = self.model.invoke(messages)
+            response = self._get_model(model_name).invoke(messages)
             return response.content
         except (ssl.SSLError, requests.exceptions.SSLError) as e:
             print(f"SSL Error during invocation: {e}")
             print("Recreating model with SSL verification disabled...")
 
-            # Пересоздаем модель без проверки SSL
             try:
-                old_model_name = getattr(self.model, "model_name", "GigaChat")
-                old_credentials = getattr(self.model, "credentials", None)
-
-                self.model = GigaChat(
-                    model=old_model_name,
-                    credentials=old_credentials,
-                    verify_ssl_certs=False,
-                    profanity_check=False,
-                    streaming=False,
-                    max_tokens=2048,
-                    timeout=300,
-                )
-                response = self.model.invoke(messages)
+                model = self._recreate_model_without_ssl(model_name)
+                response = model.invoke(messages)
                 return response.content
             except Exception as retry_error:
                 print(f"Retry with disabled SSL also failed: {retry_error}")
@@ -122,6 +254,89 @@ class LLMService:
             print(f"Unexpected error in LLM service: {e}")
             raise
 
+    async def _ainvoke(self, messages: List, model_name: Optional[str] = None) -> str:
+        try:
+            response = await self._get_model(model_name).ainvoke(messages)
+            return response.content
+        except (ssl.SSLError, requests.exceptions.SSLError) as e:
+            logger.warning(
+                "Ошибка SSL при асинхронном вызове LLM, модель пересоздается без "
+                "проверки SSL: %s",
+                e,
+            )
+            try:
+                model = self._recreate_model_without_ssl(model_name)
+                response = await model.ainvoke(messages)
+                return response.content
+            except Exception as retry_error:
+                logger.warning(
+                    "Повторный вызов LLM без проверки SSL не удался: %s", retry_error
+                )
+                raise ssl.SSLError(
+                    f"SSL connection failed even with disabled verification: {e}"
+                ) from e
+        except Exception:
+            logger.warning("Ошибка асинхронного вызова LLM", exc_info=True)
+            raise
+
+    async def astream_with_messages(
+        self, messages: List, route: Route = None
+    ) -> AsyncIterator[str]:
+        """Потоковый вызов LLM: фрагменты ответа отдаются по мере генерации."""
+        route = self._route(route)
+        model = self._get_model(route.model_name)
+        emitted = False
+        parts: List[str] = []
+        started, response = time.monotonic(), None
+        try:
+            # Поток занимает слот шлюза целиком; повторов нет, ответ уже у клиента
+            async with self.gateway.aslot():
+                try:
+                    async for chunk in model.astream(messages):
+                        if chunk.content:
+                            emitted = True
+                            parts.append(chunk.content)
+                            yield chunk.content
+                except (ssl.SSLError, requests.exceptions.SSLError) as e:
+                    # Повторить можно только пока клиент не получил ни одного фрагмента
+                    if emitted:
+                        raise
+                    logger.warning(
+                        "Ошибка SSL при потоковом вызове LLM, модель пересоздается "
+                        "без проверки SSL: %s",
+                        e,
+                    )
+                    model = self._recreate_model_without_ssl(route.model_name)
+                    async for chunk in model.astream(messages):
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield chunk.content
+            response = "".join(parts)
+        finally:
+            self._record(route, started, response)
+
+    def _recreate_model_without_ssl(self, model_name: Optional[str] = None):
+        """Пересоздать модель без проверки SSL."""
+        name = model_name or self.model_name
+        old_model = self._get_model(name)
+        old_model_name = getattr(old_model, "model_name", None) or name
+        old_credentials = getattr(old_model, "credentials", None)
+
+        model = GigaChat(
+            model=old_model_name,
+            credentials=old_credentials,
+            verify_ssl_certs=False,
+            profanity_check=False,
+            streaming=False,
+            max_tokens=2048,
+            timeout=settings.llm_timeout,
+        )
+        with self._models_lock:
+            self._models[name] = model
+        if name == self.model_name:
+            self.model = model
+        return model
+
     def invoke_with_prompt(self, prompt: str, system_message: str = None) -> str:
         """Invoke LLM with a single prompt."""
         from langchain.schema import HumanMessage, SystemMessage
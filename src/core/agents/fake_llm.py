@@ -0,0 +1,189 @@
+"""
+Локальная детерминированная замена LLM для нагрузочных тестов без сети.
+
+Отвечает заранее заготовленными замечаниями в формате, который ожидают
+workflow (в том числе упакованные промпты с секциями [qN]), с настраиваемой
+задержкой, скоростью генерации токенов и долей искусственных ошибок.
+Замечания выбираются по хэшу промпта, поэтому одинаковый промпт всегда
+получает одинаковый ответ.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.core.config import settings
+from src.core.prompt_budget import count_tokens
+from src.core.scoring import compute_overall_score
+
+_PACKED_ID_RE = re.compile(r"^\[(q\d+)\]\s*$", re.MULTILINE)
+
+_CANNED_FINDINGS = [
+    {
+        "content": "Условие фильтрации не покрыто индексом",
+        "criticality": "high",
+        "recommendation": "Создайте индекс по колонкам из WHERE",
+    },
+    {
+        "content": "Сортировка выполняется без подходящего индекса",
+        "criticality": "medium",
+        "recommendation": "Добавьте индекс, покрывающий ORDER BY",
+    },
+    {
+        "content": "Запрос возвращает больше колонок, чем нужно",
+        "criticality": "low",
+        "recommendation": "Перечислите только нужные колонки",
+    },
+]
+
+
+class FakeLLMError(Exception):
+    """Искусственная ошибка API с HTTP-статусом (для проверки повторов)."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Fake LLM error {status_code}")
+        self.status_code = status_code
+
+
+class FakeChatModel(BaseChatModel):
+    """Детерминированная модель-заглушка с управляемой задержкой и ошибками."""
+
+    model: str = "fake"
+    latency_ms: float = settings.fake_llm_latency_ms
+    # fixed | uniform | lognormal
+    latency_distribution: str = settings.fake_llm_latency_distribution
+    latency_spread: float = settings.fake_llm_latency_spread
+    tokens_per_second: float = settings.fake_llm_tokens_per_second
+    failure_rate: float = settings.fake_llm_failure_rate
+    failure_status: int = settings.fake_llm_failure_status
+    seed: int = settings.fake_llm_seed
+
+    _rng: random.Random = PrivateAttr()
+    _rng_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _latency(self) -> float:
+        """Задержка до первого токена, секунды."""
+        base = self.latency_ms / 1000
+        with self._rng_lock:
+            if self.latency_distribution == "uniform":
+                delay = self._rng.uniform(
+                    base * (1 - self.latency_spread), base * (1 + self.latency_spread)
+                )
+            elif self.latency_distribution == "lognormal":
+                # latency_ms — медиана, latency_spread — sigma
+                delay = base * self._rng.lognormvariate(0, self.latency_spread)
+            else:
+                delay = base
+        return max(0.0, delay)
+
+    def _should_fail(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.failure_rate
+
+    def _generation_time(self, text: str) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return count_tokens(text) / self.tokens_per_second
+
+    @staticmethod
+    def _canned_result(key: str) -> dict:
+        digest = int(hashlib.sha256(key.encode("utf-8")).hexdigest(), 16)
+        count = digest % (len(_CANNED_FINDINGS) + 1)
+        start = digest // 7 % len(_CANNED_FINDINGS)
+        findings = [
+            _CANNED_FINDINGS[(start + i) % len(_CANNED_FINDINGS)] for i in range(count)
+        ]
+        return {
+            "errors": findings,
+            "overall_score": round(compute_overall_score(findings)),
+            "notes": "Ответ локальной модели-заглушки",
+        }
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = str(messages[-1].content) if messages else ""
+        ids = _PACKED_ID_RE.findall(prompt)
+        if ids:
+            blocks = re.split(r"^\[q\d+\]\s*$", prompt, flags=re.MULTILINE)[1:]
+            return json.dumps(
+                {id_: self._canned_result(block) for id_, block in zip(ids, blocks)},
+                ensure_ascii=False,
+            )
+        return json.dumps(self._canned_result(prompt), ensure_ascii=False)
+
+    def _chunks(self, text: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self._latency())
+        if self._should_fail():
+            raise FakeLLMError(self.failure_status)
+        text = self._respond(messages)
+        time.sleep(self._generation_time(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self._latency())
+        if self._should_fail():
+            raise FakeLLMError(self.failure_status)
+        text = self._respond(messages)
+        await asyncio.sleep(self._generation_time(text))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._latency())
+        if self._should_fail():
+            raise FakeLLMError(self.failure_status)
+        for chunk in self._chunks(self._respond(messages)):
+            time.sleep(self._generation_time(chunk))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._latency())
+        if self._should_fail():
+            raise FakeLLMError(self.failure_status)
+        for chunk in self._chunks(self._respond(messages)):
+            await asyncio.sleep(self._generation_time(chunk))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
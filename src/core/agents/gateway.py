@@ -0,0 +1,475 @@
+"""
+Шлюз вызовов LLM: адаптивное ограничение параллельности, повторы и
+автоматический выключатель (circuit breaker).
+
+- Лимит одновременных вызовов подстраивается по схеме AIMD: растет на
+  единицу за «окно» успешных вызовов и уменьшается вдвое при признаках
+  перегрузки (429, 503, таймауты).
+- Временные ошибки повторяются с экспоненциальной задержкой и полным
+  джиттером, но не дольше общего дедлайна вызова.
+- После серии неудачных вызовов выключатель размыкается, и вызовы сразу
+  завершаются ошибкой CircuitOpenError, пока не пройдет пробный вызов.
+- Если задан LLM_CALLS_PER_MINUTE, каждый вызов сначала получает токен из
+  общего для всех реплик бюджета (см. src.core.rate_limit).
+- Отдельно учитываются время ожидания в очереди и время обслуживания.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from src.core.config import settings
+from src.core.rate_limit import get_llm_budget
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD = "overload"
+TRANSIENT = "transient"
+FATAL = "fatal"
+# Вызов прерван (отмена, отключение клиента): о нагрузке LLM ничего не известно
+CANCELLED = "cancelled"
+
+
+class CircuitOpenError(Exception):
+    """LLM временно недоступен: выключатель разомкнут."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            f"LLM временно недоступен, повторите через {retry_after:.0f} с"
+        )
+        self.retry_after = retry_after
+
+
+class LLMQueueTimeout(TimeoutError):
+    """Не удалось дождаться свободного слота до дедлайна."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for candidate in (error, getattr(error, "response", None)):
+        code = getattr(candidate, "status_code", None)
+        if isinstance(code, int):
+            return code
+    # gigachat.exceptions.ResponseError(url, status_code, content, headers)
+    args = getattr(error, "args", ())
+    if len(args) >= 2 and isinstance(args[1], int):
+        return args[1]
+    return None
+
+
+def classify_error(error: Exception) -> str:
+    """Отнести ошибку к перегрузке, временной или неисправимой."""
+    status = _status_code(error)
+    if status is not None:
+        if status in (429, 503):
+            return OVERLOAD
+        if status >= 500 or status == 408:
+            return TRANSIENT
+        return FATAL
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return OVERLOAD
+    if isinstance(error, (ConnectionError, OSError)):
+        return TRANSIENT
+    name = type(error).__name__
+    if "Timeout" in name:
+        return OVERLOAD
+    if "Connect" in name or "Transport" in name or "Network" in name:
+        return TRANSIENT
+    return FATAL
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AIMDLimiter:
+    """Адаптивный лимит параллельных вызовов, общий для потоков и корутин."""
+
+    def __init__(
+        self,
+        initial: int = settings.llm_concurrency_initial,
+        min_limit: int = settings.llm_concurrency_min,
+        max_limit: int = settings.llm_concurrency_max,
+        backoff_ratio: float = 0.5,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = deque()
+
+    def _try_acquire(self) -> bool:
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return True
+        return False
+
+    def _wake_waiters(self):
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.inflight += 1
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter, keep: bool) -> bool:
+        """Ожидающий ушел из очереди; вернуть, остался ли у него слот.
+
+        Слот мог быть выдан одновременно с таймаутом: при keep он остается
+        вызывающему, иначе возвращается в лимитер.
+        """
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return False
+            if keep:
+                return True
+            self.inflight -= 1
+            self._wake_waiters()
+            return False
+
+    def acquire(self, timeout: float):
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        if not waiter.event.wait(timeout) and not self._abandon(waiter, keep=True):
+            raise LLMQueueTimeout("Истекло время ожидания свободного слота LLM")
+
+    async def aacquire(self, timeout: float):
+        with self._lock:
+            if self._try_acquire():
+                return
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter, keep=False)
+            raise
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter, keep=True):
+                raise LLMQueueTimeout("Истекло время ожидания свободного слота LLM")
+
+    def release(self, outcome: str):
+        with self._lock:
+            self.inflight -= 1
+            if outcome == OVERLOAD:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            elif outcome == "success":
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake_waiters()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "waiting": len(self._waiters),
+            }
+
+
+class CircuitBreaker:
+    """Выключатель: closed -> open после серии ошибок -> half_open -> closed."""
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.llm_breaker_failure_threshold,
+        reset_timeout: float = settings.llm_breaker_reset_timeout,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Пропустить вызов или сразу отказать, если выключатель разомкнут.
+
+        Возвращает True, если вызов пробный.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == "open" and elapsed >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            raise CircuitOpenError(max(1.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Выключатель LLM замкнут: вызовы восстановлены")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        "Выключатель LLM разомкнут после %d ошибок", self.failures
+                    )
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Пробный вызов завершился без вердикта (например, ошибкой клиента)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class _Timings:
+    def __init__(self, size: int = 512):
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": count,
+            "avg_ms": round(total / count * 1000, 1),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+            "p95_ms": round(samples[int((len(samples) - 1) * 0.95)] * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+
+
+class LLMGateway:
+    """Обертка вызовов LLM с ограничением, повторами и выключателем."""
+
+    def __init__(self):
+        self.limiter = AIMDLimiter()
+        self.breaker = CircuitBreaker()
+        self.queue_wait = _Timings()
+        self.service_time = _Timings()
+        self._lock = threading.Lock()
+        self._counters = {
+            "retries": 0,
+            "failures": 0,
+            "rejected": 0,
+            "budget_waits": 0,
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        cap = settings.llm_retry_max_delay
+        return random.uniform(0, min(cap, settings.llm_retry_base_delay * 2**attempt))
+
+    def _check_breaker(self) -> bool:
+        try:
+            return self.breaker.check()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+
+    def _finish(
+        self, error: Optional[BaseException], started: float, probe: bool
+    ) -> str:
+        """Учесть результат попытки; вернуть ее исход."""
+        self.service_time.add(time.monotonic() - started)
+        if error is None:
+            self.breaker.record_success()
+            return "success"
+        if not isinstance(error, Exception):
+            # Отмена не говорит о состоянии LLM: пробу нужно отпустить
+            if probe:
+                self.breaker.release_probe()
+            return CANCELLED
+        outcome = classify_error(error)
+        if outcome == FATAL:
+            if probe:
+                self.breaker.release_probe()
+        else:
+            self.breaker.record_failure()
+            self._count("failures")
+        return outcome
+
+    def _budget_delay(
+        self, allowed: bool, retry_after: float, deadline: float
+    ) -> Optional[float]:
+        """Сколько ждать токена общего бюджета (None — токен получен).
+
+        LLMQueueTimeout, если токена не дождаться до дедлайна.
+        """
+        if allowed:
+            return None
+        if time.monotonic() + retry_after >= deadline:
+            raise LLMQueueTimeout("Исчерпан общий бюджет вызовов LLM")
+        self._count("budget_waits")
+        return retry_after
+
+    def _take_budget(self, deadline: float):
+        budget = get_llm_budget()
+        while budget is not None:
+            delay = self._budget_delay(*budget.consume("calls"), deadline)
+            if delay is None:
+                return
+            time.sleep(delay)
+
+    async def _atake_budget(self, deadline: float):
+        budget = get_llm_budget()
+        while budget is not None:
+            delay = self._budget_delay(*await budget.aconsume("calls"), deadline)
+            if delay is None:
+                return
+            await asyncio.sleep(delay)
+
+    @contextmanager
+    def _slot(self, deadline: float):
+        probe = self._check_breaker()
+        queued = time.monotonic()
+        try:
+            self._take_budget(deadline)
+            self.limiter.acquire(max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        started = time.monotonic()
+        self.queue_wait.add(started - queued)
+        outcome = CANCELLED
+        try:
+            yield
+        except BaseException as e:
+            # В том числе CancelledError и GeneratorExit при отключении клиента
+            outcome = self._finish(e, started, probe)
+            raise
+        else:
+            outcome = self._finish(None, started, probe)
+        finally:
+            self.limiter.release(outcome)
+
+    @asynccontextmanager
+    async def aslot(self, deadline: Optional[float] = None):
+        """Слот для одного асинхронного вызова (без повторов)."""
+        deadline = deadline or time.monotonic() + settings.llm_deadline
+        probe = self._check_breaker()
+        queued = time.monotonic()
+        try:
+            await self._atake_budget(deadline)
+            await self.limiter.aacquire(max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        started = time.monotonic()
+        self.queue_wait.add(started - queued)
+        outcome = CANCELLED
+        try:
+            yield
+        except BaseException as e:
+            # В том числе CancelledError и GeneratorExit при отключении клиента
+            outcome = self._finish(e, started, probe)
+            raise
+        else:
+            outcome = self._finish(None, started, probe)
+        finally:
+            self.limiter.release(outcome)
+
+    def _should_retry(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Задержка перед повтором или -1, если повторять нельзя."""
+        if isinstance(error, (CircuitOpenError, LLMQueueTimeout)):
+            return -1
+        if classify_error(error) == FATAL or attempt >= settings.llm_max_retries:
+            return -1
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return -1
+        self._count("retries")
+        logger.warning(
+            "Ошибка вызова LLM (%s), повтор %d через %.1f с",
+            error,
+            attempt + 1,
+            delay,
+        )
+        return delay
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        deadline = time.monotonic() + settings.llm_deadline
+        attempt = 0
+        while True:
+            try:
+                with self._slot(deadline):
+                    return fn()
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline)
+                if delay < 0:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        deadline = time.monotonic() + settings.llm_deadline
+        attempt = 0
+        while True:
+            try:
+                async with self.aslot(deadline):
+                    remaining = max(0.0, deadline - time.monotonic())
+                    return await asyncio.wait_for(fn(), remaining)
+            except Exception as e:
+                delay = self._should_retry(e, attempt, deadline)
+                if delay < 0:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "limiter": self.limiter.stats(),
+            "breaker": self.breaker.stats(),
+            "queue_wait": self.queue_wait.stats(),
+            "service_time": self.service_time.stats(),
+            **counters,
+        }
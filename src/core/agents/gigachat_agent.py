@@ -2,14 +2,16 @@
 Агент GigaChat для анализа SQL и конфигурации.
 """
 
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 from src.core.agents.base import BaseAgent, LLMService
+from src.core.agents.router import ModelRouter
 from src.core.workflows import (
     SQLReviewWorkflow,
     ConfigAnalysisWorkflow,
     LogsAnalysisWorkflow,
 )
 from src.store.factory import VectorStoreFactory
+from src.core.cache import ReviewResultCache
 from src.core.config import settings
 
 
@@ -19,28 +21,55 @@ class GigaChatAgent(BaseAgent):
     def __init__(self, api_key: str, model_name: str = settings.gigachat_model_name):
         super().__init__(api_key, model_name)
 
-        self.llm_service = LLMService(self.model)
+        self.llm_service = LLMService(
+            self.model, self.model_name, model_factory=self._create_model
+        )
+        self.router = ModelRouter(self.model_name)
 
         self.sql_store = VectorStoreFactory.create("sql")
         self.config_store = VectorStoreFactory.create("config")
         self.logs_store = VectorStoreFactory.create("logs")
 
-        self.sql_workflow = SQLReviewWorkflow(self.llm_service, self.sql_store)
+        self.result_cache = (
+            ReviewResultCache() if settings.review_cache_enabled else None
+        )
+
+        self.sql_workflow = SQLReviewWorkflow(
+            self.llm_service, self.sql_store, self.result_cache, self.router
+        )
         self.config_workflow = ConfigAnalysisWorkflow(
-            self.llm_service, self.config_store
+            self.llm_service, self.config_store, self.result_cache, self.router
+        )
+        self.logs_workflow = LogsAnalysisWorkflow(
+            self.llm_service, self.logs_store, self.result_cache, self.router
         )
-        self.logs_workflow = LogsAnalysisWorkflow(self.llm_service, self.logs_store)
 
-    def review(
+    def reload_rules(self, rule_type: str):
+        """Перечитать индекс правил указанного типа и сбросить кэш результатов."""
+        stores = {
+            "sql": self.sql_store,
+            "config": self.config_store,
+            "logs": self.logs_store,
+        }
+        store = stores.get(rule_type)
+        if store is None:
+            raise ValueError(f"Неизвестный тип правил: {rule_type}")
+
+        store.reload()
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def _sql_initial_state(
         self,
         sql: str,
         query_plan: str,
         tables: List[Dict[str, str]],
         server_info: Dict[str, str],
+        environment: str,
+        fast_mode: bool = False,
         thread_id: str = None,
-        environment: str = "test",
     ) -> Dict[str, Any]:
-        initial_state = {
+        state = {
             "sql": sql,
             "query_plan": query_plan,
             "tables": tables,
@@ -49,19 +78,20 @@ class GigaChatAgent(BaseAgent):
             "prompt": "",
             "response": "",
             "result": {},
-            "chat_history": [],
             "environment": environment,
+            "fast_mode": fast_mode,
+            "static_findings": [],
         }
+        # В явно заданном потоке история берется из checkpoint
+        if not thread_id:
+            state["chat_history"] = []
+            state["chat_summary"] = ""
+        return state
 
-        return self.sql_workflow.execute(initial_state, thread_id)
-
-    def analyze_config(
-        self,
-        config: Dict[str, Any],
-        server_info: Dict[str, str],
-        environment: str = "test",
+    def _config_initial_state(
+        self, config: Dict[str, Any], server_info: Dict[str, str], environment: str
     ) -> Dict[str, Any]:
-        initial_state = {
+        return {
             "config": config,
             "server_info": server_info,
             "retrieved_rules": [],
@@ -71,12 +101,10 @@ class GigaChatAgent(BaseAgent):
             "environment": environment,
         }
 
-        return self.config_workflow.execute(initial_state)
-
-    def analyze_logs(
-        self, logs: str, server_info: Dict[str, str], environment: str = "test"
+    def _logs_initial_state(
+        self, logs: str, server_info: Dict[str, str], environment: str
     ) -> Dict[str, Any]:
-        initial_state = {
+        return {
             "logs": logs,
             "server_info": server_info,
             "prompt": "",
@@ -85,4 +113,101 @@ class GigaChatAgent(BaseAgent):
             "environment": environment,
         }
 
+    def review(
+        self,
+        sql: str,
+        query_plan: str,
+        tables: List[Dict[str, str]],
+        server_info: Dict[str, str],
+        thread_id: str = None,
+        environment: str = "test",
+        fast_mode: bool = False,
+    ) -> Dict[str, Any]:
+        initial_state = self._sql_initial_state(
+            sql, query_plan, tables, server_info, environment, fast_mode, thread_id
+        )
+        return self.sql_workflow.execute(initial_state, thread_id)
+
+    async def areview(
+        self,
+        sql: str,
+        query_plan: str,
+        tables: List[Dict[str, str]],
+        server_info: Dict[str, str],
+        thread_id: str = None,
+        environment: str = "test",
+        fast_mode: bool = False,
+    ) -> Dict[str, Any]:
+        initial_state = self._sql_initial_state(
+            sql, query_plan, tables, server_info, environment, fast_mode, thread_id
+        )
+        return await self.sql_workflow.aexecute(initial_state, thread_id)
+
+    async def areview_packed(
+        self,
+        queries: List[Dict[str, Any]],
+        environment: str = "test",
+        max_concurrency: int = settings.review_batch_concurrency,
+    ) -> List[Any]:
+        initial_states = [
+            self._sql_initial_state(
+                q["sql"],
+                q["query_plan"],
+                q["tables"],
+                q["server_info"],
+                environment,
+                q.get("fast_mode", False),
+                q.get("thread_id"),
+            )
+            for q in queries
+        ]
+        thread_ids = [q.get("thread_id") for q in queries]
+        return await self.sql_workflow.areview_packed(
+            initial_states, thread_ids, max_concurrency
+        )
+
+    async def astream_review(
+        self,
+        sql: str,
+        query_plan: str,
+        tables: List[Dict[str, str]],
+        server_info: Dict[str, str],
+        thread_id: str = None,
+        environment: str = "test",
+        fast_mode: bool = False,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        initial_state = self._sql_initial_state(
+            sql, query_plan, tables, server_info, environment, fast_mode, thread_id
+        )
+        async for event in self.sql_workflow.astream_events(initial_state, thread_id):
+            yield event
+
+    def analyze_config(
+        self,
+        config: Dict[str, Any],
+        server_info: Dict[str, str],
+        environment: str = "test",
+    ) -> Dict[str, Any]:
+        initial_state = self._config_initial_state(config, server_info, environment)
+        return self.config_workflow.execute(initial_state)
+
+    async def aanalyze_config(
+        self,
+        config: Dict[str, Any],
+        server_info: Dict[str, str],
+        environment: str = "test",
+    ) -> Dict[str, Any]:
+        initial_state = self._config_initial_state(config, server_info, environment)
+        return await self.config_workflow.aexecute(initial_state)
+
+    def analyze_logs(
+        self, logs: str, server_info: Dict[str, str], environment: str = "test"
+    ) -> Dict[str, Any]:
+        initial_state = self._logs_initial_state(logs, server_info, environment)
         return self.logs_workflow.execute(initial_state)
+
+    async def aanalyze_logs(
+        self, logs: str, server_info: Dict[str, str], environment: str = "test"
+    ) -> Dict[str, Any]:
+        initial_state = self._logs_initial_state(logs, server_info, environment)
+        return await self.logs_workflow.aexecute(initial_state)
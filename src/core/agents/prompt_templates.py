@@ -7,15 +7,35 @@ PLAN (если есть): {query_plan}
 SERVER_RESOURCES: {server_info}
 TABLES: {tables_summary}
 ENVIRONMENT: {environment}
+УЖЕ НАЙДЕНО СТАТИЧЕСКОЙ ПРОВЕРКОЙ (STATIC_FINDINGS):
+{static_findings}
 ЗАДАЧА:
 1) Проанализируй SQL и план.
 2) Для каждой найденной проблемы: укажи content, criticality (critical|high|
 medium|low), и конкретную recommendation (команду/пример/параметр). Учитывай environment: в prod среде ошибки критичнее.
+Замечания из STATIC_FINDINGS не повторяй в errors, но учитывай их в overall_score.
 3) Если замечаний нет, верни errors как пустой список [], overall_score=100, и в notes укажи "Запрос соответствует требованиям".
 4) Отдельно укажи общую оценку overall_score (0 — полный провал/очень плохой,
 100 — отлично).
 5) Не пиши ничего лишнего — только JSON.
 """
+PACKED_PROMPT_TEMPLATE = """
+ДАННЫЕ ПРАВИЛА (RETRIEVED_RULES):
+{retrieved_rules}
+SERVER_RESOURCES: {server_info}
+ENVIRONMENT: {environment}
+ЗАПРОСЫ (каждый проверяется независимо от остальных):
+{queries}
+ЗАДАЧА:
+1) Проанализируй каждый запрос и его план отдельно.
+2) Для каждой найденной проблемы: укажи content, criticality (critical|high|
+medium|low), и конкретную recommendation (команду/пример/параметр). Учитывай environment: в prod среде ошибки критичнее.
+Замечания из STATIC_FINDINGS запроса не повторяй в errors, но учитывай их в overall_score.
+3) Верни JSON-объект, где ключ — идентификатор запроса ({ids}), а значение —
+объект с полями errors (список), overall_score (0..100) и notes. В ответе
+должны быть все идентификаторы.
+4) Не пиши ничего лишнего — только JSON.
+"""
 SYSTEM_REVIEWER_PROMPT = """
 Ты — экспертный ревьюер SQL запросов для PostgreSQL. Твоя задача —
 проанализировать входной SQL запрос (и, если есть, EXPLAIN ANALYZE / план),
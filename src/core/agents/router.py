@@ -0,0 +1,151 @@
+"""
+Выбор модели LLM для запроса.
+
+Легкая модель (settings.gigachat_light_model_name) используется:
+- в окружениях из settings.llm_light_environments (по умолчанию development);
+- для небольших промптов анализа конфигурации и логов;
+- для небольших SQL-запросов без плана выполнения.
+
+Остальные запросы, в том числе ревью с планом выполнения, идут в основную
+модель. Если легкая модель не задана, маршрутизация отключена.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from src.core.agents.gateway import _Timings
+from src.core.config import settings
+from src.core.constants import ENVIRONMENT_MAPPING
+
+ROUTE_DEFAULT = "default"
+ROUTE_ENVIRONMENT = "light_environment"
+ROUTE_SMALL_TASK = "light_small_task"
+ROUTE_SMALL_QUERY = "light_small_query"
+
+
+@dataclass(frozen=True)
+class Route:
+    """Выбранный маршрут: имя правила, модель и размер промпта."""
+
+    name: str
+    model_name: str
+    prompt_tokens: int = 0
+
+
+class ModelRouter:
+    """Политика выбора модели по окружению, размеру промпта и типу задачи."""
+
+    def __init__(
+        self,
+        default_model: str,
+        light_model: Optional[str] = None,
+        light_environments: Optional[str] = None,
+        light_max_tokens: Optional[int] = None,
+    ):
+        self.default_model = default_model
+        self.light_model = (
+            light_model
+            if light_model is not None
+            else settings.gigachat_light_model_name
+        ) or None
+        environments = (
+            light_environments
+            if light_environments is not None
+            else settings.llm_light_environments
+        )
+        self.light_environments = {
+            self._environment(e) for e in environments.split(",") if e.strip()
+        }
+        self.light_max_tokens = (
+            light_max_tokens
+            if light_max_tokens is not None
+            else settings.llm_light_max_tokens
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.light_model) and self.light_model != self.default_model
+
+    @staticmethod
+    def _environment(environment: Optional[str]) -> str:
+        key = (environment or "").strip().lower()
+        return ENVIRONMENT_MAPPING.get(key, key)
+
+    def select(
+        self,
+        task: str,
+        environment: Optional[str],
+        prompt_tokens: int,
+        has_plan: bool = False,
+    ) -> Route:
+        """Выбрать модель для задачи (sql, config, logs)."""
+        if not self.enabled:
+            return Route(ROUTE_DEFAULT, self.default_model, prompt_tokens)
+        if self._environment(environment) in self.light_environments:
+            return Route(ROUTE_ENVIRONMENT, self.light_model, prompt_tokens)
+        if prompt_tokens <= self.light_max_tokens:
+            if task != "sql":
+                return Route(ROUTE_SMALL_TASK, self.light_model, prompt_tokens)
+            if not has_plan:
+                return Route(ROUTE_SMALL_QUERY, self.light_model, prompt_tokens)
+        return Route(ROUTE_DEFAULT, self.default_model, prompt_tokens)
+
+
+class RouteMetrics:
+    """Задержка и объем токенов по маршрутам (токены — единица тарификации)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, route: Route) -> Dict[str, Any]:
+        key = f"{route.name}:{route.model_name}"
+        entry = self._routes.get(key)
+        if entry is None:
+            entry = self._routes[key] = {
+                "route": route.name,
+                "model": route.model_name,
+                "latency": _Timings(),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "failures": 0,
+                "shared": 0,
+            }
+        return entry
+
+    def record(
+        self,
+        route: Route,
+        seconds: float,
+        completion_tokens: int = 0,
+        failed: bool = False,
+    ):
+        """Учесть один вызов модели."""
+        with self._lock:
+            entry = self._entry(route)
+            entry["prompt_tokens"] += route.prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["failures"] += int(failed)
+        entry["latency"].add(seconds)
+
+    def record_shared(self, route: Route):
+        """Учесть запрос, получивший результат чужого вызова (single-flight)."""
+        with self._lock:
+            self._entry(route)["shared"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = dict(self._routes)
+        return {
+            key: {
+                "route": entry["route"],
+                "model": entry["model"],
+                "latency": entry["latency"].stats(),
+                "prompt_tokens": entry["prompt_tokens"],
+                "completion_tokens": entry["completion_tokens"],
+                "failures": entry["failures"],
+                "shared": entry["shared"],
+            }
+            for key, entry in entries.items()
+        }
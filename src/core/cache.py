@@ -0,0 +1,203 @@
+"""
+Кэши результатов анализа.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import redis
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением по размеру и TTL."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ReviewResultCache:
+    """Двухуровневый кэш результатов анализа: LRU в процессе и Redis.
+
+    Ключ строится из нормализованных входных данных, окружения, имени модели
+    и версии индекса правил, поэтому после переиндексации правил старые
+    записи перестают находиться сами собой.
+    """
+
+    key_prefix = "review_cache:"
+
+    def __init__(
+        self,
+        maxsize: int = settings.review_cache_max_entries,
+        ttl: int = settings.review_cache_ttl,
+        redis_url: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.redis_client = None
+        self._redis_retry_at = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "errors": 0}
+
+        redis_url = redis_url or settings.redis_url
+        if settings.review_cache_redis_enabled and redis_url:
+            self.redis_client = redis.from_url(
+                redis_url,
+                socket_timeout=settings.review_cache_redis_timeout,
+                socket_connect_timeout=settings.review_cache_redis_timeout,
+            )
+
+    @staticmethod
+    def make_key(
+        kind: str,
+        payload: Dict[str, Any],
+        model_name: str,
+        rules_version: str,
+    ) -> str:
+        """Построить ключ кэша для анализа указанного типа."""
+        raw = json.dumps(
+            {
+                "kind": kind,
+                "payload": payload,
+                "model": model_name,
+                "rules": rules_version,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _redis_available(self) -> bool:
+        return (
+            self.redis_client is not None and time.monotonic() >= self._redis_retry_at
+        )
+
+    def _redis_failed(self, e: Exception):
+        logger.warning(f"Redis-кэш результатов недоступен: {e}")
+        self._count("errors")
+        self._redis_retry_at = (
+            time.monotonic() + settings.review_cache_redis_retry_delay
+        )
+
+    def _redis_get(self, key: str) -> Optional[str]:
+        if not self._redis_available():
+            return None
+        try:
+            value = self.redis_client.get(self.key_prefix + key)
+            return value.decode("utf-8") if value is not None else None
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return None
+
+    def _redis_set(self, key: str, value: str):
+        if not self._redis_available():
+            return
+        try:
+            self.redis_client.set(self.key_prefix + key, value, ex=self.ttl)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def _lookup_local(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.local.get(key)
+        if value is None:
+            return None
+        self._count("local_hits")
+        return json.loads(value)
+
+    def _accept_remote(
+        self, key: str, value: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("redis_hits")
+        self.local.set(key, value)
+        return json.loads(value)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Получить результат из кэша (копию, которую можно изменять)."""
+        result = self._lookup_local(key)
+        if result is not None:
+            return result
+        return self._accept_remote(key, self._redis_get(key))
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self._lookup_local(key)
+        if result is not None:
+            return result
+        value = None
+        if self._redis_available():
+            value = await asyncio.to_thread(self._redis_get, key)
+        return self._accept_remote(key, value)
+
+    def set(self, key: str, result: Dict[str, Any]):
+        value = json.dumps(result, ensure_ascii=False, default=str)
+        self.local.set(key, value)
+        self._redis_set(key, value)
+
+    async def aset(self, key: str, result: Dict[str, Any]):
+        value = json.dumps(result, ensure_ascii=False, default=str)
+        self.local.set(key, value)
+        if self._redis_available():
+            await asyncio.to_thread(self._redis_set, key, value)
+
+    def invalidate(self):
+        """Сбросить локальный уровень (записи в Redis отсекаются версией правил)."""
+        self.local.clear()
+        logger.info("Кэш результатов анализа очищен")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        hits = stats["local_hits"] + stats["redis_hits"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["size"] = len(self.local)
+        stats["redis_enabled"] = self.redis_client is not None
+        return stats
@@ -0,0 +1,114 @@
+"""
+Ограничение истории диалога, передаваемой LLM в потоке ревью.
+
+Стратегии (settings.chat_history_strategy):
+- last_n — последние N ходов;
+- token_window — последние ходы, укладывающиеся в бюджет токенов;
+- summary — последние N ходов, а более ранние сворачиваются в краткую
+  сводку (запрос, оценка и найденные проблемы) без дополнительного вызова LLM.
+"""
+
+import logging
+from typing import Any, Dict, List, Tuple
+
+from src.core.prompt_budget import count_tokens
+from src.core.utils.json_helper import extract_json
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("last_n", "token_window", "summary")
+
+_SUMMARY_SQL_CHARS = 200
+_SUMMARY_MAX_ISSUES = 5
+
+
+def _turns(history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Разбить историю на ходы: сообщение пользователя и ответы на него."""
+    turns: List[List[Dict[str, str]]] = []
+    for message in history:
+        if message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _turn_tokens(turn: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(m.get("content", "")) for m in turn)
+
+
+def summarize_turn(turn: List[Dict[str, str]]) -> str:
+    """Одна строка сводки по ходу: запрос, оценка и замечания."""
+    user = turn[0]
+    sql = " ".join((user.get("sql") or user.get("content", "")).split())
+    line = f"- SQL: {sql[:_SUMMARY_SQL_CHARS]}"
+
+    answer = next((m for m in turn if m.get("role") == "assistant"), None)
+    if answer is None:
+        return line
+    try:
+        parsed = extract_json(answer.get("content", ""))
+    except (TypeError, ValueError):
+        return line
+    if not isinstance(parsed, dict):
+        return line
+
+    if "overall_score" in parsed:
+        line += f"; оценка: {parsed['overall_score']}"
+    issues = [
+        e.get("content", "") for e in parsed.get("errors") or [] if isinstance(e, dict)
+    ]
+    if issues:
+        line += "; замечания: " + "; ".join(issues[:_SUMMARY_MAX_ISSUES])
+    return line
+
+
+def window_history(
+    history: List[Dict[str, str]],
+    summary: str,
+    strategy: str,
+    max_turns: int,
+    token_budget: int,
+) -> Tuple[List[Dict[str, str]], str, Dict[str, Any]]:
+    """Оставить часть истории согласно стратегии.
+
+    Возвращает оставленные сообщения, сводку более ранних ходов (для
+    стратегии summary) и статистику: число ходов и токенов до и после.
+    """
+    turns = _turns(history or [])
+    tokens = [_turn_tokens(t) for t in turns]
+
+    if strategy == "token_window":
+        kept, used = 0, 0
+        for size in reversed(tokens):
+            if used + size > token_budget:
+                break
+            kept, used = kept + 1, used + size
+    else:
+        if strategy not in STRATEGIES:
+            logger.warning(
+                "Неизвестная стратегия истории %s, используется last_n", strategy
+            )
+        kept = min(len(turns), max(0, max_turns))
+
+    dropped, kept_turns = turns[: len(turns) - kept], turns[len(turns) - kept :]
+    if strategy == "summary" and dropped:
+        lines = (summary.splitlines() if summary else []) + [
+            summarize_turn(t) for t in dropped
+        ]
+        # Сводка тоже ограничена бюджетом: отбрасываются самые старые строки
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > token_budget:
+            lines.pop(0)
+        summary = "\n".join(lines)
+    elif strategy != "summary":
+        summary = ""
+
+    messages = [m for turn in kept_turns for m in turn]
+    stats = {
+        "strategy": strategy,
+        "turns_total": len(turns),
+        "turns_kept": len(kept_turns),
+        "history_tokens": sum(tokens[len(turns) - kept :]),
+        "summary_tokens": count_tokens(summary),
+    }
+    return messages, summary, stats
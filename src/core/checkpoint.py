@@ -0,0 +1,399 @@
+"""
+Хранилища состояния графов (checkpointer) с ограниченным потреблением памяти.
+
+Для каждого потока (thread_id) хранится только последний checkpoint: история
+шагов графа не используется, а полная история MemorySaver растет без
+ограничений. Потоки вытесняются по LRU и TTL (в Redis — по TTL ключей).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+import redis
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.core.config import settings
+from src.core.constants import CHECKPOINTER_REDIS_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """MemorySaver с последним checkpoint на поток и вытеснением по LRU/TTL."""
+
+    def __init__(
+        self,
+        max_threads: int = settings.checkpointer_max_threads,
+        ttl: Optional[float] = settings.checkpointer_ttl,
+    ):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._threads: "OrderedDict[str, float]" = OrderedDict()
+        self._blob_keys: Dict[str, Set[tuple]] = {}
+        self._write_keys: Dict[str, Set[tuple]] = {}
+        self.evicted = 0
+
+    def _touch(self, thread_id: str):
+        with self._lock:
+            self._threads[thread_id] = time.monotonic()
+            self._threads.move_to_end(thread_id)
+            self._evict()
+
+    def _evict(self):
+        # Вытеснение пачкой до 90% лимита, чтобы не чистить на каждом вызове
+        stale = []
+        if len(self._threads) > self.max_threads:
+            keep = max(1, int(self.max_threads * 0.9))
+            stale = list(self._threads)[: len(self._threads) - keep]
+        if self.ttl:
+            expire_before = time.monotonic() - self.ttl
+            for thread_id, touched in self._threads.items():
+                if touched >= expire_before:
+                    break
+                if thread_id not in stale:
+                    stale.append(thread_id)
+        for thread_id in stale:
+            self.delete_thread(thread_id)
+        self.evicted += len(stale)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id not in self._threads:
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            blob_keys = self._blob_keys.setdefault(thread_id, set())
+            blob_keys.update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in new_versions.items()
+            )
+            self._prune(thread_id, checkpoint_ns, checkpoint)
+            self._touch(thread_id)
+            return result
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, latest: Checkpoint):
+        """Удалить из потока все, кроме последнего checkpoint и его данных."""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [c for c in checkpoints if c != latest["id"]]:
+            del checkpoints[checkpoint_id]
+            outer_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(outer_key, None)
+            self._write_keys.get(thread_id, set()).discard(outer_key)
+
+        versions = latest["channel_versions"]
+        blob_keys = self._blob_keys[thread_id]
+        for key in [k for k in blob_keys if k[1] == checkpoint_ns]:
+            if versions.get(key[2]) != key[3]:
+                self.blobs.pop(key, None)
+                blob_keys.discard(key)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        outer_key = (
+            thread_id,
+            config["configurable"].get("checkpoint_ns", ""),
+            config["configurable"]["checkpoint_id"],
+        )
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_keys.setdefault(thread_id, set()).add(outer_key)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self._threads.pop(thread_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "threads": len(self._threads),
+                "evicted": self.evicted,
+            }
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver):
+    """Checkpointer в Redis: последний checkpoint потока с TTL.
+
+    Позволяет продолжить поток на любой реплике API. Если Redis недоступен,
+    состояние временно хранится в BoundedMemorySaver процесса.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        redis_url: Optional[str] = None,
+        ttl: Optional[int] = settings.checkpointer_ttl,
+    ):
+        super().__init__()
+        self.key_prefix = f"checkpoint:{namespace}:"
+        self.ttl = ttl
+        self.redis_client = redis.from_url(redis_url or settings.redis_url)
+        self.fallback = BoundedMemorySaver()
+        self._redis_retry_at = 0.0
+        self.errors = 0
+
+    def _key(self, thread_id: str, checkpoint_ns: str) -> str:
+        return f"{self.key_prefix}{thread_id}:{checkpoint_ns}"
+
+    def _writes_key(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        return f"{self._key(thread_id, checkpoint_ns)}:writes:{checkpoint_id}"
+
+    def _dumps(self, value: Any) -> bytes:
+        type_, data = self.serde.dumps_typed(value)
+        return type_.encode("utf-8") + b"|" + data
+
+    def _loads(self, raw: bytes) -> Any:
+        type_, _, data = raw.partition(b"|")
+        return self.serde.loads_typed((type_.decode("utf-8"), data))
+
+    def _with_fallback(self, method: str, *args):
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                return getattr(self, f"_redis_{method}")(*args)
+            except redis.RedisError as e:
+                logger.warning(f"Redis-checkpointer недоступен: {e}")
+                self.errors += 1
+                self._redis_retry_at = time.monotonic() + CHECKPOINTER_REDIS_RETRY_DELAY
+        return getattr(self.fallback, method)(*args)
+
+    def _redis_get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = self.redis_client.hgetall(self._key(thread_id, checkpoint_ns))
+        if not saved:
+            return None
+        checkpoint_id = saved[b"id"].decode("utf-8")
+        requested_id = get_checkpoint_id(config)
+        if requested_id and requested_id != checkpoint_id:
+            return None
+
+        writes = self.redis_client.hgetall(
+            self._writes_key(thread_id, checkpoint_ns, checkpoint_id)
+        )
+        pending_writes = [self._loads(v) for _, v in sorted(writes.items())]
+        parent_id = saved.get(b"parent_id", b"").decode("utf-8")
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self._loads(saved[b"checkpoint"]),
+            metadata=self._loads(saved[b"metadata"]),
+            pending_writes=[(task_id, c, v) for task_id, c, v, _ in pending_writes],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+        )
+
+    def _redis_put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id") or ""
+        key = self._key(thread_id, checkpoint_ns)
+
+        pipe = self.redis_client.pipeline()
+        pipe.hset(
+            key,
+            mapping={
+                "id": checkpoint["id"],
+                "checkpoint": self._dumps(checkpoint),
+                "metadata": self._dumps(get_checkpoint_metadata(config, metadata)),
+                "parent_id": parent_id,
+            },
+        )
+        if self.ttl:
+            pipe.expire(key, self.ttl)
+        if parent_id:
+            pipe.delete(self._writes_key(thread_id, checkpoint_ns, parent_id))
+        pipe.execute()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _redis_put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        key = self._writes_key(
+            config["configurable"]["thread_id"],
+            config["configurable"].get("checkpoint_ns", ""),
+            config["configurable"]["checkpoint_id"],
+        )
+        pipe = self.redis_client.pipeline()
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            field = f"{task_id}:{write_idx:010d}"
+            raw = self._dumps((task_id, channel, value, task_path))
+            # Обычные записи не перезаписываются, служебные (ошибки и т.п.) — да
+            if write_idx >= 0:
+                pipe.hsetnx(key, field, raw)
+            else:
+                pipe.hset(key, field, raw)
+        if self.ttl:
+            pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def _redis_delete_thread(self, thread_id: str) -> None:
+        keys = list(self.redis_client.scan_iter(f"{self.key_prefix}{thread_id}:*"))
+        if keys:
+            self.redis_client.delete(*keys)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._with_fallback("get_tuple", config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is None or limit == 0:
+            return
+        checkpoint_tuple = self.get_tuple(config)
+        if checkpoint_tuple is None:
+            return
+        if filter and any(
+            checkpoint_tuple.metadata.get(k) != v for k, v in filter.items()
+        ):
+            return
+        yield checkpoint_tuple
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._with_fallback("put", config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._with_fallback("put_writes", config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.fallback.delete_thread(thread_id)
+        self._with_fallback("delete_thread", thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs):
+        for checkpoint_tuple in await asyncio.to_thread(
+            lambda: list(self.list(config, **kwargs))
+        ):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "errors": self.errors,
+            "fallback_threads": self.fallback.stats()["threads"],
+        }
+
+
+def create_checkpointer(namespace: str) -> BaseCheckpointSaver:
+    """Создать checkpointer согласно settings.checkpointer_backend."""
+    if settings.checkpointer_backend == "redis":
+        return RedisCheckpointSaver(namespace)
+    if settings.checkpointer_backend != "memory":
+        logger.warning(
+            f"Неизвестный checkpointer_backend={settings.checkpointer_backend}, "
+            "используется memory"
+        )
+    return BoundedMemorySaver()
@@ -8,6 +8,48 @@ from src.core.constants import (
     DEFAULT_MAX_RULES_TO_RETRIEVE,
     DEFAULT_RATE_LIMIT_REQUESTS,
     DEFAULT_RATE_LIMIT_WINDOW,
+    DEFAULT_RATE_LIMIT_CLIENT_HEADER,
+    DEFAULT_LLM_CALLS_PER_MINUTE,
+    DEFAULT_TRACING_SAMPLE_RATE,
+    DEFAULT_TRACING_QUEUE_SIZE,
+    DEFAULT_EMBEDDING_CACHE_DIR,
+    DEFAULT_EMBEDDING_CACHE_MAX_MB,
+    DEFAULT_RETRIEVAL_CACHE_MAX_ENTRIES,
+    DEFAULT_JOB_WEBHOOK_ALLOWED_HOSTS,
+    DEFAULT_REVIEW_BATCH_CONCURRENCY,
+    DEFAULT_REVIEW_PACK_SIZE,
+    DEFAULT_REVIEW_PACK_MAX_QUERY_TOKENS,
+    DEFAULT_REVIEW_CACHE_MAX_ENTRIES,
+    DEFAULT_REVIEW_CACHE_TTL,
+    DEFAULT_REVIEW_CACHE_REDIS_TIMEOUT,
+    DEFAULT_REVIEW_CACHE_REDIS_RETRY_DELAY,
+    DEFAULT_CHECKPOINTER_BACKEND,
+    DEFAULT_CHECKPOINTER_MAX_THREADS,
+    DEFAULT_CHECKPOINTER_TTL,
+    DEFAULT_PLAN_SUMMARY_THRESHOLD,
+    DEFAULT_PROMPT_TOKEN_BUDGET,
+    DEFAULT_CHAT_HISTORY_STRATEGY,
+    DEFAULT_CHAT_HISTORY_MAX_TURNS,
+    DEFAULT_CHAT_HISTORY_TOKEN_BUDGET,
+    DEFAULT_LLM_BACKEND,
+    DEFAULT_LLM_LIGHT_ENVIRONMENTS,
+    DEFAULT_LLM_LIGHT_MAX_TOKENS,
+    DEFAULT_FAKE_LLM_LATENCY_MS,
+    DEFAULT_FAKE_LLM_LATENCY_DISTRIBUTION,
+    DEFAULT_FAKE_LLM_LATENCY_SPREAD,
+    DEFAULT_FAKE_LLM_TOKENS_PER_SECOND,
+    DEFAULT_FAKE_LLM_FAILURE_STATUS,
+    DEFAULT_FAKE_LLM_SEED,
+    DEFAULT_LLM_TIMEOUT,
+    DEFAULT_LLM_DEADLINE,
+    DEFAULT_LLM_MAX_RETRIES,
+    DEFAULT_LLM_RETRY_BASE_DELAY,
+    DEFAULT_LLM_RETRY_MAX_DELAY,
+    DEFAULT_LLM_CONCURRENCY_INITIAL,
+    DEFAULT_LLM_CONCURRENCY_MIN,
+    DEFAULT_LLM_CONCURRENCY_MAX,
+    DEFAULT_LLM_BREAKER_FAILURE_THRESHOLD,
+    DEFAULT_LLM_BREAKER_RESET_TIMEOUT,
 )
 
 
@@ -35,6 +77,21 @@ class Settings(BaseSettings):
 
     gigachat_api_key: Optional[str] = os.getenv("GIGACHAT_API_KEY")
     gigachat_model_name: str = os.getenv("GIGACHAT_MODEL_NAME", "GigaChat")
+    # Легкая модель для dev-окружений и небольших запросов; пусто — без маршрутизации
+    gigachat_light_model_name: Optional[str] = None
+    llm_light_environments: str = DEFAULT_LLM_LIGHT_ENVIRONMENTS  # через запятую
+    llm_light_max_tokens: int = DEFAULT_LLM_LIGHT_MAX_TOKENS
+
+    # gigachat | fake (локальная заглушка для нагрузочных тестов)
+    llm_backend: str = DEFAULT_LLM_BACKEND
+    fake_llm_latency_ms: float = DEFAULT_FAKE_LLM_LATENCY_MS
+    # fixed | uniform | lognormal
+    fake_llm_latency_distribution: str = DEFAULT_FAKE_LLM_LATENCY_DISTRIBUTION
+    fake_llm_latency_spread: float = DEFAULT_FAKE_LLM_LATENCY_SPREAD
+    fake_llm_tokens_per_second: float = DEFAULT_FAKE_LLM_TOKENS_PER_SECOND
+    fake_llm_failure_rate: float = 0.0
+    fake_llm_failure_status: int = DEFAULT_FAKE_LLM_FAILURE_STATUS
+    fake_llm_seed: int = DEFAULT_FAKE_LLM_SEED
 
     langsmith_tracing: bool = os.getenv("LANGSMITH_TRACING", "false").lower() == "true"
     langsmith_api_key: Optional[str] = os.getenv("LANGSMITH_API_KEY")
@@ -42,11 +99,14 @@ class Settings(BaseSettings):
         "LANGSMITH_ENDPOINT", "https://api.smith.langchain.com"
     )
     langsmith_project: str = os.getenv("LANGSMITH_PROJECT", "postgresql-reviewer")
+    langsmith_sample_rate: float = DEFAULT_TRACING_SAMPLE_RATE
 
     langfuse_tracing: bool = os.getenv("LANGFUSE_TRACING", "false").lower() == "true"
     langfuse_secret_key: Optional[str] = os.getenv("LANGFUSE_SECRET_KEY")
     langfuse_public_key: Optional[str] = os.getenv("LANGFUSE_PUBLIC_KEY")
     langfuse_host: str = os.getenv("LANGFUSE_HOST", "http://localhost:3000")
+    langfuse_sample_rate: float = DEFAULT_TRACING_SAMPLE_RATE
+    tracing_queue_size: int = DEFAULT_TRACING_QUEUE_SIZE
 
     log_level: str = "INFO"
     log_file: str = "./logs/postgresql-reviewer.log"
@@ -55,13 +115,62 @@ class Settings(BaseSettings):
     faiss_persist_dir: str = "./data/faiss"
     kb_rules_dir: str = "./src/kb/rules"
     embeddings_model: str = "all-MiniLM-L6-v2"
+    # Пустое значение отключает кэш эмбеддингов на диске
+    embedding_cache_dir: str = DEFAULT_EMBEDDING_CACHE_DIR
+    embedding_cache_max_mb: int = DEFAULT_EMBEDDING_CACHE_MAX_MB
+    # 0 отключает кэш результатов поиска правил
+    retrieval_cache_max_entries: int = DEFAULT_RETRIEVAL_CACHE_MAX_ENTRIES
     tokenizers_parallelism: bool = False
     chunk_size: int = DEFAULT_CHUNK_SIZE
     chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
     max_rules_to_retrieve: int = DEFAULT_MAX_RULES_TO_RETRIEVE
 
+    rate_limit_enabled: bool = True
     rate_limit_requests: int = DEFAULT_RATE_LIMIT_REQUESTS
     rate_limit_window: int = DEFAULT_RATE_LIMIT_WINDOW
+    rate_limit_client_header: str = DEFAULT_RATE_LIMIT_CLIENT_HEADER
+    # SHA-256 (hex) известных API-ключей через запятую
+    rate_limit_api_keys: str = ""
+    # Общий секрет API и воркера: его вызовы не расходуют лимит клиентов
+    internal_api_token: Optional[str] = os.getenv("INTERNAL_API_TOKEN")
+    # Брать IP клиента из X-Forwarded-For (только за доверенным прокси)
+    rate_limit_trust_forwarded: bool = False
+    llm_calls_per_minute: int = DEFAULT_LLM_CALLS_PER_MINUTE
+
+    review_batch_concurrency: int = DEFAULT_REVIEW_BATCH_CONCURRENCY
+    review_pack_size: int = DEFAULT_REVIEW_PACK_SIZE
+    review_pack_max_query_tokens: int = DEFAULT_REVIEW_PACK_MAX_QUERY_TOKENS
+
+    review_cache_enabled: bool = True
+    review_cache_max_entries: int = DEFAULT_REVIEW_CACHE_MAX_ENTRIES
+    review_cache_ttl: int = DEFAULT_REVIEW_CACHE_TTL
+    review_cache_redis_enabled: bool = True
+    review_cache_redis_timeout: float = DEFAULT_REVIEW_CACHE_REDIS_TIMEOUT
+    review_cache_redis_retry_delay: int = DEFAULT_REVIEW_CACHE_REDIS_RETRY_DELAY
+
+    checkpointer_backend: str = DEFAULT_CHECKPOINTER_BACKEND  # memory | redis
+    checkpointer_max_threads: int = DEFAULT_CHECKPOINTER_MAX_THREADS
+    checkpointer_ttl: int = DEFAULT_CHECKPOINTER_TTL
+
+    plan_summary_threshold: int = DEFAULT_PLAN_SUMMARY_THRESHOLD
+    prompt_token_budget: int = DEFAULT_PROMPT_TOKEN_BUDGET
+
+    # last_n | token_window | summary
+    chat_history_strategy: str = DEFAULT_CHAT_HISTORY_STRATEGY
+    chat_history_max_turns: int = DEFAULT_CHAT_HISTORY_MAX_TURNS
+    chat_history_token_budget: int = DEFAULT_CHAT_HISTORY_TOKEN_BUDGET
+
+    llm_singleflight_enabled: bool = True
+    llm_timeout: int = DEFAULT_LLM_TIMEOUT
+    llm_deadline: int = DEFAULT_LLM_DEADLINE
+    llm_max_retries: int = DEFAULT_LLM_MAX_RETRIES
+    llm_retry_base_delay: float = DEFAULT_LLM_RETRY_BASE_DELAY
+    llm_retry_max_delay: float = DEFAULT_LLM_RETRY_MAX_DELAY
+    llm_concurrency_initial: int = DEFAULT_LLM_CONCURRENCY_INITIAL
+    llm_concurrency_min: int = DEFAULT_LLM_CONCURRENCY_MIN
+    llm_concurrency_max: int = DEFAULT_LLM_CONCURRENCY_MAX
+    llm_breaker_failure_threshold: int = DEFAULT_LLM_BREAKER_FAILURE_THRESHOLD
+    llm_breaker_reset_timeout: int = DEFAULT_LLM_BREAKER_RESET_TIMEOUT
 
     static_dir: str = "./src/api/static"
     logs_dir: str = "./logs"
@@ -71,6 +180,8 @@ class Settings(BaseSettings):
     scheduler_api_url: str = os.getenv(
         "SCHEDULER_API_URL", "http://postgresql-reviewer:8000"
     )
+    # Хосты webhook заданий через запятую
+    job_webhook_allowed_hosts: str = DEFAULT_JOB_WEBHOOK_ALLOWED_HOSTS
 
     class Config:
         env_file = ".env"
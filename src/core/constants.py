@@ -22,6 +22,29 @@ CRITICALITY_MULTIPLIERS = {
     "production": 1.5,
 }
 
+CRITICALITY_LEVELS = ("critical", "high", "medium", "low")
+
+CRITICALITY_MAPPING = {
+    "critical": "critical",
+    "crit": "critical",
+    "blocker": "critical",
+    "fatal": "critical",
+    "критическая": "critical",
+    "критичная": "critical",
+    "high": "high",
+    "major": "high",
+    "error": "high",
+    "высокая": "high",
+    "medium": "medium",
+    "moderate": "medium",
+    "warning": "medium",
+    "средняя": "medium",
+    "low": "low",
+    "minor": "low",
+    "info": "low",
+    "низкая": "low",
+}
+
 SCORE_THRESHOLD_PASS = 70.0
 SCORE_THRESHOLD_WARNING = 50.0
 
@@ -31,14 +54,95 @@ FILE_ENCODING = "utf-8"
 
 DEFAULT_CHUNK_SIZE = 1500
 DEFAULT_CHUNK_OVERLAP = 200
+KB_MANIFEST_FILE = "manifest.json"
+KB_MANIFEST_VERSION = 1
+DEFAULT_EMBEDDING_CACHE_DIR = "./data/embedding_cache"
+DEFAULT_EMBEDDING_CACHE_MAX_MB = 256
+DEFAULT_RETRIEVAL_CACHE_MAX_ENTRIES = 512
+EMBEDDING_CACHE_SQLITE_TIMEOUT = 10  # секунд ожидания блокировки SQLite
 
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_BACKUP_COUNT = 5
 
-DEFAULT_RATE_LIMIT_REQUESTS = 100
-DEFAULT_RATE_LIMIT_WINDOW = 60
+DEFAULT_RATE_LIMIT_REQUESTS = 100  # емкость корзины клиента в единицах стоимости
+DEFAULT_RATE_LIMIT_WINDOW = 60  # за сколько секунд корзина пополняется целиком
+DEFAULT_RATE_LIMIT_CLIENT_HEADER = "X-API-Key"
+DEFAULT_LLM_CALLS_PER_MINUTE = 0  # 0 — без общего бюджета
+RATE_LIMIT_REDIS_TIMEOUT = 0.2
+RATE_LIMIT_REDIS_RETRY_DELAY = 30
+RATE_LIMIT_LOCAL_MAX_BUCKETS = 10000
+
+# Стоимость запросов: (метод, префикс пути без /api[/v1], токены), первое совпадение
+RATE_LIMIT_ENDPOINT_COSTS = [
+    ("POST", "/review/batch", 20),
+    ("POST", "/review", 5),
+    ("POST", "/config/analyze", 5),
+    ("POST", "/logs/analyze", 5),
+    ("POST", "/jobs/", 5),
+    ("POST", "/rules/ingest", 10),
+]
+RATE_LIMIT_DEFAULT_COST = 1  # чтение
+RATE_LIMIT_WRITE_COST = 2  # прочие изменяющие запросы
+RATE_LIMIT_EXEMPT_SUFFIXES = ("/docs", "/redoc", "/openapi.json")
+# Заголовок с токеном внутренних вызовов API (воркер), не ограничиваются лимитом
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
 
 DEFAULT_MAX_RULES_TO_RETRIEVE = 6
 
+REVIEW_SERVICE_WARMUP_RETRY_DELAY = 10
+
+DEFAULT_REVIEW_BATCH_CONCURRENCY = 8
+DEFAULT_REVIEW_PACK_SIZE = 10
+DEFAULT_REVIEW_PACK_MAX_QUERY_TOKENS = 600
+
+DEFAULT_REVIEW_CACHE_MAX_ENTRIES = 1024
+DEFAULT_REVIEW_CACHE_TTL = 6 * 60 * 60  # 6 часов
+DEFAULT_REVIEW_CACHE_REDIS_TIMEOUT = 0.5
+DEFAULT_REVIEW_CACHE_REDIS_RETRY_DELAY = 30
+
+DEFAULT_CHECKPOINTER_BACKEND = "memory"
+DEFAULT_CHECKPOINTER_MAX_THREADS = 1000
+DEFAULT_CHECKPOINTER_TTL = 60 * 60  # 1 час
+CHECKPOINTER_REDIS_RETRY_DELAY = 30
+
+DEFAULT_PLAN_SUMMARY_THRESHOLD = 2000  # символов
+
+DEFAULT_PROMPT_TOKEN_BUDGET = 6000
+PROMPT_TOKENIZER_ENCODING = "cl100k_base"
+
+DEFAULT_CHAT_HISTORY_STRATEGY = "last_n"
+DEFAULT_CHAT_HISTORY_MAX_TURNS = 3
+DEFAULT_CHAT_HISTORY_TOKEN_BUDGET = 3000
+
+DEFAULT_LLM_BACKEND = "gigachat"
+DEFAULT_LLM_LIGHT_ENVIRONMENTS = "development"
+DEFAULT_LLM_LIGHT_MAX_TOKENS = 1500
+DEFAULT_FAKE_LLM_LATENCY_MS = 800
+DEFAULT_FAKE_LLM_LATENCY_DISTRIBUTION = "lognormal"
+DEFAULT_FAKE_LLM_LATENCY_SPREAD = 0.5
+DEFAULT_FAKE_LLM_TOKENS_PER_SECOND = 50
+DEFAULT_FAKE_LLM_FAILURE_STATUS = 503
+DEFAULT_FAKE_LLM_SEED = 42
+
+DEFAULT_LLM_TIMEOUT = 120  # секунд на одну попытку
+DEFAULT_LLM_DEADLINE = 300  # секунд на вызов с учетом очереди и повторов
+DEFAULT_LLM_MAX_RETRIES = 3
+DEFAULT_LLM_RETRY_BASE_DELAY = 1.0
+DEFAULT_LLM_RETRY_MAX_DELAY = 20.0
+DEFAULT_LLM_CONCURRENCY_INITIAL = 4
+DEFAULT_LLM_CONCURRENCY_MIN = 1
+DEFAULT_LLM_CONCURRENCY_MAX = 16
+DEFAULT_LLM_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_LLM_BREAKER_RESET_TIMEOUT = 30
+
+DEFAULT_TRACING_SAMPLE_RATE = 1.0
+DEFAULT_TRACING_QUEUE_SIZE = 10000  # событий в очереди экспорта
+TRACING_ADMIT_RATIO = 0.8  # выше этой доли заполнения новые трассы не начинаются
+TRACING_EXPORT_BATCH = 100
+TRACING_SHUTDOWN_TIMEOUT = 5  # секунд на отправку очереди при остановке
+
 ERROR_TASK_CREATION_FAILED = "Не удалось создать задачу"
+
+JOB_WEBHOOK_TIMEOUT = 10  # секунд на вызов webhook задания
+DEFAULT_JOB_WEBHOOK_ALLOWED_HOSTS = ""  # пусто — любые хосты с публичными адресами
@@ -0,0 +1,92 @@
+"""
+Проверка и нормализация результатов анализа, полученных от LLM.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
+
+from src.core.constants import CRITICALITY_MAPPING
+from src.core.scoring import compute_overall_score
+from src.core.utils.json_helper import extract_json
+
+DEFAULT_CRITICALITY = "medium"
+
+
+class LLMIssue(BaseModel):
+    """Замечание из ответа LLM."""
+
+    model_config = ConfigDict(extra="allow")
+
+    content: str = ""
+    criticality: str = DEFAULT_CRITICALITY
+    recommendation: Optional[str] = None
+
+    @field_validator("criticality", mode="before")
+    @classmethod
+    def _normalize_criticality(cls, value: Any) -> str:
+        key = str(value or "").strip().lower()
+        return CRITICALITY_MAPPING.get(key, DEFAULT_CRITICALITY)
+
+
+class LLMResult(BaseModel):
+    """Результат анализа: замечания, оценка 0..100 и пояснения."""
+
+    model_config = ConfigDict(extra="allow")
+
+    errors: List[LLMIssue] = []
+    overall_score: Optional[int] = None
+    notes: Optional[str] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def _require_result_fields(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            raise ValueError("Результат анализа должен быть JSON-объектом")
+        if "errors" not in data and "overall_score" not in data:
+            raise ValueError("В ответе нет ни errors, ни overall_score")
+        return data
+
+    @field_validator("errors", mode="before")
+    @classmethod
+    def _coerce_errors(cls, value: Any) -> List[Any]:
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            raise ValueError("errors должен быть списком")
+        # Замечание строкой превращается в объект, прочий мусор отбрасывается
+        return [
+            {"content": item} if isinstance(item, str) else item
+            for item in value
+            if isinstance(item, (str, dict))
+        ]
+
+    @field_validator("overall_score", mode="before")
+    @classmethod
+    def _clamp_score(cls, value: Any) -> Optional[int]:
+        if value is None:
+            return None
+        return max(0, min(100, round(float(value))))
+
+
+def validate_result(data: Any) -> Dict[str, Any]:
+    """Проверить результат по схеме; ValueError, если он некорректен."""
+    return LLMResult.model_validate(data).model_dump(exclude_none=True)
+
+
+def parse_llm_result(response: str, environment: str = "test") -> Dict[str, Any]:
+    """Извлечь JSON из ответа LLM и проверить его по схеме результата.
+
+    Ответ-массив считается списком замечаний; если оценки нет, она считается
+    по критичности замечаний. ValueError, если JSON не найден или не
+    соответствует схеме.
+    """
+    data = extract_json(response)
+    if isinstance(data, list):
+        data = {"errors": data}
+    result = validate_result(data)
+    if "overall_score" not in result:
+        result["overall_score"] = round(
+            compute_overall_score(result["errors"], environment)
+        )
+    return result
@@ -0,0 +1,372 @@
+"""
+Разбор планов EXPLAIN и их сжатое описание для промпта.
+
+Поддерживаются форматы EXPLAIN (FORMAT JSON) и текстовый вывод, в том числе с
+ANALYZE и BUFFERS. Вместо полного плана в промпт передается сводка: горячие
+узлы по собственному времени, ошибки оценки числа строк, чтения буферов и
+сбросы на диск.
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MISESTIMATE_THRESHOLD = 10.0
+
+_NODE_RE = re.compile(
+    r"^(?P<name>.+?)\s+\(cost=(?P<startup>[\d.]+)\.\.(?P<total>[\d.]+)"
+    r"\s+rows=(?P<rows>\d+)\s+width=\d+\)"
+    r"(?:\s+\((?:actual\s+(?:time=(?P<astart>[\d.]+)\.\.(?P<atotal>[\d.]+)\s+)?"
+    r"rows=(?P<arows>[\d.]+)\s+loops=(?P<loops>\d+)|(?P<never>never executed))\))?"
+)
+_RELATION_RE = re.compile(r"\bon\s+(\S+)")
+_INDEX_RE = re.compile(r"\busing\s+(\S+)")
+_BUFFER_RE = re.compile(r"(shared|local|temp)\s+((?:\w+=\d+\s*)+)")
+_TIMING_RE = re.compile(r"^(Planning|Execution) Time:\s+([\d.]+)\s*ms")
+
+
+@dataclass
+class PlanNode:
+    """Узел плана выполнения."""
+
+    node_type: str
+    relation: Optional[str] = None
+    index: Optional[str] = None
+    startup_cost: float = 0.0
+    total_cost: float = 0.0
+    plan_rows: float = 0.0
+    actual_rows: Optional[float] = None
+    actual_time: Optional[float] = None
+    loops: int = 1
+    never_executed: bool = False
+    shared_hit: int = 0
+    shared_read: int = 0
+    temp_read: int = 0
+    temp_written: int = 0
+    filter: Optional[str] = None
+    rows_removed: int = 0
+    spill: Optional[str] = None
+    children: List["PlanNode"] = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        label = self.node_type
+        if self.index:
+            label += f" using {self.index}"
+        if self.relation:
+            label += f" on {self.relation}"
+        return label
+
+    @property
+    def analyzed(self) -> bool:
+        return self.actual_time is not None
+
+    @property
+    def total_time(self) -> float:
+        """Полное время узла с учетом всех циклов, мс."""
+        return (self.actual_time or 0.0) * self.loops
+
+    @property
+    def self_time(self) -> float:
+        return max(0.0, self.total_time - sum(c.total_time for c in self.children))
+
+    @property
+    def self_cost(self) -> float:
+        return max(0.0, self.total_cost - sum(c.total_cost for c in self.children))
+
+    @property
+    def misestimate(self) -> Optional[float]:
+        """Во сколько раз фактическое число строк отличается от оценки (>= 1)."""
+        if self.actual_rows is None or self.never_executed:
+            return None
+        actual = max(self.actual_rows, 1.0)
+        planned = max(self.plan_rows, 1.0)
+        return max(actual / planned, planned / actual)
+
+    def walk(self) -> Iterator["PlanNode"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+@dataclass
+class ParsedPlan:
+    """Разобранный план с общими показателями выполнения."""
+
+    root: PlanNode
+    planning_time: Optional[float] = None
+    execution_time: Optional[float] = None
+
+
+def _from_json_node(data: Dict[str, Any]) -> PlanNode:
+    node = PlanNode(
+        node_type=data.get("Node Type", "Unknown"),
+        relation=data.get("Relation Name") or data.get("CTE Name"),
+        index=data.get("Index Name"),
+        startup_cost=float(data.get("Startup Cost", 0.0)),
+        total_cost=float(data.get("Total Cost", 0.0)),
+        plan_rows=float(data.get("Plan Rows", 0.0)),
+        actual_rows=data.get("Actual Rows"),
+        actual_time=data.get("Actual Total Time"),
+        loops=int(data.get("Actual Loops", 1) or 1),
+        shared_hit=int(data.get("Shared Hit Blocks", 0)),
+        shared_read=int(data.get("Shared Read Blocks", 0)),
+        temp_read=int(data.get("Temp Read Blocks", 0)),
+        temp_written=int(data.get("Temp Written Blocks", 0)),
+        filter=data.get("Filter") or data.get("Join Filter"),
+        rows_removed=int(data.get("Rows Removed by Filter", 0)),
+    )
+    if data.get("Actual Loops") == 0:
+        node.never_executed = True
+        node.loops = 0
+    if data.get("Sort Space Type") == "Disk":
+        node.spill = f"{data.get('Sort Method', 'sort')}, Disk {data.get('Sort Space Used', '?')}kB"
+    elif int(data.get("Hash Batches", 1) or 1) > 1:
+        node.spill = f"Batches {data['Hash Batches']}"
+    node.children = [_from_json_node(child) for child in data.get("Plans", [])]
+    return node
+
+
+def _parse_json(data: Any) -> Optional[ParsedPlan]:
+    if isinstance(data, list):
+        if not data:
+            return None
+        data = data[0]
+    if not isinstance(data, dict):
+        return None
+    if "Plan" in data:
+        return ParsedPlan(
+            root=_from_json_node(data["Plan"]),
+            planning_time=data.get("Planning Time"),
+            execution_time=data.get("Execution Time"),
+        )
+    if "Node Type" in data:
+        return ParsedPlan(root=_from_json_node(data))
+    return None
+
+
+def _node_from_text(text: str) -> Optional[PlanNode]:
+    match = _NODE_RE.match(text)
+    if not match:
+        return None
+    name = match.group("name").strip()
+    node = PlanNode(
+        node_type=re.split(r"\s+(?:on|using)\s+", name, maxsplit=1)[0],
+        startup_cost=float(match.group("startup")),
+        total_cost=float(match.group("total")),
+        plan_rows=float(match.group("rows")),
+    )
+    relation = _RELATION_RE.search(name)
+    index = _INDEX_RE.search(name)
+    node.relation = relation.group(1) if relation else None
+    node.index = index.group(1) if index else None
+    if match.group("never"):
+        node.never_executed = True
+        node.loops = 0
+    elif match.group("arows") is not None:
+        node.actual_rows = float(match.group("arows"))
+        node.loops = int(match.group("loops"))
+        if match.group("atotal") is not None:
+            node.actual_time = float(match.group("atotal"))
+    return node
+
+
+def _apply_text_detail(node: PlanNode, line: str):
+    if line.startswith("Buffers:"):
+        for kind, counters in _BUFFER_RE.findall(line):
+            values = dict((k, int(v)) for k, v in re.findall(r"(\w+)=(\d+)", counters))
+            if kind == "shared":
+                node.shared_hit += values.get("hit", 0)
+                node.shared_read += values.get("read", 0)
+            elif kind == "temp":
+                node.temp_read += values.get("read", 0)
+                node.temp_written += values.get("written", 0)
+    elif line.startswith(("Filter:", "Join Filter:")):
+        node.filter = line.split(":", 1)[1].strip()
+    elif line.startswith("Rows Removed by Filter:"):
+        node.rows_removed = int(line.split(":", 1)[1].strip())
+    elif line.startswith("Sort Method:") and "Disk:" in line:
+        node.spill = line.split(":", 1)[1].strip()
+    elif "Batches:" in line:
+        batches = re.search(r"Batches:\s+(\d+)", line)
+        if batches and int(batches.group(1)) > 1:
+            node.spill = f"Batches {batches.group(1)}"
+
+
+def _parse_text(text: str) -> Optional[ParsedPlan]:
+    root: Optional[PlanNode] = None
+    stack: List[tuple] = []
+    planning_time = execution_time = None
+
+    for raw_line in text.splitlines():
+        line = raw_line.rstrip()
+        if not line.strip() or set(line.strip()) <= {"-", "+"}:
+            continue
+        stripped = line.strip()
+        if stripped == "QUERY PLAN" or re.match(r"^\(\d+ rows?\)$", stripped):
+            continue
+
+        timing = _TIMING_RE.match(stripped)
+        if timing:
+            if timing.group(1) == "Planning":
+                planning_time = float(timing.group(2))
+            else:
+                execution_time = float(timing.group(2))
+            continue
+
+        arrow = line.find("->")
+        if arrow != -1 and not line[:arrow].strip():
+            node = _node_from_text(line[arrow + 2 :].strip())
+            if node is None:
+                continue
+            while stack and stack[-1][0] >= arrow:
+                stack.pop()
+            if stack:
+                stack[-1][1].children.append(node)
+            stack.append((arrow, node))
+            continue
+
+        if root is None:
+            node = _node_from_text(stripped)
+            if node is not None:
+                root = node
+                stack = [(-1, root)]
+            continue
+
+        if stack:
+            _apply_text_detail(stack[-1][1], stripped)
+
+    if root is None:
+        return None
+    return ParsedPlan(
+        root=root, planning_time=planning_time, execution_time=execution_time
+    )
+
+
+def parse_plan(plan: Any) -> Optional[ParsedPlan]:
+    """Разобрать план EXPLAIN в формате JSON или TEXT (None — не удалось)."""
+    if not plan:
+        return None
+    if isinstance(plan, (dict, list)):
+        return _parse_json(plan)
+
+    text = str(plan).strip()
+    if text[:1] in "[{":
+        try:
+            return _parse_json(json.loads(text))
+        except json.JSONDecodeError:
+            pass
+    return _parse_text(text)
+
+
+def _describe_node(node: PlanNode, total_time: float, analyzed: bool) -> str:
+    parts = [node.label]
+    if analyzed:
+        share = f" ({node.self_time / total_time:.0%})" if total_time else ""
+        parts.append(f"self={node.self_time:.1f} ms{share}")
+        if node.never_executed:
+            parts.append("never executed")
+        else:
+            parts.append(
+                f"rows plan={node.plan_rows:.0f} actual={node.actual_rows:.0f}"
+                f" loops={node.loops}"
+            )
+    else:
+        parts.append(f"self_cost={node.self_cost:.1f} rows={node.plan_rows:.0f}")
+    if node.shared_read or node.shared_hit:
+        parts.append(f"shared hit={node.shared_hit} read={node.shared_read}")
+    if node.filter:
+        removed = f", removed={node.rows_removed}" if node.rows_removed else ""
+        parts.append(f"filter {node.filter}{removed}")
+    if node.spill:
+        parts.append(f"spill: {node.spill}")
+    return "; ".join(parts)
+
+
+def _outline(node: PlanNode, depth: int, lines: List[str], max_lines: int):
+    if len(lines) >= max_lines:
+        return
+    lines.append("  " * depth + node.label)
+    for child in node.children:
+        _outline(child, depth + 1, lines, max_lines)
+
+
+def summarize_plan(plan: ParsedPlan, top_n: int = 5, max_outline: int = 30) -> str:
+    """Сжатое текстовое описание плана для промпта."""
+    root = plan.root
+    nodes = list(root.walk())
+    analyzed = any(n.analyzed for n in nodes)
+
+    header = [f"Узлов: {len(nodes)}", f"Total Cost: {root.total_cost:.1f}"]
+    if plan.execution_time is not None:
+        header.append(f"Execution Time: {plan.execution_time:.1f} ms")
+    if plan.planning_time is not None:
+        header.append(f"Planning Time: {plan.planning_time:.1f} ms")
+    lines = ["; ".join(header)]
+
+    total_time = root.total_time if analyzed else 0.0
+    key = (lambda n: n.self_time) if analyzed else (lambda n: n.self_cost)
+    hot = sorted(nodes, key=key, reverse=True)[:top_n]
+    title = "по собственному времени" if analyzed else "по собственной стоимости"
+    lines.append(f"Горячие узлы ({title}):")
+    for i, node in enumerate(hot, 1):
+        lines.append(f"{i}. {_describe_node(node, total_time, analyzed)}")
+
+    misestimated = [n for n in nodes if (n.misestimate or 0) >= MISESTIMATE_THRESHOLD]
+    if misestimated:
+        lines.append("Ошибки оценки числа строк:")
+        for node in sorted(misestimated, key=lambda n: n.misestimate, reverse=True)[
+            :top_n
+        ]:
+            lines.append(
+                f"- {node.label}: plan={node.plan_rows:.0f} "
+                f"actual={node.actual_rows:.0f} (x{node.misestimate:.0f})"
+            )
+
+    spills = [n for n in nodes if n.spill or n.temp_written]
+    if spills:
+        lines.append("Сброс на диск:")
+        for node in spills:
+            detail = node.spill or f"temp written={node.temp_written}"
+            lines.append(f"- {node.label}: {detail}")
+
+    # Счетчики буферов в EXPLAIN накопительные: у корня — итог по всему плану
+    if root.shared_read or root.shared_hit:
+        lines.append(
+            f"Буферы (всего): shared hit={root.shared_hit} read={root.shared_read}"
+        )
+
+    outline: List[str] = []
+    _outline(root, 0, outline, max_outline)
+    lines.append("Структура плана:")
+    lines.extend(outline)
+    if len(nodes) > len(outline):
+        lines.append(f"... и еще {len(nodes) - len(outline)} узлов")
+    return "\n".join(lines)
+
+
+def compact_plan(plan: Any, threshold: int) -> str:
+    """Вернуть план для промпта: как есть, если он короткий, иначе сводку.
+
+    Если план не удалось разобрать, он возвращается без изменений.
+    """
+    if not plan:
+        return ""
+    text = plan if isinstance(plan, str) else json.dumps(plan, ensure_ascii=False)
+    if len(text) <= threshold:
+        return text
+
+    parsed = parse_plan(plan)
+    if parsed is None:
+        logger.warning("Не удалось разобрать план EXPLAIN, передается как есть")
+        return text
+
+    summary = summarize_plan(parsed)
+    if len(summary) >= len(text):
+        return text
+    logger.info("План EXPLAIN сжат: %d -> %d символов", len(text), len(summary))
+    return summary
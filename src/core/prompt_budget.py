@@ -0,0 +1,205 @@
+"""
+Распределение токенов промпта между его разделами.
+
+Каждый раздел промпта задается списком вариантов — от полного к самому
+компактному. Пока промпт не укладывается в бюджет, раздел с наименьшей
+ценностью переводится на следующий, более короткий вариант. Токены считаются
+токенизатором tiktoken; если он недоступен, используется оценка по длине
+текста. У GigaChat собственный токенизатор, поэтому счет приблизительный, но
+стабильный для сравнения размеров.
+"""
+
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from src.core.constants import PROMPT_TOKENIZER_ENCODING
+
+logger = logging.getLogger(__name__)
+
+_CHARS_PER_TOKEN = 3
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+    with _encoder_lock:
+        if not _encoder_loaded:
+            try:
+                import tiktoken
+
+                _encoder = tiktoken.get_encoding(PROMPT_TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(
+                    f"Токенизатор tiktoken недоступен, используется оценка по длине: {e}"
+                )
+                _encoder = None
+            _encoder_loaded = True
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов в тексте."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PromptSection:
+    """Раздел промпта с вариантами от полного к самому компактному.
+
+    На каждой ступени сокращения разделы с меньшим priority сокращаются первыми.
+    """
+
+    name: str
+    variants: List[str]
+    priority: int = 0
+
+
+def fit_prompt(
+    template: str,
+    fixed: Dict[str, str],
+    sections: List[PromptSection],
+    budget: int,
+) -> Tuple[str, Dict[str, Any]]:
+    """Собрать промпт из шаблона, укладываясь в бюджет токенов.
+
+    Возвращает промпт и статистику: итоговое число токенов, токены по
+    разделам и номер выбранного варианта для каждого сокращенного раздела.
+    """
+    empty = {section.name: "" for section in sections}
+    overhead = count_tokens(template.format(**fixed, **empty))
+
+    levels = {section.name: 0 for section in sections}
+    tokens = {section.name: [None] * len(section.variants) for section in sections}
+
+    def section_tokens(section: PromptSection) -> int:
+        level = levels[section.name]
+        if tokens[section.name][level] is None:
+            tokens[section.name][level] = count_tokens(section.variants[level])
+        return tokens[section.name][level]
+
+    total = overhead + sum(section_tokens(s) for s in sections)
+    while total > budget:
+        # Сначала первая ступень сокращения у всех разделов, затем вторая и т.д.
+        candidates = [s for s in sections if levels[s.name] < len(s.variants) - 1]
+        if not candidates:
+            break
+        section = min(candidates, key=lambda s: (levels[s.name], s.priority))
+        total -= section_tokens(section)
+        levels[section.name] += 1
+        total += section_tokens(section)
+
+    values = {s.name: s.variants[levels[s.name]] for s in sections}
+    prompt = template.format(**fixed, **values)
+    stats = {
+        "budget": budget,
+        "prompt_tokens": total,
+        "within_budget": total <= budget,
+        "sections": {s.name: section_tokens(s) for s in sections},
+        "trimmed": {name: level for name, level in levels.items() if level},
+    }
+    if stats["trimmed"]:
+        logger.info(
+            "Промпт сокращен до %d токенов (бюджет %d): %s",
+            total,
+            budget,
+            stats["trimmed"],
+        )
+    if not stats["within_budget"]:
+        logger.warning("Промпт превышает бюджет: %d > %d токенов", total, budget)
+    return prompt, stats
+
+
+def rules_variants(
+    retrieved_rules: List[Dict[str, Any]], with_severity: bool = False
+) -> List[str]:
+    """Варианты раздела правил: полный текст, сокращенный, только заголовки."""
+
+    def render(limit: int) -> str:
+        text = ""
+        for r in retrieved_rules:
+            body = r.get("text", "")[:limit] if limit else ""
+            if not limit:
+                body = r.get("metadata", {}).get("description", "")
+            line = f"- {r.get('title', '')}: {body}"
+            if with_severity:
+                severity = r.get("metadata", {}).get("severity_default", "medium")
+                line += f" (severity={severity})"
+            text += line + "\n"
+        return text
+
+    return [render(800), render(300), render(0), ""]
+
+
+def tables_variants(tables_summary: List[Dict[str, Any]]) -> List[str]:
+    """Варианты описания таблиц: все колонки, только индексированные, без колонок."""
+    indexed_only = []
+    for table in tables_summary:
+        columns = table.get("columns", [])
+        kept = [c for c in columns if c.get("indexed")]
+        compact = dict(table, columns=kept)
+        if len(kept) < len(columns):
+            compact["unindexed_columns_omitted"] = len(columns) - len(kept)
+        indexed_only.append(compact)
+
+    without_columns = [
+        {k: v for k, v in table.items() if k != "columns"} for table in tables_summary
+    ]
+    return [
+        json.dumps(tables_summary),
+        json.dumps(indexed_only),
+        json.dumps(without_columns),
+    ]
+
+
+_LOG_PREFIX_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}[ T][\d:.,]+(?:\s*[+-]\d{2}(?::?\d{2})?|\s+[A-Z]{2,5})?\s*"
+)
+_LOG_NUMBER_RE = re.compile(r"\d+")
+_LOG_SEVERITY_RE = re.compile(r"\b(ERROR|FATAL|PANIC|WARNING)\b")
+
+
+def dedupe_log_lines(logs: str) -> List[Tuple[str, int]]:
+    """Сгруппировать повторяющиеся строки лога.
+
+    Строки, отличающиеся только временем, PID и числами, считаются одной;
+    возвращается первая такая строка и число повторов.
+    """
+    groups: "OrderedDict[str, List]" = OrderedDict()
+    for line in logs.splitlines():
+        if not line.strip():
+            continue
+        key = _LOG_NUMBER_RE.sub("#", _LOG_PREFIX_RE.sub("", line.strip()))
+        if key in groups:
+            groups[key][1] += 1
+        else:
+            groups[key] = [line, 1]
+    return [(line, count) for line, count in groups.values()]
+
+
+def logs_variants(logs: str, tail_chars: int = 4000) -> List[str]:
+    """Варианты логов: как есть, без повторов, только ошибки, хвост."""
+
+    def render(lines: List[Tuple[str, int]]) -> str:
+        return "\n".join(
+            f"{line} (x{count})" if count > 1 else line for line, count in lines
+        )
+
+    grouped = dedupe_log_lines(logs)
+    deduped = render(grouped)
+    severe = render([g for g in grouped if _LOG_SEVERITY_RE.search(g[0])])
+    return [logs, deduped, severe or deduped, (severe or deduped)[-tail_chars:]]
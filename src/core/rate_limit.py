@@ -0,0 +1,162 @@
+"""
+Ограничение частоты запросов по алгоритму token bucket.
+
+Состояние корзин хранится в Redis и обновляется атомарно Lua-скриптом, поэтому
+лимиты общие для всех реплик. Если Redis недоступен, используются корзины в
+памяти процесса (лимит действует в пределах реплики), а к Redis сервис
+возвращается через RATE_LIMIT_REDIS_RETRY_DELAY секунд.
+
+Используется для лимитов API по клиентам (стоимость запроса зависит от
+эндпоинта) и для общего бюджета вызовов LLM в минуту.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+import redis
+
+from src.core.cache import LRUCache
+from src.core.config import settings
+from src.core.constants import (
+    RATE_LIMIT_LOCAL_MAX_BUCKETS,
+    RATE_LIMIT_REDIS_RETRY_DELAY,
+    RATE_LIMIT_REDIS_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] — корзина; ARGV: емкость, пополнение в секунду, стоимость.
+# Время берется у Redis, чтобы расхождение часов реплик не влияло на лимит.
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(retry_after), tostring(tokens)}
+"""
+
+
+class TokenBucketLimiter:
+    """Набор корзин токенов с общей емкостью и скоростью пополнения."""
+
+    key_prefix = "rate_limit:"
+
+    def __init__(
+        self,
+        name: str,
+        capacity: float,
+        refill_per_second: float,
+        redis_url: Optional[str] = None,
+    ):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.local = LRUCache(RATE_LIMIT_LOCAL_MAX_BUCKETS)
+        self._local_lock = threading.Lock()
+        self._redis_retry_at = 0.0
+        self.redis_client = None
+        self._script = None
+
+        redis_url = redis_url or settings.redis_url
+        if redis_url:
+            self.redis_client = redis.from_url(
+                redis_url,
+                socket_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+                socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+            )
+            self._script = self.redis_client.register_script(_TOKEN_BUCKET_LUA)
+
+    def _redis_available(self) -> bool:
+        return self._script is not None and time.monotonic() >= self._redis_retry_at
+
+    def _consume_redis(self, key: str, cost: float) -> Tuple[bool, float]:
+        allowed, retry_after, _ = self._script(
+            keys=[f"{self.key_prefix}{self.name}:{key}"],
+            args=[self.capacity, self.refill_per_second, cost],
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def _consume_local(self, key: str, cost: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._local_lock:
+            tokens, ts = self.local.get(key) or (self.capacity, now)
+            tokens = min(self.capacity, tokens + (now - ts) * self.refill_per_second)
+            if tokens >= cost:
+                self.local.set(key, (tokens - cost, now))
+                return True, 0.0
+            self.local.set(key, (tokens, now))
+        return False, (cost - tokens) / self.refill_per_second
+
+    def consume(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Списать cost токенов; вернуть (разрешено, через сколько секунд повторить)."""
+        # Запрос дороже емкости корзины иначе не прошел бы никогда
+        cost = min(float(cost), self.capacity)
+        if self._redis_available():
+            try:
+                return self._consume_redis(key, cost)
+            except redis.RedisError as e:
+                logger.warning(
+                    "Redis для лимитов %s недоступен, используются локальные: %s",
+                    self.name,
+                    e,
+                )
+                self._redis_retry_at = time.monotonic() + RATE_LIMIT_REDIS_RETRY_DELAY
+        return self._consume_local(key, cost)
+
+    async def aconsume(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        if self._redis_available():
+            return await asyncio.to_thread(self.consume, key, cost)
+        return self.consume(key, cost)
+
+
+_api_limiter: Optional[TokenBucketLimiter] = None
+_llm_budget: Optional[TokenBucketLimiter] = None
+_limiters_lock = threading.Lock()
+
+
+def get_api_limiter() -> TokenBucketLimiter:
+    """Лимитер запросов к API: RATE_LIMIT_REQUESTS единиц за RATE_LIMIT_WINDOW секунд."""
+    global _api_limiter
+    if _api_limiter is None:
+        with _limiters_lock:
+            if _api_limiter is None:
+                _api_limiter = TokenBucketLimiter(
+                    "api",
+                    settings.rate_limit_requests,
+                    settings.rate_limit_requests / settings.rate_limit_window,
+                )
+    return _api_limiter
+
+
+def get_llm_budget() -> Optional[TokenBucketLimiter]:
+    """Общий для реплик бюджет вызовов LLM в минуту (None — без ограничения)."""
+    global _llm_budget
+    if settings.llm_calls_per_minute <= 0:
+        return None
+    if _llm_budget is None:
+        with _limiters_lock:
+            if _llm_budget is None:
+                _llm_budget = TokenBucketLimiter(
+                    "llm",
+                    settings.llm_calls_per_minute,
+                    settings.llm_calls_per_minute / 60,
+                )
+    return _llm_budget
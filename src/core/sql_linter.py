@@ -0,0 +1,198 @@
+"""
+Статическая проверка SQL по дереву разбора PostgreSQL.
+
+Правила базы знаний, которые проверяются механически, вычисляются здесь без
+обращения к LLM. Идентификатор правила совпадает с именем файла правила в
+src/kb/rules/sql, поэтому найденные нарушения можно исключить из правил,
+передаваемых в промпт.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from pglast import ast, parse_sql, visitors
+from pglast.enums import A_Expr_Kind, SubLinkType
+from pglast.parser import ParseError
+
+logger = logging.getLogger(__name__)
+
+RULE_NO_WHERE = "03_no_where_clause"
+RULE_SELECT_STAR = "02_selective_projection"
+RULE_LEADING_WILDCARD = "10_wildcard_search_optimization"
+RULE_WINDOW_NO_PARTITION = "19_window_function_without_partition"
+RULE_HARDCODED_VALUES = "20_hardcoded_values"
+RULE_SYNTAX_ERROR = "syntax_error"
+
+_STATEMENT_NODES = (ast.SelectStmt, ast.UpdateStmt, ast.DeleteStmt, ast.InsertStmt)
+_LIKE_KINDS = (A_Expr_Kind.AEXPR_LIKE, A_Expr_Kind.AEXPR_ILIKE)
+_LIKE_OPERATORS = {"~~", "~~*"}
+
+
+def _finding(rule: str, criticality: str, content: str, recommendation: str):
+    return {
+        "content": content,
+        "criticality": criticality,
+        "recommendation": recommendation,
+        "rule": rule,
+        "source": "static",
+    }
+
+
+def _in_where_clause(ancestors) -> bool:
+    """Находится ли узел в WHERE ближайшего охватывающего оператора."""
+    while ancestors is not None and ancestors.member is not None:
+        if ancestors.member == "whereClause":
+            return True
+        if isinstance(ancestors.node, _STATEMENT_NODES):
+            return False
+        ancestors = ancestors.parent
+    return False
+
+
+def _in_exists(ancestors) -> bool:
+    while ancestors is not None and ancestors.member is not None:
+        node = ancestors.node
+        if (
+            isinstance(node, ast.SubLink)
+            and node.subLinkType == SubLinkType.EXISTS_SUBLINK
+        ):
+            return True
+        ancestors = ancestors.parent
+    return False
+
+
+class _RuleVisitor(visitors.Visitor):
+    def __init__(self):
+        super().__init__()
+        self.findings: List[Dict[str, Any]] = []
+        self.hardcoded: List[str] = []
+        self._seen = set()
+
+    def _add_once(self, key, finding):
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.findings.append(finding)
+
+    def visit_UpdateStmt(self, ancestors, node):
+        if node.whereClause is None:
+            table = node.relation.relname
+            self.findings.append(
+                _finding(
+                    RULE_NO_WHERE,
+                    "high",
+                    f"UPDATE таблицы {table} без WHERE изменит все строки",
+                    "Добавьте условие WHERE, ограничивающее изменяемые строки",
+                )
+            )
+
+    def visit_DeleteStmt(self, ancestors, node):
+        if node.whereClause is None:
+            table = node.relation.relname
+            self.findings.append(
+                _finding(
+                    RULE_NO_WHERE,
+                    "high",
+                    f"DELETE из таблицы {table} без WHERE удалит все строки",
+                    "Добавьте условие WHERE или используйте TRUNCATE осознанно",
+                )
+            )
+
+    def visit_ColumnRef(self, ancestors, node):
+        if not node.fields or not isinstance(node.fields[-1], ast.A_Star):
+            return
+        if ancestors.find_nearest(ast.ResTarget) is None or _in_exists(ancestors):
+            return
+        self._add_once(
+            RULE_SELECT_STAR,
+            _finding(
+                RULE_SELECT_STAR,
+                "medium",
+                "Используется SELECT * вместо явного списка колонок",
+                "Перечислите только нужные колонки",
+            ),
+        )
+
+    def visit_A_Expr(self, ancestors, node):
+        is_like = node.kind in _LIKE_KINDS or (
+            node.kind == A_Expr_Kind.AEXPR_OP
+            and node.name
+            and node.name[-1].sval in _LIKE_OPERATORS
+        )
+        if not is_like or not isinstance(node.rexpr, ast.A_Const):
+            return
+        value = node.rexpr.val
+        if isinstance(value, ast.String) and value.sval[:1] in ("%", "_"):
+            self.findings.append(
+                _finding(
+                    RULE_LEADING_WILDCARD,
+                    "medium",
+                    f"Поиск LIKE '{value.sval}' с ведущим шаблоном не использует B-tree индекс",
+                    "Используйте индекс pg_trgm (gin_trgm_ops) или полнотекстовый поиск",
+                )
+            )
+
+    def visit_FuncCall(self, ancestors, node):
+        over = node.over
+        if over is None or over.partitionClause or over.refname or over.name:
+            return
+        func = ".".join(n.sval for n in node.funcname)
+        self.findings.append(
+            _finding(
+                RULE_WINDOW_NO_PARTITION,
+                "low",
+                f"Оконная функция {func}() без PARTITION BY обрабатывает весь набор строк",
+                "Добавьте PARTITION BY, если окно логически разбивается на группы",
+            )
+        )
+
+    def visit_A_Const(self, ancestors, node):
+        if node.isnull or not isinstance(
+            node.val, (ast.String, ast.Integer, ast.Float)
+        ):
+            return
+        if _in_where_clause(ancestors):
+            value = node.val
+            if isinstance(value, ast.Integer):
+                self.hardcoded.append(str(value.ival))
+            elif isinstance(value, ast.Float):
+                self.hardcoded.append(value.fval)
+            else:
+                self.hardcoded.append(f"'{value.sval}'")
+
+
+def lint_sql(sql: str) -> List[Dict[str, Any]]:
+    """Проверить SQL детерминированными правилами.
+
+    Возвращает нарушения в формате errors ответа ревью (content, criticality,
+    recommendation) с идентификатором правила в поле rule.
+    """
+    try:
+        statements = parse_sql(sql)
+    except ParseError as e:
+        return [
+            _finding(
+                RULE_SYNTAX_ERROR,
+                "high",
+                f"Запрос не разобран парсером PostgreSQL: {e}",
+                "Исправьте синтаксическую ошибку",
+            )
+        ]
+
+    visitor = _RuleVisitor()
+    visitor(statements)
+
+    findings = visitor.findings
+    if visitor.hardcoded:
+        values = ", ".join(visitor.hardcoded[:5])
+        findings.append(
+            _finding(
+                RULE_HARDCODED_VALUES,
+                "low",
+                f"В условии WHERE зашиты константы ({values})",
+                "Передавайте значения параметрами ($1, $2, ...)",
+            )
+        )
+
+    logger.debug("Статическая проверка: %d замечаний", len(findings))
+    return findings
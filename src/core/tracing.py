@@ -0,0 +1,299 @@
+"""
+Трассировка запусков workflow в LangSmith и Langfuse.
+
+Решение о трассировке принимается один раз на запуск (head-based sampling) с
+долями LANGSMITH_SAMPLE_RATE и LANGFUSE_SAMPLE_RATE. Для выбранного запуска
+события LangChain только кладутся в ограниченную очередь; обработчики
+LangSmith и Langfuse вызываются в фоновом потоке пачками. При заполнении
+очереди новые трассы не начинаются, а в уже начатых отбрасываются новые
+запуски и промежуточные события, поэтому стоимость трассировки на пути запроса
+постоянна. События завершения запусков, начало которых уже передано
+обработчикам, доставляются сверх лимита: иначе обработчики держали бы
+незакрытые запуски в памяти.
+
+Обработчики и клиенты создаются один раз на процесс.
+"""
+
+import contextvars
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import get_buffer_string
+
+from src.core.config import settings
+from src.core.constants import TRACING_ADMIT_RATIO, TRACING_EXPORT_BATCH
+
+logger = logging.getLogger(__name__)
+
+if settings.langsmith_tracing:
+    # Иначе LangChain сам подключит трассировку ко всем запускам, мимо сэмплирования
+    for _var in ("LANGSMITH_TRACING", "LANGCHAIN_TRACING_V2", "LANGCHAIN_TRACING"):
+        os.environ.pop(_var, None)
+
+_EVENTS = (
+    "on_chain_start",
+    "on_chain_end",
+    "on_chain_error",
+    "on_chat_model_start",
+    "on_llm_start",
+    "on_llm_new_token",
+    "on_llm_end",
+    "on_llm_error",
+    "on_tool_start",
+    "on_tool_end",
+    "on_tool_error",
+    "on_retriever_start",
+    "on_retriever_end",
+    "on_retriever_error",
+    "on_retry",
+    "on_text",
+    "on_custom_event",
+)
+
+
+class _QueuedTracer(BaseCallbackHandler):
+    """Обработчик одного запуска: события передаются в очередь экспорта."""
+
+    # Вызывается прямо в цикле событий: постановка в очередь не блокирует
+    run_inline = True
+    raise_error = False
+
+    def __init__(self, exporter: "TraceExporter", handlers: List[Any]):
+        self.exporter = exporter
+        self.handlers = handlers
+        # Свой контекст на трассу, как у отдельной задачи asyncio
+        self.context = contextvars.copy_context()
+        self.dropped = False
+        # Запуски, начало которых передано в очередь
+        self.open_runs: Set[Any] = set()
+
+    def _submit(self, event: str, args: tuple, kwargs: Dict[str, Any]):
+        item = (self, event, args, kwargs)
+        run_id = kwargs.get("run_id")
+        if event.endswith(("_end", "_error")):
+            if run_id in self.open_runs:
+                self.open_runs.discard(run_id)
+                self.exporter.submit(item, force=True)
+            return
+        if self.dropped:
+            return
+        if not self.exporter.submit(item):
+            self.dropped = True
+            self.exporter.count("dropped_traces")
+        elif event.endswith("_start"):
+            self.open_runs.add(run_id)
+
+
+def _forwarder(event: str):
+    def forward(self, *args, **kwargs):
+        self._submit(event, args, kwargs)
+
+    forward.__name__ = event
+    return forward
+
+
+for _event in _EVENTS:
+    setattr(_QueuedTracer, _event, _forwarder(_event))
+
+
+class TraceExporter:
+    """Ограниченная очередь событий трассировки и фоновый поток экспорта."""
+
+    def __init__(self, max_events: int):
+        # Лимит проверяется в submit: события завершения могут его превысить
+        self.queue: "queue.Queue" = queue.Queue()
+        self.max_events = max(1, max_events)
+        self.admit_limit = max(1, int(self.max_events * TRACING_ADMIT_RATIO))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._handlers: Optional[Dict[str, Any]] = None
+        self._counters = {
+            "sampled_traces": 0,
+            "unsampled_traces": 0,
+            "dropped_traces": 0,
+            "dropped_events": 0,
+            "exported_events": 0,
+            "export_errors": 0,
+        }
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _backends(self) -> Dict[str, Any]:
+        """Обработчики включенных систем трассировки (создаются один раз)."""
+        if self._handlers is None:
+            with self._lock:
+                if self._handlers is None:
+                    self._handlers = _create_handlers()
+        return self._handlers
+
+    def callbacks(self) -> List[BaseCallbackHandler]:
+        """Обработчики для нового запуска ([] — запуск не трассируется)."""
+        rates = {
+            "langsmith": settings.langsmith_sample_rate,
+            "langfuse": settings.langfuse_sample_rate,
+        }
+        if not any(
+            getattr(settings, f"{name}_tracing") and rate > 0
+            for name, rate in rates.items()
+        ):
+            return []
+
+        # Одна случайная величина на запуск: при разных долях трассы системы
+        # с меньшей долей — подмножество трасс системы с большей
+        draw = random.random()
+        handlers = [
+            handler for name, handler in self._backends().items() if draw < rates[name]
+        ]
+        if not handlers:
+            self.count("unsampled_traces")
+            return []
+        if self.queue.qsize() >= self.admit_limit:
+            self.count("dropped_traces")
+            return []
+
+        self._ensure_worker()
+        self.count("sampled_traces")
+        return [_QueuedTracer(self, handlers)]
+
+    def submit(self, item: tuple, force: bool = False) -> bool:
+        """Поставить событие в очередь; force — без учета лимита очереди."""
+        if not force and self.queue.qsize() >= self.max_events:
+            self.count("dropped_events")
+            return False
+        self.queue.put_nowait(item)
+        return True
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-exporter", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < TRACING_EXPORT_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                try:
+                    self._export(*item)
+                finally:
+                    self.queue.task_done()
+            self.count("exported_events", len(batch))
+
+    def _export(self, tracer: _QueuedTracer, event: str, args: tuple, kwargs):
+        for handler in tracer.handlers:
+            try:
+                tracer.context.run(_dispatch, handler, event, args, kwargs)
+            except Exception as e:
+                self.count("export_errors")
+                logger.debug("Ошибка экспорта трассировки %s: %s", event, e)
+
+    def flush(self, timeout: float) -> bool:
+        """Дождаться отправки очереди обработчикам (не дольше timeout секунд)."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if self._thread is None or time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queued_events"] = self.queue.qsize()
+        stats["max_events"] = self.max_events
+        return stats
+
+
+def _dispatch(handler: Any, event: str, args: tuple, kwargs: Dict[str, Any]):
+    if event == "on_chat_model_start":
+        try:
+            handler.on_chat_model_start(*args, **kwargs)
+        except NotImplementedError:
+            # Как в CallbackManager: обработчик без поддержки чатов получает текст
+            serialized, messages = args[0], args[1]
+            handler.on_llm_start(
+                serialized, [get_buffer_string(m) for m in messages], **kwargs
+            )
+        return
+    getattr(handler, event)(*args, **kwargs)
+
+
+def _create_handlers() -> Dict[str, Any]:
+    handlers: Dict[str, Any] = {}
+    if settings.langsmith_tracing and settings.langsmith_sample_rate > 0:
+        from langchain_core.tracers.langchain import LangChainTracer
+        from langsmith import Client
+
+        handlers["langsmith"] = LangChainTracer(
+            project_name=settings.langsmith_project,
+            client=Client(
+                api_url=settings.langsmith_endpoint,
+                api_key=settings.langsmith_api_key,
+            ),
+        )
+    if settings.langfuse_tracing and settings.langfuse_sample_rate > 0:
+        from langfuse import Langfuse
+        from langfuse.langchain import CallbackHandler
+
+        Langfuse(
+            public_key=settings.langfuse_public_key,
+            secret_key=settings.langfuse_secret_key,
+            host=settings.langfuse_host,
+        )
+        handlers["langfuse"] = CallbackHandler(public_key=settings.langfuse_public_key)
+    return handlers
+
+
+_exporter: Optional[TraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def get_trace_exporter() -> TraceExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = TraceExporter(settings.tracing_queue_size)
+    return _exporter
+
+
+def trace_callbacks() -> List[BaseCallbackHandler]:
+    """Обработчики трассировки для запуска workflow."""
+    return get_trace_exporter().callbacks()
+
+
+def shutdown_tracing(timeout: float):
+    """Отправить накопленные события и данные клиентов трассировки."""
+    exporter = _exporter
+    if exporter is None or exporter._handlers is None:
+        return
+    if not exporter.flush(timeout):
+        logger.warning(
+            "Не все события трассировки отправлены: %d в очереди",
+            exporter.queue.qsize(),
+        )
+    if "langsmith" in exporter._handlers:
+        from langchain_core.tracers.langchain import wait_for_all_tracers
+
+        wait_for_all_tracers()
+    if "langfuse" in exporter._handlers:
+        from langfuse import get_client
+
+        get_client().flush()
@@ -16,8 +16,13 @@ class AgentState(TypedDict):
     prompt: str
     response: str
     result: Dict[str, Any]
-    chat_history: List[Dict[str, str]]
+    chat_history: List[Dict[str, Any]]
+    chat_summary: str
     environment: str
+    parse_failed: bool
+    prompt_stats: Dict[str, Any]
+    fast_mode: bool
+    static_findings: List[Dict[str, Any]]
 
 
 class ConfigAgentState(TypedDict):
@@ -30,6 +35,8 @@ class ConfigAgentState(TypedDict):
     response: str
     result: Dict[str, Any]
     environment: str
+    parse_failed: bool
+    prompt_stats: Dict[str, Any]
 
 
 class LogsAgentState(TypedDict):
@@ -42,6 +49,8 @@ class LogsAgentState(TypedDict):
     response: str
     result: Dict[str, Any]
     environment: str
+    parse_failed: bool
+    prompt_stats: Dict[str, Any]
 
 
 class WorkflowResult(TypedDict):
@@ -1,84 +1,101 @@
 import json
-import re
+from typing import Any, Optional, Tuple
 
+_CLOSERS = {"{": "}", "[": "]"}
 
-def _find_json_objects(text: str) -> list:
-    """Найти JSON объекты {} в тексте."""
-    candidates = []
-    brace_count = 0
-    start_pos = -1
+# Сколько раз можно начать поиск заново внутри неудачного кандидата
+_MAX_RESTARTS = 8
 
-    for i, char in enumerate(text):
-        if char == "{":
-            if brace_count == 0:
-                start_pos = i
-            brace_count += 1
-        elif char == "}":
-            brace_count -= 1
-            if brace_count == 0 and start_pos != -1:
-                candidate = text[start_pos : i + 1]
-                candidates.append(candidate)
-                start_pos = -1
 
-    return candidates
+def _is_preferred(value: Any) -> bool:
+    """Объект или массив объектов, а не ссылка вида «[1]» в тексте."""
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, list) and any(isinstance(v, dict) for v in value)
 
 
-def _find_json_arrays(text: str) -> list:
-    """Найти JSON массивы [] в тексте."""
-    candidates = []
-    bracket_count = 0
-    start_pos = -1
+def _scan_json(
+    text: str, pos: int = 0
+) -> Tuple[Optional[Tuple[int, int, Any]], int, Optional[Tuple[int, int, Any]]]:
+    """Найти первый JSON-объект или массив объектов за один проход.
 
-    for i, char in enumerate(text):
-        if char == "[":
-            if bracket_count == 0:
-                start_pos = i
-            bracket_count += 1
-        elif char == "]":
-            bracket_count -= 1
-            if bracket_count == 0 and start_pos != -1:
-                candidate = text[start_pos : i + 1]
-                candidates.append(candidate)
-                start_pos = -1
-
-    return candidates
-
-
-def _validate_json_candidates(candidates: list) -> str | None:
-    """Проверить кандидатов на валидность JSON."""
-    for candidate in candidates:
-        try:
-            json.loads(candidate)
-            return candidate
-        except json.JSONDecodeError:
-            continue
-    return None
-
-
-def safe_extract_json(text: str) -> str:
-    """Попытка извлечь JSON-объект или массив из текста ответа LLM.
-    Поддерживает как одиночные объекты {}, так и массивы [{}].
+    Скобки внутри строк JSON (с учетом экранирования) не учитываются. Каждый
+    сбалансированный кандидат декодируется один раз. Возвращает (начало,
+    конец, значение), позицию для повторного поиска, если найден только
+    некорректный кандидат (например, «[см. ниже» перед настоящим JSON), и
+    первый пустой массив — он используется, только если объекта нет.
+    Массивы скаляров («[1]» в тексте) пропускаются.
     """
-    # Очистка текста от markdown
-    text = re.sub(r"```json\s*", "", text)
-    text = re.sub(r"```\s*", "", text)
-    text = text.strip()
-
-    # Собираем всех кандидатов
-    candidates = []
-    candidates.extend(_find_json_objects(text))
-    candidates.extend(_find_json_arrays(text))
+    fallback = None
+    stack = []
+    start = -1
+    restart = -1
+    in_string = escaped = False
+
+    for i in range(pos, len(text)):
+        ch = text[i]
+        if not stack:
+            if ch in _CLOSERS:
+                stack.append(_CLOSERS[ch])
+                start = i
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            if ch != stack[-1]:
+                stack.clear()
+                restart = start + 1 if restart < 0 else restart
+                continue
+            stack.pop()
+            if not stack:
+                try:
+                    value = json.loads(text[start : i + 1])
+                except json.JSONDecodeError:
+                    restart = start + 1 if restart < 0 else restart
+                    continue
+                if _is_preferred(value):
+                    return (start, i + 1, value), -1, fallback
+                if fallback is None and value == []:
+                    fallback = (start, i + 1, value)
+
+    if stack and restart < 0:
+        restart = start + 1
+    return None, restart, fallback
+
+
+def _find_json(text: str) -> Tuple[int, int, Any]:
+    if not isinstance(text, str):
+        raise TypeError(f"Ожидалась строка, получено {type(text).__name__}")
+    pos = 0
+    first_fallback = None
+    for _ in range(_MAX_RESTARTS + 1):
+        found, pos, fallback = _scan_json(text, pos)
+        if found is not None:
+            return found
+        first_fallback = first_fallback or fallback
+        if pos < 0:
+            break
+    # Других кандидатов нет: например, ответ «[]» без замечаний
+    if first_fallback is not None:
+        return first_fallback
+    raise ValueError("Не удалось найти валидный JSON объект или массив")
 
-    # Проверяем кандидатов
-    result = _validate_json_candidates(candidates)
-    if result:
-        return result
 
-    # Если не нашли валидный JSON, попробуем весь текст как JSON
-    try:
-        json.loads(text)
-        return text
-    except json.JSONDecodeError:
-        pass
+def extract_json(text: str) -> Any:
+    """Извлечь из ответа LLM первый валидный JSON-объект или массив.
 
-    raise ValueError("Не удалось найти валидный JSON объект или массив")
+    Массивы скаляров (ссылки «[1]» в тексте) пропускаются, пустой массив
+    возвращается, только если объекта в ответе нет. Возвращает уже
+    разобранное значение; ValueError, если JSON не найден.
+    """
+    return _find_json(text)[2]
@@ -0,0 +1,92 @@
+"""
+Объединение одинаковых одновременных вызовов (single-flight).
+
+Пока вызов с некоторым ключом выполняется, повторные вызовы с тем же ключом
+не запускают работу заново, а дожидаются результата (или исключения)
+первого вызова.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def count(self, shared: bool):
+        with self._lock:
+            self.calls += 1
+            if shared:
+                self.shared += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
+
+class SingleFlight:
+    """Single-flight для синхронных вызовов из разных потоков."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.counters = _Counters()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        self.counters.count(shared=not leader)
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class AsyncSingleFlight:
+    """Single-flight для корутин одного цикла событий.
+
+    Вызов выполняется в отдельной задаче: отмена первого ожидающего (например,
+    при разрыве соединения клиента) не отменяет вызов для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.counters = _Counters()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        shared = task is not None and task.get_loop() is loop
+        if not shared:
+            task = loop.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        self.counters.count(shared=shared)
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Исключение могли не забрать, если все ожидающие были отменены
+            task.exception()
@@ -0,0 +1,306 @@
+"""
+Нормализация и отпечатки SQL-запросов.
+
+Нормализация повторяет идею pg_stat_statements: литералы заменяются
+параметрами $1, $2, ..., комментарии и лишние пробелы удаляются, регистр
+ключевых слов и идентификаторов без кавычек не учитывается. Дополнительно
+списки констант в IN (...) и ARRAY[...] схлопываются, чтобы запросы с
+разным числом значений считались одним и тем же запросом.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+PLACEHOLDER = "$?"
+COLLAPSED_LIST = "..."
+
+_OPERATOR_CHARS = set("+-*/<>=~!@#%^&|`?")
+_PUNCTUATION = set("(),;[].:")
+_STRING_PREFIXES = ("e", "b", "x", "n")
+_NO_SPACE_BEFORE = {",", ")", "]", ".", "::", ";", "["}
+_NO_SPACE_AFTER = {"(", "[", ".", "::"}
+_UNARY_CONTEXT = {"(", ",", "=", "<", ">", "<=", ">=", "<>", "!=", "[", None}
+_LIKE_OPERATORS = {"like", "ilike", "~~", "~~*", "!~~", "!~~*"}
+
+
+@dataclass(frozen=True)
+class SQLFingerprint:
+    """Отпечаток SQL-запроса."""
+
+    normalized: str
+    fingerprint: str
+    query_id: int
+
+
+def _read_quoted(sql: str, start: int, quote: str, backslash: bool) -> int:
+    """Вернуть позицию после закрывающей кавычки."""
+    i = start + 1
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if backslash and char == "\\":
+            i += 2
+            continue
+        if char == quote:
+            if i + 1 < length and sql[i + 1] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return length
+
+
+def _read_dollar_tag(sql: str, start: int) -> Optional[str]:
+    """Прочитать тег $tag$ начиная с позиции start, если он там есть."""
+    end = start + 1
+    while end < len(sql) and (sql[end].isalnum() or sql[end] == "_"):
+        end += 1
+    if end < len(sql) and sql[end] == "$" and not sql[start + 1 : end][:1].isdigit():
+        return sql[start : end + 1]
+    return None
+
+
+def _like_shape(literal: str) -> str:
+    """Сохранить положение шаблонов % в строке LIKE, отбросив само значение."""
+    body = literal.strip("'")
+    prefix = "%" if body.startswith("%") else ""
+    suffix = "%" if len(body) > 1 and body.endswith("%") else ""
+    return f"'{prefix}?{suffix}'"
+
+
+def _tokenize(sql: str, keep_like_shape: bool) -> List[str]:
+    tokens: List[str] = []
+    i = 0
+    length = len(sql)
+
+    def previous() -> Optional[str]:
+        return tokens[-1] if tokens else None
+
+    def add_constant(literal: str = ""):
+        if (
+            keep_like_shape
+            and literal.startswith("'")
+            and previous() in _LIKE_OPERATORS
+        ):
+            tokens.append(_like_shape(literal))
+            return
+        if previous() == "-" and (len(tokens) < 2 or tokens[-2] in _UNARY_CONTEXT):
+            tokens.pop()
+        tokens.append(PLACEHOLDER)
+
+    while i < length:
+        char = sql[i]
+
+        if char.isspace():
+            i += 1
+            continue
+
+        if sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = length if newline == -1 else newline + 1
+            continue
+
+        if sql.startswith("/*", i):
+            depth = 0
+            while i < length:
+                if sql.startswith("/*", i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith("*/", i):
+                    depth -= 1
+                    i += 2
+                    if depth == 0:
+                        break
+                else:
+                    i += 1
+            continue
+
+        if char == "'":
+            end = _read_quoted(sql, i, "'", backslash=False)
+            add_constant(sql[i:end])
+            i = end
+            continue
+
+        if (
+            char.lower() in _STRING_PREFIXES
+            and i + 1 < length
+            and sql[i + 1] == "'"
+            and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] == "_"))
+        ):
+            end = _read_quoted(sql, i + 1, "'", backslash=char.lower() == "e")
+            add_constant(sql[i + 1 : end])
+            i = end
+            continue
+
+        if char == '"':
+            end = _read_quoted(sql, i, '"', backslash=False)
+            tokens.append(sql[i:end])
+            i = end
+            continue
+
+        if char == "$":
+            if i + 1 < length and sql[i + 1].isdigit():
+                end = i + 1
+                while end < length and sql[end].isdigit():
+                    end += 1
+                add_constant()
+                i = end
+                continue
+            tag = _read_dollar_tag(sql, i)
+            if tag:
+                close = sql.find(tag, i + len(tag))
+                add_constant()
+                i = length if close == -1 else close + len(tag)
+                continue
+
+        if char.isdigit() or (char == "." and i + 1 < length and sql[i + 1].isdigit()):
+            end = i
+            while end < length and (sql[end].isdigit() or sql[end] in "._"):
+                end += 1
+            if end < length and sql[end] in "eE":
+                exponent = end + 1
+                if exponent < length and sql[exponent] in "+-":
+                    exponent += 1
+                if exponent < length and sql[exponent].isdigit():
+                    end = exponent
+                    while end < length and sql[end].isdigit():
+                        end += 1
+            add_constant()
+            i = end
+            continue
+
+        if char.isalpha() or char == "_" or ord(char) > 127:
+            end = i
+            while end < length and (
+                sql[end].isalnum() or sql[end] in "_$" or ord(sql[end]) > 127
+            ):
+                end += 1
+            tokens.append(sql[i:end].lower())
+            i = end
+            continue
+
+        if sql.startswith("::", i):
+            tokens.append("::")
+            i += 2
+            continue
+
+        if char in _PUNCTUATION:
+            tokens.append(char)
+            i += 1
+            continue
+
+        if char in _OPERATOR_CHARS:
+            end = i
+            while end < length and sql[end] in _OPERATOR_CHARS:
+                if sql.startswith("--", end) or sql.startswith("/*", end):
+                    break
+                end += 1
+            tokens.append(sql[i:end])
+            i = end
+            continue
+
+        tokens.append(char)
+        i += 1
+
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return tokens
+
+
+def _collapse_lists(tokens: List[str]) -> List[str]:
+    """Схлопнуть списки констант в IN (...) и ARRAY[...]."""
+    result: List[str] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        opener = None
+        if token == "in" and i + 1 < len(tokens) and tokens[i + 1] == "(":
+            opener, closer = "(", ")"
+        elif token == "array" and i + 1 < len(tokens) and tokens[i + 1] == "[":
+            opener, closer = "[", "]"
+
+        if opener:
+            j = i + 2
+            only_constants = True
+            while j < len(tokens) and tokens[j] != closer:
+                if tokens[j] not in (PLACEHOLDER, ","):
+                    only_constants = False
+                    break
+                j += 1
+            if only_constants and j < len(tokens) and j > i + 2:
+                result.extend([token, opener, COLLAPSED_LIST, closer])
+                i = j + 1
+                continue
+
+        result.append(token)
+        i += 1
+    return result
+
+
+def _render(tokens: Iterable[str]) -> str:
+    parts: List[str] = []
+    counter = 0
+    prev = None
+    for token in tokens:
+        if token == PLACEHOLDER:
+            counter += 1
+            token = f"${counter}"
+        if parts and token not in _NO_SPACE_BEFORE and prev not in _NO_SPACE_AFTER:
+            parts.append(" ")
+        parts.append(token)
+        prev = token
+    return "".join(parts)
+
+
+def normalize_sql(sql: str, keep_like_shape: bool = False) -> str:
+    """Нормализовать SQL: убрать литералы, комментарии и лишние пробелы.
+
+    keep_like_shape сохраняет положение % в шаблонах LIKE: для ревью
+    '%abc' и 'abc%' — разные запросы, хотя pg_stat_statements их объединяет.
+    """
+    if not sql:
+        return ""
+    return _render(_collapse_lists(_tokenize(sql, keep_like_shape)))
+
+
+def fingerprint_sql(sql: str) -> SQLFingerprint:
+    """Построить отпечаток запроса по его нормализованному тексту."""
+    normalized = normalize_sql(sql)
+    digest = hashlib.sha256(normalized.encode("utf-8")).digest()
+    query_id = int.from_bytes(digest[:8], "big", signed=True)
+    return SQLFingerprint(
+        normalized=normalized, fingerprint=digest[:8].hex(), query_id=query_id
+    )
+
+
+def group_by_fingerprint(
+    rows: Iterable[Dict[str, Any]],
+    sql_key: str = "query",
+    sum_keys: Iterable[str] = ("calls", "total_exec_time", "rows"),
+) -> List[Dict[str, Any]]:
+    """Объединить строки с одинаковым отпечатком запроса, суммируя счетчики.
+
+    Порядок групп соответствует первому появлению запроса.
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        fp = fingerprint_sql(row.get(sql_key) or "")
+        group = groups.get(fp.fingerprint)
+        if group is None:
+            group = dict(row)
+            group["fingerprint"] = fp.fingerprint
+            group["normalized_query"] = fp.normalized
+            group["duplicates"] = 0
+            groups[fp.fingerprint] = group
+            continue
+
+        group["duplicates"] += 1
+        for key in sum_keys:
+            if row.get(key) is not None:
+                group[key] = (group.get(key) or 0) + row[key]
+
+    for group in groups.values():
+        if group.get("calls") and group.get("total_exec_time") is not None:
+            group["mean_exec_time"] = group["total_exec_time"] / group["calls"]
+    return list(groups.values())
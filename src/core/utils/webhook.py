@@ -0,0 +1,84 @@
+"""
+Проверка адресов webhook, заданных клиентами API.
+
+Запрос на webhook отправляет воркер изнутри сети, поэтому адрес клиента не
+должен указывать на внутренние сервисы: допускаются только http(s) и либо
+хосты из JOB_WEBHOOK_ALLOWED_HOSTS, либо (если список пуст) хосты с
+публичными адресами. Запрос отправляется на IP, проверенный при разрешении
+имени: иначе DNS мог бы вернуть другой адрес при подключении (DNS rebinding).
+"""
+
+import asyncio
+import ipaddress
+import socket
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.core.config import settings
+
+
+def _allowed_hosts() -> set:
+    return {
+        h.strip().lower()
+        for h in settings.job_webhook_allowed_hosts.split(",")
+        if h.strip()
+    }
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_webhook_url(url: str) -> Optional[str]:
+    """Проверить адрес webhook (ValueError, если на него нельзя отправлять).
+
+    Возвращает проверенный IP хоста или None для хоста из списка разрешенных.
+    Имя хоста разрешается в DNS, поэтому функцию нельзя вызывать в цикле
+    событий напрямую.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError("webhook_url должен использовать схему http или https")
+    host = (parts.hostname or "").lower()
+    if not host:
+        raise ValueError("В webhook_url не указан хост")
+    if parts.username or parts.password:
+        raise ValueError("webhook_url не должен содержать учетные данные")
+
+    allowed = _allowed_hosts()
+    if allowed:
+        if host not in allowed:
+            raise ValueError(f"Хост webhook {host} не входит в список разрешенных")
+        return None
+
+    try:
+        infos = socket.getaddrinfo(host, parts.port or 443, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Не удалось разрешить хост webhook {host}: {e}")
+    if not infos or not all(_is_public(info[4][0]) for info in infos):
+        raise ValueError(f"Хост webhook {host} указывает на внутренний адрес")
+    return infos[0][4][0]
+
+
+async def post_webhook(
+    url: str, payload: Dict[str, Any], timeout: float
+) -> httpx.Response:
+    """Проверить адрес и отправить на него webhook без перехода по редиректам."""
+    address = await asyncio.to_thread(validate_webhook_url, url)
+    target = httpx.URL(url)
+    headers: Dict[str, str] = {}
+    extensions: Dict[str, Any] = {}
+    if address is not None and address != target.host:
+        # Подключение к проверенному IP, имя хоста — в Host и SNI (для TLS)
+        headers["Host"] = target.netloc.decode("ascii")
+        extensions["sni_hostname"] = target.raw_host.decode("ascii")
+        target = target.copy_with(host=address)
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=False) as client:
+        response = await client.post(
+            target, json=payload, headers=headers, extensions=extensions
+        )
+    response.raise_for_status()
+    return response
@@ -2,116 +2,447 @@
 Определения workflow для различных типов анализа.
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.config import get_stream_writer
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from src.core.chat_history import window_history
+from src.core.checkpoint import create_checkpointer
 from src.core.types import AgentState, ConfigAgentState, LogsAgentState
-from src.core.utils.json_helper import safe_extract_json
+from src.core.llm_result import parse_llm_result, validate_result
+from src.core.utils.json_helper import extract_json
+from src.core.utils.sql_fingerprint import normalize_sql
+from src.core.sql_linter import lint_sql
+from src.core.plan_parser import compact_plan
+from src.core.prompt_budget import (
+    PromptSection,
+    count_tokens,
+    fit_prompt,
+    logs_variants,
+    rules_variants,
+    tables_variants,
+)
+from src.core.scoring import compute_overall_score
 from src.core.agents.prompt_templates import (
     BASE_PROMPT_TEMPLATE,
+    PACKED_PROMPT_TEMPLATE,
     SYSTEM_REVIEWER_PROMPT,
     CONFIG_ANALYZE_TEMPLATE,
     LOGS_ANALYZE_TEMPLATE,
 )
-from langfuse.langchain import CallbackHandler
+from src.core.tracing import trace_callbacks
 
 logger = logging.getLogger(__name__)
 from src.core.config import settings
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
 
 
-class SQLReviewWorkflow:
-    """Workflow для анализа SQL запросов."""
+class BaseWorkflow:
+    """Общая логика запуска графа в синхронном и асинхронном режимах."""
+
+    default_thread_id = "default"
+    cache_kind = ""
+    # Узлы, которые формируют итоговый результат. Узлы возвращают состояние
+    # целиком, и в продолженном потоке в нем есть result прошлого запуска
+    result_nodes: Tuple[str, ...] = ()
 
-    def __init__(self, llm_service, store):
+    def __init__(self, llm_service, store, cache=None, router=None):
         self.llm_service = llm_service
         self.store = store
+        self.cache = cache
+        self.router = router
+        self.checkpointer = create_checkpointer(self.cache_kind)
         self.graph = self._build_graph()
 
+    def _build_graph(self):
+        raise NotImplementedError
+
+    def _cache_payload(self, initial_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Нормализованные входные данные для ключа кэша (None — не кэшировать)."""
+        return None
+
+    def _cache_key(self, initial_state: Dict[str, Any]) -> Optional[str]:
+        if self.cache is None:
+            return None
+        payload = self._cache_payload(initial_state)
+        if payload is None:
+            return None
+        model = self.llm_service.model_name
+        if self.router is not None and self.router.enabled:
+            # Результат зависит и от легкой модели, на которую может уйти запрос
+            model = f"{model}+{self.router.light_model}"
+        return self.cache.make_key(
+            self.cache_kind,
+            payload,
+            model,
+            getattr(self.store, "index_version", ""),
+        )
+
+    def _route(self, state: Dict[str, Any], has_plan: bool = False):
+        """Модель для вызова LLM по окружению и размеру промпта (None — основная)."""
+        if self.router is None:
+            return None
+        stats = state.get("prompt_stats") or {}
+        tokens = stats.get("request_tokens") or stats.get("prompt_tokens")
+        if tokens is None:
+            tokens = count_tokens(state.get("prompt") or "")
+        route = self.router.select(
+            self.cache_kind, state.get("environment"), tokens, has_plan
+        )
+        logger.debug(
+            "Маршрут LLM %s: %s (%s токенов)", route.name, route.model_name, tokens
+        )
+        return route
+
+    def _continues_thread(self, initial_state: Dict[str, Any], thread_id: str) -> bool:
+        """Продолжает ли запуск поток с историей диалога (такие не кэшируются)."""
+        return False
+
+    async def _acontinues_thread(
+        self, initial_state: Dict[str, Any], thread_id: str
+    ) -> bool:
+        return False
+
+    def _thread_cache_key(
+        self, initial_state: Dict[str, Any], thread_id: str
+    ) -> Optional[str]:
+        cache_key = self._cache_key(initial_state)
+        if cache_key and self._continues_thread(initial_state, thread_id):
+            return None
+        return cache_key
+
+    async def _athread_cache_key(
+        self, initial_state: Dict[str, Any], thread_id: str
+    ) -> Optional[str]:
+        cache_key = self._cache_key(initial_state)
+        if cache_key and await self._acontinues_thread(initial_state, thread_id):
+            return None
+        return cache_key
+
+    def _run_config(self, thread_id: str = None) -> Dict[str, Any]:
+        return {
+            "configurable": {"thread_id": thread_id or self.default_thread_id},
+            "callbacks": trace_callbacks(),
+        }
+
+    def execute(
+        self, initial_state: Dict[str, Any], thread_id: str = None
+    ) -> Dict[str, Any]:
+        cache_key = self._thread_cache_key(initial_state, thread_id)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("Результат %s взят из кэша", self.cache_kind)
+                return cached
+
+        final_state = self.graph.invoke(
+            initial_state, config=self._run_config(thread_id)
+        )
+        if cache_key and not final_state.get("parse_failed"):
+            self.cache.set(cache_key, final_state["result"])
+        return final_state["result"]
+
+    async def aexecute(
+        self, initial_state: Dict[str, Any], thread_id: str = None
+    ) -> Dict[str, Any]:
+        """Асинхронный запуск графа: вызов LLM не блокирует цикл событий."""
+        cache_key = await self._athread_cache_key(initial_state, thread_id)
+        if cache_key:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                logger.info("Результат %s взят из кэша", self.cache_kind)
+                return cached
+
+        final_state = await self.graph.ainvoke(
+            initial_state, config=self._run_config(thread_id)
+        )
+        if cache_key and not final_state.get("parse_failed"):
+            await self.cache.aset(cache_key, final_state["result"])
+        return final_state["result"]
+
+    def _stage_event(
+        self, node: str, update: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Событие потока для завершившегося узла графа (None — не отправлять)."""
+        return None
+
+    async def astream_events(
+        self, initial_state: Dict[str, Any], thread_id: str = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Запуск графа с отдачей событий по мере прохождения этапов.
+
+        События имеют вид {"event": ..., "data": ...}; последним приходит
+        событие "result" с итоговым результатом анализа.
+        """
+        cache_key = await self._athread_cache_key(initial_state, thread_id)
+        if cache_key:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                logger.info("Результат %s взят из кэша", self.cache_kind)
+                yield {"event": "result", "data": cached, "cached": True}
+                return
+
+        config = self._run_config(thread_id)
+        config["configurable"]["stream_tokens"] = True
+
+        final_update: Dict[str, Any] = {}
+        async for mode, chunk in self.graph.astream(
+            initial_state, config=config, stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                yield chunk
+                continue
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue
+                if node in self.result_nodes:
+                    final_update = update
+                    continue
+                event = self._stage_event(node, update)
+                if event is not None:
+                    yield event
+
+        if cache_key and final_update and not final_update.get("parse_failed"):
+            await self.cache.aset(cache_key, final_update["result"])
+        yield {"event": "result", "data": final_update.get("result", {})}
+
+
+class SQLReviewWorkflow(BaseWorkflow):
+    """Workflow для анализа SQL запросов."""
+
+    cache_kind = "sql"
+    result_nodes = ("static_result", "parse_response")
+
+    def _cache_payload(self, initial_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return {
+            "sql": normalize_sql(initial_state["sql"], keep_like_shape=True),
+            "query_plan": (initial_state.get("query_plan") or "").strip(),
+            "tables": initial_state.get("tables") or [],
+            "server_info": initial_state.get("server_info") or {},
+            "environment": initial_state.get("environment"),
+            "fast_mode": bool(initial_state.get("fast_mode")),
+        }
+
+    def _continues_thread(self, initial_state: Dict[str, Any], thread_id: str) -> bool:
+        if not thread_id or "chat_history" in initial_state:
+            return False
+        snapshot = self.graph.get_state({"configurable": {"thread_id": thread_id}})
+        return bool(snapshot.values.get("chat_history"))
+
+    async def _acontinues_thread(
+        self, initial_state: Dict[str, Any], thread_id: str
+    ) -> bool:
+        if not thread_id or "chat_history" in initial_state:
+            return False
+        snapshot = await self.graph.aget_state(
+            {"configurable": {"thread_id": thread_id}}
+        )
+        return bool(snapshot.values.get("chat_history"))
+
     def _build_graph(self):
         graph = StateGraph(AgentState)
+        graph.add_node("lint", self._lint_node)
+        graph.add_node("static_result", self._static_result_node)
         graph.add_node("retrieve_rules", self._retrieve_rules_node)
         graph.add_node("compose_prompt", self._compose_prompt_node)
-        graph.add_node("call_llm", self._call_llm_node)
+        graph.add_node(
+            "call_llm",
+            RunnableLambda(self._call_llm_node, afunc=self._acall_llm_node),
+        )
         graph.add_node("parse_response", self._parse_response_node)
 
-        graph.add_edge(START, "retrieve_rules")
+        graph.add_edge(START, "lint")
+        graph.add_conditional_edges(
+            "lint",
+            lambda state: "static_result" if state.get("fast_mode") else "llm",
+            {"static_result": "static_result", "llm": "retrieve_rules"},
+        )
+        graph.add_edge("static_result", END)
         graph.add_edge("retrieve_rules", "compose_prompt")
         graph.add_edge("compose_prompt", "call_llm")
         graph.add_edge("call_llm", "parse_response")
         graph.add_edge("parse_response", END)
 
-        return graph.compile(checkpointer=MemorySaver())
+        return graph.compile(checkpointer=self.checkpointer)
+
+    def _lint_node(self, state: AgentState) -> AgentState:
+        state["static_findings"] = lint_sql(state["sql"])
+        return state
+
+    def _static_result_node(self, state: AgentState) -> AgentState:
+        """Итог быстрого режима: только статическая проверка, без LLM."""
+        findings = state["static_findings"]
+        state["parse_failed"] = False
+        state["result"] = {
+            "errors": findings,
+            "overall_score": round(
+                compute_overall_score(findings, state.get("environment", "test"))
+            ),
+            "notes": (
+                "Быстрая статическая проверка без LLM"
+                if findings
+                else "Статическая проверка замечаний не выявила"
+            ),
+            "analysis_summary": {"mode": "fast"},
+        }
+        return state
 
     def _retrieve_rules_node(self, state: AgentState) -> AgentState:
         retrieved_rules = self._retrieve_rules(state["sql"])
-        logger.info(f"RETRIEVED RULES: {retrieved_rules}")
+        # Правила, уже проверенные статически, не нужно повторно отдавать LLM
+        fired = {f["rule"] for f in state.get("static_findings") or []}
+        retrieved_rules = [r for r in retrieved_rules if r.get("title") not in fired]
+        logger.debug("Найденные правила: %s", retrieved_rules)
         state["retrieved_rules"] = retrieved_rules
         return state
 
     def _compose_prompt_node(self, state: AgentState) -> AgentState:
-        prompt = self._compose_sql_prompt(
+        prompt, stats = self._compose_sql_prompt(
             state["sql"],
             state["query_plan"],
             state["server_info"],
             state["tables"],
             state["retrieved_rules"],
             state["environment"],
+            state.get("static_findings"),
         )
         state["prompt"] = prompt
+        state["prompt_stats"] = stats
+        self._apply_history_window(state)
         return state
 
-    def _call_llm_node(self, state: AgentState) -> AgentState:
-        messages = [SystemMessage(content=SYSTEM_REVIEWER_PROMPT)]
+    def _apply_history_window(self, state: AgentState):
+        """Сократить историю потока и записать размер запроса этого хода."""
+        history, summary, history_stats = window_history(
+            state.get("chat_history") or [],
+            state.get("chat_summary") or "",
+            settings.chat_history_strategy,
+            settings.chat_history_max_turns,
+            settings.chat_history_token_budget,
+        )
+        state["chat_history"] = history
+        state["chat_summary"] = summary
+
+        request_tokens = (
+            count_tokens(SYSTEM_REVIEWER_PROMPT)
+            + history_stats["summary_tokens"]
+            + history_stats["history_tokens"]
+            + state["prompt_stats"].get("prompt_tokens", count_tokens(state["prompt"]))
+        )
+        state["prompt_stats"]["history"] = history_stats
+        state["prompt_stats"]["request_tokens"] = request_tokens
+        if history_stats["turns_total"]:
+            logger.info(
+                "Ход %d потока: %d токенов запроса, история %d/%d ходов",
+                history_stats["turns_total"] + 1,
+                request_tokens,
+                history_stats["turns_kept"],
+                history_stats["turns_total"],
+            )
+
+    def _build_llm_messages(self, state: AgentState) -> List:
+        system_prompt = SYSTEM_REVIEWER_PROMPT
+        if state.get("chat_summary"):
+            system_prompt += (
+                "\n\nРанее в этом диалоге проверены запросы:\n" + state["chat_summary"]
+            )
+        messages = [SystemMessage(content=system_prompt)]
         if state.get("chat_history"):
             for msg in state["chat_history"]:
                 if msg["role"] == "user":
                     messages.append(HumanMessage(content=msg["content"]))
                 elif msg["role"] == "assistant":
-                    from langchain.schema import AIMessage
-
                     messages.append(AIMessage(content=msg["content"]))
 
         messages.append(HumanMessage(content=state["prompt"]))
+        return messages
 
-        response = self.llm_service.invoke_with_messages(messages)
-        logger.info(f"LLM response type: {type(response)}, response: {response}")
+    def _store_llm_response(self, state: AgentState, response: str) -> AgentState:
+        logger.debug("LLM response: %s", response)
         state["response"] = response
 
         if "chat_history" not in state:
             state["chat_history"] = []
-        state["chat_history"].append({"role": "user", "content": state["prompt"]})
+        state["chat_history"].append(
+            {
+                "role": "user",
+                "content": state["prompt"],
+                "sql": state["sql"],
+                "request_tokens": (state.get("prompt_stats") or {}).get(
+                    "request_tokens"
+                ),
+            }
+        )
         state["chat_history"].append(
             {"role": "assistant", "content": state["response"]}
         )
 
         return state
 
+    def _sql_route(self, state: AgentState):
+        return self._route(state, has_plan=bool(state.get("query_plan")))
+
+    def _call_llm_node(self, state: AgentState) -> AgentState:
+        messages = self._build_llm_messages(state)
+        response = self.llm_service.invoke_with_messages(
+            messages, self._sql_route(state)
+        )
+        return self._store_llm_response(state, response)
+
+    async def _acall_llm_node(
+        self, state: AgentState, config: RunnableConfig = None
+    ) -> AgentState:
+        messages = self._build_llm_messages(state)
+        route = self._sql_route(state)
+        if (config or {}).get("configurable", {}).get("stream_tokens"):
+            write = get_stream_writer()
+            parts = []
+            async for token in self.llm_service.astream_with_messages(messages, route):
+                parts.append(token)
+                write({"event": "token", "data": token})
+            response = "".join(parts)
+        else:
+            response = await self.llm_service.ainvoke_with_messages(messages, route)
+        return self._store_llm_response(state, response)
+
+    def _stage_event(
+        self, node: str, update: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        if node == "lint":
+            return {"event": "static_findings", "data": update.get("static_findings")}
+        if node == "retrieve_rules":
+            rules = update.get("retrieved_rules") or []
+            return {
+                "event": "rules_retrieved",
+                "data": {
+                    "count": len(rules),
+                    "titles": [r.get("title", "") for r in rules],
+                },
+            }
+        if node == "compose_prompt":
+            return {
+                "event": "prompt_composed",
+                "data": {
+                    "prompt_chars": len(update.get("prompt") or ""),
+                    **(update.get("prompt_stats") or {}),
+                },
+            }
+        return None
+
     def _parse_response_node(self, state: AgentState) -> AgentState:
         try:
-            logger.info(
-                f"Parsing response type: {type(state['response'])}, response: {state['response']}"
-            )
-            json_response = safe_extract_json(state["response"])
-            logger.info(f"Extracted JSON: {json_response}")
-            parsed_result = json.loads(json_response)
-            logger.info(
-                f"Parsed result type: {type(parsed_result)}, result: {parsed_result}"
+            logger.debug("Parsing LLM response: %s", state["response"])
+            state["result"] = parse_llm_result(
+                state["response"], state.get("environment", "test")
             )
-
-            if isinstance(parsed_result, dict):
-                state["result"] = parsed_result
-            else:
-                state["result"] = {
-                    "errors": [],
-                    "overall_score": 80,
-                    "notes": str(parsed_result),
-                    "analysis_summary": {},
-                }
-        except (json.JSONDecodeError, TypeError) as e:
-            logger.error(f"Error parsing JSON response: {e}")
+            state["parse_failed"] = False
+        except (ValueError, TypeError) as e:
+            logger.error("Error parsing JSON response: %s", e)
+            logger.debug("Raw response causing error: %s", state["response"])
+            state["parse_failed"] = True
             state["result"] = {
                 "errors": [
                     {"content": "Failed to parse analysis result", "criticality": "low"}
@@ -120,6 +451,25 @@ class SQLReviewWorkflow:
                 "notes": f"Analysis completed with parsing error: {str(e)}",
                 "analysis_summary": {},
             }
+        return self._merge_static_findings(state)
+
+    def _merge_static_findings(self, state: AgentState) -> AgentState:
+        """Добавить статические замечания к ответу LLM.
+
+        Оценка не может быть выше той, что дают одни статические замечания.
+        """
+        findings = state.get("static_findings") or []
+        result = state["result"]
+        if not findings or not isinstance(result.get("errors", []), list):
+            return state
+
+        result["errors"] = findings + result.get("errors", [])
+        static_score = compute_overall_score(findings, state.get("environment", "test"))
+        score = result.get("overall_score", 100)
+        if isinstance(score, (int, float)):
+            result["overall_score"] = min(score, round(static_score))
+        else:
+            result["overall_score"] = round(static_score)
         return state
 
     def _retrieve_rules(
@@ -130,22 +480,15 @@ class SQLReviewWorkflow:
             return []
         try:
             results = self.store.similarity_search(sql, k=top_k)
-            logger.info(f"Retrieved {len(results)} rules for SQL query")
+            logger.debug("Retrieved %d rules for SQL query", len(results))
             return results
         except Exception as e:
-            logger.error(f"Error retrieving rules: {e}")
+            logger.error("Error retrieving rules: %s", e)
             return []
 
-    def _compose_sql_prompt(
-        self,
-        sql: str,
-        query_plan: str,
-        server_info: Dict[str, str],
-        tables: List[Dict[str, str]],
-        retrieved_rules: List[Dict[str, Any]],
-        environment: str,
-    ) -> str:
-        tables_summary = [
+    @staticmethod
+    def _tables_summary(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
             {
                 "schema": t.get("schema", ""),
                 "name": t.get("name", ""),
@@ -161,47 +504,293 @@ class SQLReviewWorkflow:
                     for c in t.get("columns", [])
                 ],
             }
-            for t in tables
+            for t in tables or []
         ]
 
-        rules_text = ""
-        for r in retrieved_rules:
-            severity = r.get("metadata", {}).get("severity_default", "medium")
-            rules_text += f"- {r.get('title', '')}: {r.get('text', '')[:800]} (severity={severity})\n"
-
-        return BASE_PROMPT_TEMPLATE.format(
-            retrieved_rules=rules_text,
-            sql=sql,
-            query_plan=query_plan or "None",
-            server_info=json.dumps(server_info),
-            tables_summary=json.dumps(tables_summary),
-            environment=environment,
+    def _compose_sql_prompt(
+        self,
+        sql: str,
+        query_plan: str,
+        server_info: Dict[str, str],
+        tables: List[Dict[str, str]],
+        retrieved_rules: List[Dict[str, Any]],
+        environment: str,
+        static_findings: List[Dict[str, Any]] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        tables_summary = self._tables_summary(tables)
+        plan = compact_plan(query_plan, settings.plan_summary_threshold)
+        plan_summary = compact_plan(query_plan, 0)
+
+        return fit_prompt(
+            BASE_PROMPT_TEMPLATE,
+            {
+                "sql": sql,
+                "server_info": json.dumps(server_info),
+                "environment": environment,
+                "static_findings": (
+                    json.dumps(static_findings, ensure_ascii=False)
+                    if static_findings
+                    else "None"
+                ),
+            },
+            [
+                PromptSection(
+                    "retrieved_rules",
+                    rules_variants(retrieved_rules, with_severity=True),
+                    priority=0,
+                ),
+                PromptSection("tables_summary", tables_variants(tables_summary), 1),
+                PromptSection(
+                    "query_plan",
+                    [plan or "None", plan_summary or "None"],
+                    priority=2,
+                ),
+            ],
+            settings.prompt_token_budget,
+        )
+
+    async def areview_packed(
+        self,
+        initial_states: List[Dict[str, Any]],
+        thread_ids: List[str],
+        max_concurrency: int = settings.review_batch_concurrency,
+    ) -> List[Any]:
+        """Проверить несколько запросов, объединяя небольшие в один вызов LLM.
+
+        Запросы с похожим набором найденных правил собираются в общий промпт
+        с отдельной секцией на каждый запрос; ответ разбирается обратно по
+        идентификаторам. Запросы, для которых разбор не удался, а также
+        крупные запросы и быстрый режим проверяются по одному. Результаты
+        возвращаются в порядке запросов, на месте неудачной проверки —
+        исключение.
+        """
+        results: List[Any] = [None] * len(initial_states)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        packable = []
+
+        for index, state in enumerate(initial_states):
+            # Продолжение потока с историей проверяется отдельно, через граф
+            if await self._acontinues_thread(state, thread_ids[index]):
+                continue
+            cache_key = self._cache_key(state)
+            if cache_key:
+                cached = await self.cache.aget(cache_key)
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            if state.get("fast_mode"):
+                continue
+            item = await asyncio.to_thread(self._pack_item, index, state, cache_key)
+            if item["tokens"] <= settings.review_pack_max_query_tokens:
+                packable.append(item)
+
+        groups = [g for g in self._pack_groups(packable) if len(g) > 1]
+        if groups:
+            logger.info(
+                "Упаковка пакета: %d запросов в %d вызовов LLM",
+                sum(len(g) for g in groups),
+                len(groups),
+            )
+        packed = await asyncio.gather(
+            *(self._areview_pack(group, semaphore) for group in groups)
+        )
+        for group_results in packed:
+            for index, result in group_results.items():
+                results[index] = result
+
+        async def review_single(index: int):
+            async with semaphore:
+                try:
+                    results[index] = await self.aexecute(
+                        initial_states[index], thread_ids[index]
+                    )
+                except Exception as e:
+                    logger.error("Error in single review fallback: %s", e)
+                    results[index] = e
+
+        await asyncio.gather(
+            *(review_single(i) for i, r in enumerate(results) if r is None)
         )
+        return results
 
-    def execute(
-        self, initial_state: Dict[str, Any], thread_id: str = None
+    def _pack_item(
+        self, index: int, state: Dict[str, Any], cache_key: Optional[str]
     ) -> Dict[str, Any]:
-        config = {
-            "configurable": {"thread_id": thread_id or "default"},
-            "callbacks": [CallbackHandler()],
+        findings = lint_sql(state["sql"])
+        fired = {f["rule"] for f in findings}
+        rules = [
+            r for r in self._retrieve_rules(state["sql"]) if r.get("title") not in fired
+        ]
+        block = "\n".join(
+            [
+                f"[q{index + 1}]",
+                f"SQL: {state['sql']}",
+                "PLAN: "
+                + (
+                    compact_plan(
+                        state.get("query_plan"), settings.plan_summary_threshold
+                    )
+                    or "None"
+                ),
+                f"TABLES: {json.dumps(self._tables_summary(state.get('tables')))}",
+                "STATIC_FINDINGS: "
+                + (json.dumps(findings, ensure_ascii=False) if findings else "None"),
+            ]
+        )
+        return {
+            "index": index,
+            "id": f"q{index + 1}",
+            "state": state,
+            "cache_key": cache_key,
+            "findings": findings,
+            "rules": rules,
+            "block": block,
+            "tokens": count_tokens(block),
+            "context": json.dumps(
+                [state.get("server_info") or {}, state.get("environment")],
+                sort_keys=True,
+            ),
         }
-        final_state = self.graph.invoke(initial_state, config=config)
-        return final_state["result"]
 
+    @staticmethod
+    def _pack_groups(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Жадно сгруппировать запросы с общим контекстом и похожими правилами."""
+        query_budget = settings.prompt_token_budget // 2
+        groups: List[Dict[str, Any]] = []
+        for item in items:
+            titles = {r.get("title") for r in item["rules"]}
+            for group in groups:
+                common = len(group["titles"] & titles)
+                overlap = common / min(len(group["titles"]), len(titles) or 1)
+                if (
+                    group["context"] == item["context"]
+                    and len(group["items"]) < settings.review_pack_size
+                    and group["tokens"] + item["tokens"] <= query_budget
+                    and (not group["titles"] or not titles or overlap >= 0.5)
+                ):
+                    group["items"].append(item)
+                    group["titles"] |= titles
+                    group["tokens"] += item["tokens"]
+                    break
+            else:
+                groups.append(
+                    {
+                        "items": [item],
+                        "titles": set(titles),
+                        "tokens": item["tokens"],
+                        "context": item["context"],
+                    }
+                )
+        return [group["items"] for group in groups]
+
+    async def _areview_pack(
+        self, group: List[Dict[str, Any]], semaphore: asyncio.Semaphore
+    ) -> Dict[int, Dict[str, Any]]:
+        """Проверить группу одним вызовом LLM; вернуть разобранные результаты."""
+        rules, seen = [], set()
+        for item in group:
+            for rule in item["rules"]:
+                if rule.get("title") not in seen:
+                    seen.add(rule.get("title"))
+                    rules.append(rule)
+
+        state = group[0]["state"]
+        prompt, stats = fit_prompt(
+            PACKED_PROMPT_TEMPLATE,
+            {
+                "server_info": json.dumps(state.get("server_info") or {}),
+                "environment": state.get("environment"),
+                "queries": "\n\n".join(item["block"] for item in group),
+                "ids": ", ".join(item["id"] for item in group),
+            },
+            [
+                PromptSection(
+                    "retrieved_rules", rules_variants(rules, with_severity=True), 0
+                )
+            ],
+            settings.prompt_token_budget,
+        )
+        messages = [
+            SystemMessage(content=SYSTEM_REVIEWER_PROMPT),
+            HumanMessage(content=prompt),
+        ]
 
-class ConfigAnalysisWorkflow:
+        route = self._route(
+            {
+                "environment": state.get("environment"),
+                "prompt_stats": stats,
+            },
+            has_plan=any(item["state"].get("query_plan") for item in group),
+        )
+        async with semaphore:
+            try:
+                response = await self.llm_service.ainvoke_with_messages(messages, route)
+                parsed = extract_json(response)
+            except Exception as e:
+                logger.warning(
+                    "Упакованная проверка не удалась, запросы проверяются по одному: %s",
+                    e,
+                )
+                return {}
+
+        if isinstance(parsed, list):
+            parsed = {r.get("id"): r for r in parsed if isinstance(r, dict)}
+        if not isinstance(parsed, dict):
+            return {}
+
+        results = {}
+        for item in group:
+            try:
+                result = validate_result(parsed.get(item["id"]))
+            except ValueError:
+                continue
+            if "overall_score" not in result:
+                continue
+            result.pop("id", None)
+            merged = self._merge_static_findings(
+                {
+                    "static_findings": item["findings"],
+                    "result": result,
+                    "environment": item["state"].get("environment", "test"),
+                }
+            )
+            if item["cache_key"]:
+                await self.cache.aset(item["cache_key"], merged["result"])
+            results[item["index"]] = merged["result"]
+
+        missing = len(group) - len(results)
+        if missing:
+            logger.warning(
+                "В упакованном ответе нет %d из %d результатов", missing, len(group)
+            )
+        logger.info("Упакованный промпт: %s", stats)
+        return results
+
+
+class ConfigAnalysisWorkflow(BaseWorkflow):
     """Workflow для анализа конфигурации."""
 
-    def __init__(self, llm_service, store):
-        self.llm_service = llm_service
-        self.store = store
-        self.graph = self._build_graph()
+    default_thread_id = "config_analysis"
+    cache_kind = "config"
+    result_nodes = ("parse_config_response",)
+
+    def _cache_payload(self, initial_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return {
+            "config": initial_state["config"],
+            "server_info": initial_state.get("server_info") or {},
+            "environment": initial_state.get("environment"),
+        }
 
     def _build_graph(self):
         graph = StateGraph(ConfigAgentState)
         graph.add_node("retrieve_config_rules", self._retrieve_config_rules_node)
         graph.add_node("compose_config_prompt", self._compose_config_prompt_node)
-        graph.add_node("call_config_llm", self._call_config_llm_node)
+        graph.add_node(
+            "call_config_llm",
+            RunnableLambda(
+                self._call_config_llm_node, afunc=self._acall_config_llm_node
+            ),
+        )
         graph.add_node("parse_config_response", self._parse_config_response_node)
 
         graph.add_edge(START, "retrieve_config_rules")
@@ -210,7 +799,7 @@ class ConfigAnalysisWorkflow:
         graph.add_edge("call_config_llm", "parse_config_response")
         graph.add_edge("parse_config_response", END)
 
-        return graph.compile(checkpointer=MemorySaver())
+        return graph.compile(checkpointer=self.checkpointer)
 
     def _retrieve_config_rules_node(self, state: ConfigAgentState) -> ConfigAgentState:
         retrieved_rules = self._retrieve_config_rules(state["config"])
@@ -218,40 +807,47 @@ class ConfigAnalysisWorkflow:
         return state
 
     def _compose_config_prompt_node(self, state: ConfigAgentState) -> ConfigAgentState:
-        prompt = self._compose_config_prompt(
+        prompt, stats = self._compose_config_prompt(
             state["config"],
             state["server_info"],
             state["retrieved_rules"],
             state["environment"],
         )
         state["prompt"] = prompt
+        state["prompt_stats"] = stats
         return state
 
-    def _call_config_llm_node(self, state: ConfigAgentState) -> ConfigAgentState:
-        messages = [
+    def _build_config_messages(self, state: ConfigAgentState) -> List:
+        return [
             SystemMessage(content="Ты — эксперт по конфигурации PostgreSQL."),
             HumanMessage(content=state["prompt"]),
         ]
-        response = self.llm_service.invoke_with_messages(messages)
+
+    def _call_config_llm_node(self, state: ConfigAgentState) -> ConfigAgentState:
+        messages = self._build_config_messages(state)
+        response = self.llm_service.invoke_with_messages(messages, self._route(state))
+        state["response"] = response
+        return state
+
+    async def _acall_config_llm_node(self, state: ConfigAgentState) -> ConfigAgentState:
+        messages = self._build_config_messages(state)
+        response = await self.llm_service.ainvoke_with_messages(
+            messages, self._route(state)
+        )
         state["response"] = response
         return state
 
     def _parse_config_response_node(self, state: ConfigAgentState) -> ConfigAgentState:
         try:
-            json_response = safe_extract_json(state["response"])
-            parsed_result = json.loads(json_response)
-
-            if isinstance(parsed_result, dict):
-                state["result"] = parsed_result
-            else:
-                state["result"] = {
-                    "errors": [],
-                    "overall_score": 80,
-                    "notes": str(parsed_result),
-                    "analysis_summary": {},
-                }
-        except (json.JSONDecodeError, TypeError) as e:
-            logger.error(f"Error parsing config JSON response: {e}")
+            logger.debug("Parsing config LLM response: %s", state["response"])
+            state["result"] = parse_llm_result(
+                state["response"], state.get("environment", "test")
+            )
+            state["parse_failed"] = False
+        except (ValueError, TypeError) as e:
+            logger.error("Error parsing config JSON response: %s", e)
+            logger.debug("Raw response causing error: %s", state["response"])
+            state["parse_failed"] = True
             state["result"] = {
                 "errors": [
                     {
@@ -279,42 +875,47 @@ class ConfigAnalysisWorkflow:
         server_info: Dict[str, str],
         retrieved_rules: List[Dict[str, Any]],
         environment: str,
-    ) -> str:
-        rules_text = ""
-        for r in retrieved_rules:
-            rules_text += f"- {r.get('title', '')}: {r.get('text', '')[:800]}\n"
-
-        return CONFIG_ANALYZE_TEMPLATE.format(
-            retrieved_rules=rules_text,
-            config=json.dumps(config, indent=2),
-            server_info=json.dumps(server_info, indent=2),
-            environment=environment,
+    ) -> Tuple[str, Dict[str, Any]]:
+        return fit_prompt(
+            CONFIG_ANALYZE_TEMPLATE,
+            {
+                "server_info": json.dumps(server_info, indent=2),
+                "environment": environment,
+            },
+            [
+                PromptSection("retrieved_rules", rules_variants(retrieved_rules), 0),
+                PromptSection(
+                    "config",
+                    [json.dumps(config, indent=2), json.dumps(config)],
+                    priority=1,
+                ),
+            ],
+            settings.prompt_token_budget,
         )
 
-    def execute(
-        self, initial_state: Dict[str, Any], thread_id: str = None
-    ) -> Dict[str, Any]:
-        config = {
-            "configurable": {"thread_id": thread_id or "config_analysis"},
-            "callbacks": [CallbackHandler()],
-        }
-        final_state = self.graph.invoke(initial_state, config=config)
-        return final_state["result"]
-
 
-class LogsAnalysisWorkflow:
+class LogsAnalysisWorkflow(BaseWorkflow):
     """Workflow для анализа логов."""
 
-    def __init__(self, llm_service, store):
-        self.llm_service = llm_service
-        self.store = store
-        self.graph = self._build_graph()
+    default_thread_id = "logs_analysis"
+    cache_kind = "logs"
+    result_nodes = ("parse_logs_response",)
+
+    def _cache_payload(self, initial_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return {
+            "logs": initial_state["logs"].strip(),
+            "server_info": initial_state.get("server_info") or {},
+            "environment": initial_state.get("environment"),
+        }
 
     def _build_graph(self):
         graph = StateGraph(LogsAgentState)
         graph.add_node("retrieve_logs_rules", self._retrieve_logs_rules_node)
         graph.add_node("compose_logs_prompt", self._compose_logs_prompt_node)
-        graph.add_node("call_logs_llm", self._call_logs_llm_node)
+        graph.add_node(
+            "call_logs_llm",
+            RunnableLambda(self._call_logs_llm_node, afunc=self._acall_logs_llm_node),
+        )
         graph.add_node("parse_logs_response", self._parse_logs_response_node)
 
         graph.add_edge(START, "retrieve_logs_rules")
@@ -323,7 +924,7 @@ class LogsAnalysisWorkflow:
         graph.add_edge("call_logs_llm", "parse_logs_response")
         graph.add_edge("parse_logs_response", END)
 
-        return graph.compile(checkpointer=MemorySaver())
+        return graph.compile(checkpointer=self.checkpointer)
 
     def _retrieve_logs_rules_node(self, state: LogsAgentState) -> LogsAgentState:
         retrieved_rules = self._retrieve_logs_rules(state["logs"])
@@ -331,13 +932,14 @@ class LogsAnalysisWorkflow:
         return state
 
     def _compose_logs_prompt_node(self, state: LogsAgentState) -> LogsAgentState:
-        prompt = self._compose_logs_prompt(
+        prompt, stats = self._compose_logs_prompt(
             state["logs"],
             state["server_info"],
             state["retrieved_rules"],
             state["environment"],
         )
         state["prompt"] = prompt
+        state["prompt_stats"] = stats
         return state
 
     def _compose_logs_prompt(
@@ -346,48 +948,51 @@ class LogsAnalysisWorkflow:
         server_info: Dict[str, str],
         retrieved_rules: List[Dict[str, Any]],
         environment: str,
-    ) -> str:
-        rules_text = ""
-        for r in retrieved_rules:
-            rules_text += f"- {r.get('title', '')}: {r.get('text', '')[:800]}\n"
-
-        return LOGS_ANALYZE_TEMPLATE.format(
-            retrieved_rules=rules_text,
-            logs=logs,
-            server_info=json.dumps(server_info, indent=2),
-            environment=environment,
+    ) -> Tuple[str, Dict[str, Any]]:
+        return fit_prompt(
+            LOGS_ANALYZE_TEMPLATE,
+            {
+                "server_info": json.dumps(server_info, indent=2),
+                "environment": environment,
+            },
+            [
+                PromptSection("retrieved_rules", rules_variants(retrieved_rules), 0),
+                PromptSection("logs", logs_variants(logs), 1),
+            ],
+            settings.prompt_token_budget,
         )
 
-    def _call_logs_llm_node(self, state: LogsAgentState) -> LogsAgentState:
-        messages = [
+    def _build_logs_messages(self, state: LogsAgentState) -> List:
+        return [
             SystemMessage(content="Ты — эксперт по логам PostgreSQL."),
             HumanMessage(content=state["prompt"]),
         ]
-        response = self.llm_service.invoke_with_messages(messages)
+
+    def _call_logs_llm_node(self, state: LogsAgentState) -> LogsAgentState:
+        messages = self._build_logs_messages(state)
+        response = self.llm_service.invoke_with_messages(messages, self._route(state))
+        state["response"] = response
+        return state
+
+    async def _acall_logs_llm_node(self, state: LogsAgentState) -> LogsAgentState:
+        messages = self._build_logs_messages(state)
+        response = await self.llm_service.ainvoke_with_messages(
+            messages, self._route(state)
+        )
         state["response"] = response
         return state
 
     def _parse_logs_response_node(self, state: LogsAgentState) -> LogsAgentState:
         try:
-            logger.info(
-                f"Raw LLM response for logs analysis: {state['response'][:500]}..."
+            logger.debug("Parsing logs LLM response: %s", state["response"])
+            state["result"] = parse_llm_result(
+                state["response"], state.get("environment", "test")
             )
-            json_response = safe_extract_json(state["response"])
-            logger.info(f"Extracted JSON: {json_response[:200]}...")
-            parsed_result = json.loads(json_response)
-
-            if isinstance(parsed_result, dict):
-                state["result"] = parsed_result
-            else:
-                state["result"] = {
-                    "errors": [],
-                    "overall_score": 80,
-                    "notes": str(parsed_result),
-                    "analysis_summary": {},
-                }
+            state["parse_failed"] = False
         except (ValueError, TypeError) as e:
-            logger.error(f"Error parsing logs JSON response: {e}")
-            logger.error(f"Raw response causing error: {state['response']}")
+            logger.error("Error parsing logs JSON response: %s", e)
+            logger.debug("Raw response causing error: %s", state["response"])
+            state["parse_failed"] = True
             state["result"] = {
                 "errors": [
                     {
@@ -408,13 +1013,3 @@ class LogsAnalysisWorkflow:
             return []
         search_query = logs[:500]
         return self.store.similarity_search(search_query, k=top_k)
-
-    def execute(
-        self, initial_state: Dict[str, Any], thread_id: str = None
-    ) -> Dict[str, Any]:
-        config = {
-            "configurable": {"thread_id": thread_id or "logs_analysis"},
-            "callbacks": [CallbackHandler()],
-        }
-        final_state = self.graph.invoke(initial_state, config=config)
-        return final_state["result"]
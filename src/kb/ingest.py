@@ -1,19 +1,27 @@
-import os
 import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.document import Document
 from src.core.config import settings
+from src.store.embeddings import get_embeddings
 
-from src.core.constants import FILE_ENCODING
+from src.core.constants import FILE_ENCODING, KB_MANIFEST_FILE, KB_MANIFEST_VERSION
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+_ingest_lock = threading.Lock()
+
 
 def _read_rule_file(path: str) -> str:
     with open(path, "r", encoding=FILE_ENCODING) as f:
@@ -34,37 +42,188 @@ def _extract_metadata_from_content(content: str) -> dict:
     return metadata
 
 
-def ingest_rules(rules_dir: str, rule_type: str = "sql"):
-    """Загружает правила определенного типа в соответствующий FAISS индекс."""
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode(FILE_ENCODING)).hexdigest()
+
+
+def _chunk_ids(rel_path: str, chunks: List[str]) -> List[str]:
+    """Идентификаторы фрагментов: не меняются, пока не изменился текст фрагмента."""
+    ids = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        base = _content_hash(f"{rel_path}\0{chunk}")[:32]
+        seen[base] = seen.get(base, 0) + 1
+        ids.append(base if seen[base] == 1 else f"{base}-{seen[base]}")
+    return ids
+
+
+def _index_params() -> Dict[str, Any]:
+    """Параметры, при изменении которых индекс строится заново."""
+    return {
+        "version": KB_MANIFEST_VERSION,
+        "embedding_model": settings.embeddings_model,
+        "chunk_size": settings.chunk_size,
+        "chunk_overlap": settings.chunk_overlap,
+    }
+
+
+def _load_manifest(persist_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(persist_dir, KB_MANIFEST_FILE)
+    if not os.path.exists(os.path.join(persist_dir, "index.faiss")):
+        return None
+    try:
+        with open(path, "r", encoding=FILE_ENCODING) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_atomic(store: FAISS, manifest: Dict[str, Any], persist_dir: str):
+    """Записать индекс в новый каталог и переключить на него символьную ссылку.
+
+    persist_dir указывает на текущую версию индекса, поэтому читатели видят
+    либо старый индекс, либо новый целиком. Предыдущая версия сохраняется,
+    чтобы не прервать уже начатую загрузку, более старые удаляются.
+    """
+    # Пути сравниваются при очистке, поэтому каталог берется без символьных ссылок
+    parent, name = os.path.split(os.path.abspath(persist_dir))
+    parent = os.path.realpath(parent)
+    persist_dir = os.path.join(parent, name)
+    os.makedirs(parent, exist_ok=True)
+    version_dir = os.path.join(parent, f".{name}.{time.time_ns()}")
+    store.save_local(version_dir)
+    with open(
+        os.path.join(version_dir, KB_MANIFEST_FILE), "w", encoding=FILE_ENCODING
+    ) as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    previous = None
+    if os.path.islink(persist_dir):
+        previous = os.path.realpath(persist_dir)
+    elif os.path.isdir(persist_dir):
+        # Индекс прежнего формата — обычный каталог, его нельзя заменить ссылкой
+        previous = os.path.join(parent, f".{name}.{time.time_ns()}")
+        os.rename(persist_dir, previous)
+
+    link = os.path.join(parent, f".{name}.link-{os.getpid()}")
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, persist_dir)
+
+    keep = {os.path.realpath(version_dir), previous}
+    for path in glob.glob(os.path.join(parent, f".{name}.*")):
+        if (
+            os.path.realpath(path) not in keep
+            and os.path.isdir(path)
+            and not os.path.islink(path)
+        ):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def ingest_rules(
+    rules_dir: str, rule_type: str = "sql", full_rebuild: bool = False
+) -> Dict[str, int]:
+    """Загружает правила определенного типа в соответствующий FAISS индекс.
+
+    Манифест индекса хранит хэш каждого файла и идентификаторы его
+    фрагментов, поэтому эмбеддинги считаются только для новых и измененных
+    фрагментов, а векторы удаленных файлов удаляются из индекса.
+    """
     rules_dir = os.path.abspath(rules_dir)
     files = sorted(glob.glob(os.path.join(rules_dir, "**", "*.md"), recursive=True))
     if not files:
-        logger.warning(f"Файлы с правилами не найдены в {rules_dir}")
-        return
-
-    embeddings = HuggingFaceEmbeddings(model_name=settings.embeddings_model)
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap
-    )
-
-    docs = []
-    for p in files:
-        text = _read_rule_file(p)
-        title = Path(p).stem
-
-        metadata = _extract_metadata_from_content(text)
-
-        chunks = splitter.split_text(text)
-        for ch in chunks:
-            md = {"title": title, "source": p, "type": rule_type, **metadata}
-            docs.append({"page_content": ch, "metadata": md})
-
-    lc_docs = [
-        Document(page_content=d["page_content"], metadata=d["metadata"]) for d in docs
-    ]
-    store = FAISS.from_documents(lc_docs, embeddings)
+        logger.warning("Файлы с правилами не найдены в %s", rules_dir)
+        return {}
 
     persist_dir = os.path.join(settings.faiss_persist_dir, rule_type)
-    os.makedirs(persist_dir, exist_ok=True)
-    store.save_local(persist_dir)
-    logger.info(f"FAISS индекс для {rule_type} успешно сохранен в {persist_dir}")
+    with _ingest_lock:
+        embeddings = get_embeddings()
+        params = _index_params()
+        manifest = None if full_rebuild else _load_manifest(persist_dir)
+        store = None
+        old_files: Dict[str, Dict[str, Any]] = {}
+        if manifest and all(manifest.get(k) == v for k, v in params.items()):
+            store = FAISS.load_local(
+                os.path.realpath(persist_dir),
+                embeddings,
+                allow_dangerous_deserialization=True,
+            )
+            old_files = manifest["files"]
+
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap
+        )
+
+        new_files: Dict[str, Dict[str, Any]] = {}
+        added: Dict[str, Document] = {}
+        updated: Dict[str, Document] = {}
+        for p in files:
+            rel_path = os.path.relpath(p, rules_dir)
+            text = _read_rule_file(p)
+            digest = _content_hash(text)
+            old = old_files.get(rel_path)
+            if old and old["hash"] == digest:
+                new_files[rel_path] = old
+                continue
+
+            title = Path(p).stem
+            metadata = _extract_metadata_from_content(text)
+            chunks = splitter.split_text(text)
+            ids = _chunk_ids(rel_path, chunks)
+            old_ids = set(old["chunk_ids"]) if old else set()
+            for chunk_id, ch in zip(ids, chunks):
+                md = {"title": title, "source": p, "type": rule_type, **metadata}
+                doc = Document(page_content=ch, metadata=md)
+                # Вектор неизмененного фрагмента переиспользуется, а метаданные
+                # файла могли поменяться
+                (updated if chunk_id in old_ids else added)[chunk_id] = doc
+            new_files[rel_path] = {"hash": digest, "chunk_ids": ids}
+
+        keep = {i for entry in new_files.values() for i in entry["chunk_ids"]}
+        removed = [
+            i
+            for entry in old_files.values()
+            for i in entry["chunk_ids"]
+            if i not in keep
+        ]
+        stats = {
+            "files": len(new_files),
+            "changed_files": sum(
+                1 for rel, entry in new_files.items() if old_files.get(rel) != entry
+            ),
+            "deleted_files": len(set(old_files) - set(new_files)),
+            "added_chunks": len(added),
+            "removed_chunks": len(removed),
+            "reused_chunks": len(keep) - len(added),
+        }
+
+        if store is not None and new_files == old_files:
+            logger.info("FAISS индекс для %s актуален", rule_type)
+            return stats
+        if store is None and not added:
+            logger.warning("Правила в %s не содержат текста", rules_dir)
+            return stats
+
+        if store is None:
+            store = FAISS.from_documents(
+                list(added.values()), embeddings, ids=list(added)
+            )
+        else:
+            if removed:
+                store.delete(removed)
+            if updated:
+                store.docstore.delete(list(updated))
+                store.docstore.add(updated)
+            if added:
+                store.add_documents(list(added.values()), ids=list(added))
+
+        _save_atomic(store, {**params, "files": new_files}, persist_dir)
+    logger.info(
+        "FAISS индекс для %s сохранен в %s: добавлено фрагментов %d, удалено %d, "
+        "переиспользовано %d",
+        rule_type,
+        persist_dir,
+        stats["added_chunks"],
+        stats["removed_chunks"],
+        stats["reused_chunks"],
+    )
+    return stats
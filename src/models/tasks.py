@@ -62,9 +62,10 @@ class TaskExecution(Base):
     __tablename__ = "task_executions"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    scheduled_task_id = Column(Integer, nullable=False)
+    # Для заданий API (анализ по запросу) задачи и подключения нет
+    scheduled_task_id = Column(Integer, nullable=True)
     task_type = Column(String(50), nullable=False)
-    connection_id = Column(Integer, nullable=False)
+    connection_id = Column(Integer, nullable=True)
     status = Column(String(20), nullable=False, default="pending")
     parameters = Column(JSON)
     started_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -14,6 +14,13 @@ class TaskType(str, Enum):
     QUERY_ANALYSIS = "query_analysis"
     CUSTOM_SQL = "custom_sql"
     TABLE_ANALYSIS = "table_analysis"
+    # Разовые задания API: анализ из запроса клиента, без подключения к БД
+    SQL_REVIEW = "sql_review"
+    CONFIG_ANALYSIS = "config_analysis"
+    LOGS_ANALYSIS = "logs_analysis"
+
+
+JOB_TASK_TYPES = (TaskType.SQL_REVIEW, TaskType.CONFIG_ANALYSIS, TaskType.LOGS_ANALYSIS)
 
 
 class AnalysisTarget(str, Enum):
@@ -101,7 +108,7 @@ class TaskExecutionCreate(BaseModel):
 class TaskExecutionResponse(BaseModel):
     id: int
     task_type: TaskType
-    connection_id: int
+    connection_id: Optional[int] = None
     scheduled_task_id: Optional[int] = None
     status: TaskStatus
     started_at: datetime
@@ -119,7 +126,7 @@ class TaskQueueItem(BaseModel):
 
     execution_id: int
     task_type: TaskType
-    connection_id: int
+    connection_id: Optional[int] = None
     scheduled_task_id: Optional[int] = None
     parameters: Dict[str, Any] = {}
     priority: int = 0
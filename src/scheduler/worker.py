@@ -12,12 +12,29 @@ from typing import Dict, Any, Optional
 import redis.asyncio as redis
 import httpx
 from src.core.config import settings
+from src.core.constants import INTERNAL_TOKEN_HEADER, JOB_WEBHOOK_TIMEOUT
 from src.services.database_service import DatabaseService
 from src.services.vault_service import VaultService
-from .models import TaskType, TaskStatus, TaskQueueItem
+from src.core.utils.sql_fingerprint import group_by_fingerprint
+from src.core.utils.webhook import post_webhook
+from .models import JOB_TASK_TYPES, TaskType, TaskStatus, TaskQueueItem
 
 logger = logging.getLogger(__name__)
 
+# Задания API выполняются синхронными эндпоинтами анализа
+JOB_ENDPOINTS = {
+    TaskType.SQL_REVIEW: "/api/v1/review/",
+    TaskType.CONFIG_ANALYSIS: "/api/v1/config/analyze",
+    TaskType.LOGS_ANALYSIS: "/api/v1/logs/analyze",
+}
+
+
+def internal_api_headers() -> Dict[str, str]:
+    """Заголовки вызовов API воркером: токен освобождает их от лимита клиентов."""
+    if not settings.internal_api_token:
+        return {}
+    return {INTERNAL_TOKEN_HEADER: settings.internal_api_token}
+
 
 class TaskWorker:
     """Воркер для выполнения задач."""
@@ -108,6 +125,15 @@ class TaskWorker:
         try:
             self.mark_task_running(task.execution_id)
 
+            if task.task_type in JOB_TASK_TYPES:
+                result = await self.process_job(task)
+                self.mark_task_completed(task.execution_id, result)
+                await self.notify_webhook(task, TaskStatus.COMPLETED, result=result)
+                logger.info(
+                    f"Воркер {self.worker_id}: задание {task.execution_id} выполнено"
+                )
+                return
+
             connection_data = self.get_connection_data(task.connection_id)
             if not connection_data:
                 raise ConnectionError(
@@ -144,10 +170,72 @@ class TaskWorker:
                 f"Воркер {self.worker_id}: ошибка выполнения задачи {task.execution_id}: {e}"
             )
 
-            if task.retry_count < task.max_retries:
+            if task.retry_count < task.max_retries and self._is_retryable(task, e):
                 await self.retry_task(task)
             else:
                 self.mark_task_failed(task.execution_id, str(e))
+                if task.task_type in JOB_TASK_TYPES:
+                    await self.notify_webhook(
+                        task, TaskStatus.FAILED, error_message=str(e)
+                    )
+
+    def _is_retryable(self, task: TaskQueueItem, error: Exception) -> bool:
+        """Ошибки клиента в заданиях API (некорректный запрос) не повторяются."""
+        if task.task_type not in JOB_TASK_TYPES:
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            code = error.response.status_code
+            return code >= 500 or code in (408, 429)
+        return True
+
+    async def process_job(self, task: TaskQueueItem) -> Dict[str, Any]:
+        """Выполнить задание API через синхронный эндпоинт анализа."""
+        api_url = f"{settings.scheduler_api_url}{JOB_ENDPOINTS[task.task_type]}"
+        payload = task.parameters.get("payload", {})
+
+        async with httpx.AsyncClient(timeout=300) as client:
+            response = await client.post(
+                api_url, json=payload, headers=internal_api_headers()
+            )
+            response.raise_for_status()
+            return response.json()
+
+    async def notify_webhook(
+        self,
+        task: TaskQueueItem,
+        status: TaskStatus,
+        result: Optional[Dict[str, Any]] = None,
+        error_message: Optional[str] = None,
+    ):
+        """Сообщить о завершении задания на webhook клиента, если он указан."""
+        webhook_url = task.parameters.get("webhook_url")
+        if not webhook_url:
+            return
+
+        payload = {
+            "job_id": task.execution_id,
+            "job_type": task.task_type.value,
+            "status": status.value,
+            "result": result,
+            "error_message": error_message,
+        }
+        # Адрес проверяется повторно: хост мог измениться после создания задания
+        try:
+            await post_webhook(webhook_url, payload, JOB_WEBHOOK_TIMEOUT)
+        except ValueError as e:
+            logger.warning(
+                "Воркер %s: webhook задания %s отклонен: %s",
+                self.worker_id,
+                task.execution_id,
+                e,
+            )
+        except Exception as e:
+            logger.warning(
+                "Воркер %s: не удалось вызвать webhook задания %s: %s",
+                self.worker_id,
+                task.execution_id,
+                e,
+            )
 
     def get_connection_data(self, connection_id: int) -> Optional[Dict[str, Any]]:
         """Получить данные подключения из Vault."""
@@ -211,7 +299,9 @@ class TaskWorker:
             }
 
             async with httpx.AsyncClient(timeout=300) as client:
-                response = await client.post(api_url, json=payload)
+                response = await client.post(
+                    api_url, json=payload, headers=internal_api_headers()
+                )
                 response.raise_for_status()
 
                 analysis_result = response.json()
@@ -373,7 +463,9 @@ class TaskWorker:
                 }
 
                 async with httpx.AsyncClient(timeout=300) as client:
-                    response = await client.post(api_url, json=payload)
+                    response = await client.post(
+                        api_url, json=payload, headers=internal_api_headers()
+                    )
                     response.raise_for_status()
 
                     analysis_result = response.json()
@@ -420,13 +512,15 @@ class TaskWorker:
                     """
                     )
                     queries = cursor.fetchall()
+                    # Одинаковые запросы из разных БД/ролей объединяются по отпечатку
+                    grouped = group_by_fingerprint(dict(q) for q in queries or [])
 
                     result = {
                         "message": "Анализ запросов выполнен",
                         "connection_id": connection_data["connection_id"],
                         "timestamp": datetime.now().isoformat(),
-                        "analyzed_queries": len(queries),
-                        "queries": [dict(q) for q in queries] if queries else [],
+                        "analyzed_queries": len(grouped),
+                        "queries": grouped,
                     }
 
                 except Exception:
@@ -1,5 +1,6 @@
 import logging
 import json
+import threading
 from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 import psycopg2
@@ -422,5 +423,22 @@ class DatabaseService:
             return result["id"]
         raise ValueError("Не удалось создать выполнение задачи")
 
+    def get_task_execution(self, execution_id: int) -> Optional[Dict[str, Any]]:
+        """Получить выполнение задачи по ID."""
+        return self.fetch_one(
+            "SELECT * FROM task_executions WHERE id = %s", execution_id
+        )
+
+
+_database_service: Optional[DatabaseService] = None
+_database_service_lock = threading.Lock()
+
 
-database_service = DatabaseService()
+def get_database_service() -> DatabaseService:
+    """Общий DatabaseService; пул соединений создается при первом обращении."""
+    global _database_service
+    if _database_service is None:
+        with _database_service_lock:
+            if _database_service is None:
+                _database_service = DatabaseService()
+    return _database_service
@@ -1,18 +1,26 @@
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Optional
 import logging
-from src.core.agents.gigachat_agent import GigaChatAgent
+import threading
+from src.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+_shared_service: Optional["ReviewService"] = None
+_shared_service_lock = threading.Lock()
+
 
 class ReviewService:
     def __init__(self, api_key: str):
+        # langchain, модель эмбеддингов и клиенты трассировки загружаются
+        # только при создании сервиса, а не при импорте API
+        from src.core.agents.gigachat_agent import GigaChatAgent
+
         self.agent = GigaChatAgent(api_key=api_key)
 
     def review(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         thread_id = payload.get("thread_id")
         environment = payload.get("environment", "test")
-        logger.info(f"Starting review with payload: {payload}")
+        logger.debug("Starting review with payload: %s", payload)
 
         result = self.agent.review(
             sql=payload["sql"],
@@ -21,11 +29,55 @@ class ReviewService:
             server_info=payload["server_info"],
             thread_id=thread_id,
             environment=environment,
+            fast_mode=payload.get("fast_mode", False),
+        )
+
+        logger.debug("Review result: %s", result)
+        return result
+
+    async def areview(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Асинхронное ревью SQL-запроса."""
+        logger.debug("Starting async review with payload: %s", payload)
+
+        result = await self.agent.areview(
+            sql=payload["sql"],
+            query_plan=payload["query_plan"],
+            tables=payload["tables"],
+            server_info=payload["server_info"],
+            thread_id=payload.get("thread_id"),
+            environment=payload.get("environment", "test"),
+            fast_mode=payload.get("fast_mode", False),
         )
 
-        logger.info(f"Review result type: {type(result)}, result: {result}")
+        logger.debug("Review result: %s", result)
         return result
 
+    async def areview_packed(
+        self, payloads: List[Dict[str, Any]], environment: str = "test"
+    ) -> List[Any]:
+        """Пакетное ревью с упаковкой небольших запросов в общие вызовы LLM.
+
+        На месте запроса, проверка которого не удалась, возвращается исключение.
+        """
+        return await self.agent.areview_packed(
+            payloads, environment, settings.review_batch_concurrency
+        )
+
+    async def astream_review(
+        self, payload: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Ревью SQL-запроса с отдачей событий по этапам анализа."""
+        async for event in self.agent.astream_review(
+            sql=payload["sql"],
+            query_plan=payload["query_plan"],
+            tables=payload["tables"],
+            server_info=payload["server_info"],
+            thread_id=payload.get("thread_id"),
+            environment=payload.get("environment", "test"),
+            fast_mode=payload.get("fast_mode", False),
+        ):
+            yield event
+
     def analyze_config(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         environment = payload.get("environment", "test")
         server_info = payload.get("server_info", {})
@@ -44,3 +96,90 @@ class ReviewService:
             server_info=server_info,
             environment=environment,
         )
+
+    async def aanalyze_config(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Асинхронный анализ конфигурации PostgreSQL."""
+        return await self.agent.aanalyze_config(
+            config=payload["config"],
+            server_info=payload.get("server_info", {}),
+            environment=payload.get("environment", "test"),
+        )
+
+    async def aanalyze_logs(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Асинхронный анализ логов PostgreSQL."""
+        return await self.agent.aanalyze_logs(
+            logs=payload["logs"],
+            server_info=payload.get("server_info", {}),
+            environment=payload.get("environment", "production"),
+        )
+
+    def reload_rules(self, rule_type: str):
+        """Подхватить переиндексированные правила без перезапуска процесса."""
+        self.agent.reload_rules(rule_type)
+
+    def runtime_stats(self) -> Dict[str, Any]:
+        """Метрики компонентов сервиса для health-эндпоинта."""
+        stats: Dict[str, Any] = {"llm": self.agent.llm_service.stats()}
+        if self.agent.result_cache is not None:
+            stats["review_cache"] = self.agent.result_cache.stats()
+        stats["checkpointer"] = {
+            workflow.cache_kind: workflow.checkpointer.stats()
+            for workflow in (
+                self.agent.sql_workflow,
+                self.agent.config_workflow,
+                self.agent.logs_workflow,
+            )
+        }
+        stats["retrieval_cache"] = {
+            workflow.cache_kind: workflow.store.cache_stats()
+            for workflow in (
+                self.agent.sql_workflow,
+                self.agent.config_workflow,
+                self.agent.logs_workflow,
+            )
+            if hasattr(workflow.store, "cache_stats")
+        }
+        embeddings = self.agent.sql_store.emb
+        if hasattr(embeddings, "stats"):
+            stats["embedding_cache"] = embeddings.stats()
+
+        from src.core.tracing import get_trace_exporter
+
+        stats["tracing"] = get_trace_exporter().stats()
+        return stats
+
+
+def llm_configured() -> bool:
+    """Задан ли доступ к LLM (локальной заглушке ключ не нужен)."""
+    return settings.llm_backend == "fake" or bool(settings.gigachat_api_key)
+
+
+def init_review_service() -> ReviewService:
+    """Создать общий для процесса ReviewService (повторный вызов ничего не делает).
+
+    Клиент LLM, векторные хранилища и скомпилированные графы создаются один раз
+    и переиспользуются всеми запросами.
+    """
+    global _shared_service
+    if _shared_service is not None:
+        return _shared_service
+
+    with _shared_service_lock:
+        if _shared_service is None:
+            api_key = settings.gigachat_api_key
+            if not llm_configured():
+                raise ValueError("GIGACHAT_API_KEY не найден.")
+            logger.info("Инициализация общего ReviewService")
+            _shared_service = ReviewService(api_key=api_key)
+            logger.info("Общий ReviewService готов")
+    return _shared_service
+
+
+def get_shared_review_service() -> Optional[ReviewService]:
+    """Получить общий ReviewService, если он уже инициализирован."""
+    return _shared_service
+
+
+def is_review_service_ready() -> bool:
+    """Готов ли общий ReviewService к обработке запросов."""
+    return _shared_service is not None
@@ -2,9 +2,11 @@ import asyncio
 import redis
 import json
 import signal
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Optional
 import logging
 from src.core.config import settings
+from src.scheduler.models import TaskQueueItem
 
 logger = logging.getLogger(__name__)
 
@@ -136,6 +138,13 @@ class SchedulerService:
             logger.error(f"Ошибка добавления задачи в очередь: {e}")
             raise
 
+    async def enqueue_item_async(self, item: TaskQueueItem):
+        """Поставить элемент в очередь воркера (в порядке поступления)."""
+        await asyncio.to_thread(
+            self.redis_client.lpush, "task_queue", item.model_dump_json()
+        )
+        logger.info(f"Выполнение {item.execution_id} добавлено в очередь")
+
     def add_task_to_queue(self, task_info: Dict[str, Any]):
         """Добавить задачу в очередь."""
         try:
@@ -144,3 +153,17 @@ class SchedulerService:
         except Exception as e:
             logger.error(f"Ошибка добавления задачи в очередь: {e}")
             raise
+
+
+_scheduler_service: Optional[SchedulerService] = None
+_scheduler_service_lock = threading.Lock()
+
+
+def get_scheduler_service() -> SchedulerService:
+    """Общий SchedulerService, создаваемый при первом обращении."""
+    global _scheduler_service
+    if _scheduler_service is None:
+        with _scheduler_service_lock:
+            if _scheduler_service is None:
+                _scheduler_service = SchedulerService()
+    return _scheduler_service
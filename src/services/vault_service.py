@@ -1,5 +1,6 @@
 import hvac
 import os
+import threading
 from typing import Optional, Dict, Any
 import logging
 
@@ -68,3 +69,17 @@ class VaultService:
         except Exception as e:
             logger.error(f"Ошибка удаления учетных данных из Vault: {e}")
             return False
+
+
+_vault_service: Optional[VaultService] = None
+_vault_service_lock = threading.Lock()
+
+
+def get_vault_service() -> VaultService:
+    """Общий VaultService, создаваемый при первом обращении."""
+    global _vault_service
+    if _vault_service is None:
+        with _vault_service_lock:
+            if _vault_service is None:
+                _vault_service = VaultService()
+    return _vault_service
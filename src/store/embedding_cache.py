@@ -0,0 +1,291 @@
+"""
+Кэш эмбеддингов на диске.
+
+Ключ — хэш текста, отдельный кэш на каждую модель эмбеддингов. Векторы
+хранятся в файле float32 фиксированного размера, который читается через
+отображение в память, а индекс ключей и время последнего обращения — в SQLite.
+Когда файл заполнен, место освобождается за счет давно не использованных
+векторов. Вектор записывается только в свободный слот, на который не ссылается
+ни один ключ, поэтому откат транзакции не оставляет ключей с чужими векторами.
+Кэш общий для процессов, работающих с одним каталогом.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.core.constants import EMBEDDING_CACHE_SQLITE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на число параметров запроса
+_SQL_BATCH = 500
+
+
+def _model_dir(model_name: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)[:64]
+    digest = hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:12]
+    return f"{safe}-{digest}"
+
+
+class EmbeddingCache:
+    """Векторы одной модели: индекс в SQLite, данные в отображаемом файле."""
+
+    def __init__(self, directory: str, model_name: str, max_bytes: int):
+        path = os.path.join(directory, _model_dir(model_name))
+        os.makedirs(path, exist_ok=True)
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.data_path = os.path.join(path, "vectors.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(path, "index.sqlite"),
+            timeout=EMBEDDING_CACHE_SQLITE_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)"
+        )
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self._data: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row:
+            self._open_data(int(row[0]))
+
+    def _open_data(self, dim: int):
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        # Лимит размера мог уменьшиться: векторы за его пределами удаляются
+        self._conn.execute("DELETE FROM vectors WHERE slot >= ?", (self.capacity,))
+        self._conn.execute("DELETE FROM free_slots WHERE slot >= ?", (self.capacity,))
+        with open(self.data_path, "ab") as f:
+            f.truncate(self.capacity * dim * 4)
+        self._data = np.memmap(
+            self.data_path, dtype=np.float32, mode="r+", shape=(self.capacity, dim)
+        )
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            if self._data is None:
+                self.misses += len(keys)
+                return {}
+            # Под блокировкой записи: другой процесс не перезапишет слот между
+            # чтением индекса и копированием вектора
+            found = self._transaction(self._read, keys)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def _read(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start : start + _SQL_BATCH]
+            rows = self._conn.execute(
+                "SELECT key, slot FROM vectors WHERE key IN (%s)"
+                % ",".join("?" * len(batch)),
+                batch,
+            ).fetchall()
+            for key, slot in rows:
+                found[key] = self._data[slot].tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE vectors SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        dim = len(next(iter(vectors.values())))
+        with self._lock:
+            if self._data is None:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)",
+                    (str(dim),),
+                )
+                row = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'dim'"
+                ).fetchone()
+                self._open_data(int(row[0]))
+            if dim != self.dim:
+                logger.warning(
+                    "Размерность эмбеддингов %s изменилась (%d вместо %d), "
+                    "кэш не пополняется",
+                    self.model_name,
+                    dim,
+                    self.dim,
+                )
+                return
+
+            # Вытеснение фиксируется отдельно: записывать вектор в слот можно,
+            # только когда на слот уже не ссылается ни один ключ
+            self.evictions += self._transaction(self._evict, vectors)
+            self._transaction(self._insert, vectors)
+
+    def _transaction(self, fn, *args):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _new_keys(self, vectors: Dict[str, List[float]]) -> List[str]:
+        keys = list(vectors)
+        existing = set()
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start : start + _SQL_BATCH]
+            existing.update(
+                key
+                for (key,) in self._conn.execute(
+                    "SELECT key FROM vectors WHERE key IN (%s)"
+                    % ",".join("?" * len(batch)),
+                    batch,
+                )
+            )
+        return [key for key in keys if key not in existing][: self.capacity]
+
+    def _free_slots(self, limit: int) -> List[int]:
+        """Освобожденные вытеснением слоты и еще не занятые слоты в конце файла."""
+        slots = [
+            slot
+            for (slot,) in self._conn.execute(
+                "SELECT slot FROM free_slots ORDER BY slot LIMIT ?", (limit,)
+            )
+        ]
+        (next_slot,) = self._conn.execute(
+            "SELECT COALESCE(MAX(slot) + 1, 0) FROM "
+            "(SELECT slot FROM vectors UNION ALL SELECT slot FROM free_slots)"
+        ).fetchone()
+        slots.extend(
+            range(next_slot, min(self.capacity, next_slot + limit - len(slots)))
+        )
+        return slots
+
+    def _evict(self, vectors: Dict[str, List[float]]) -> int:
+        count = len(self._new_keys(vectors))
+        evict = count - len(self._free_slots(count))
+        if evict <= 0:
+            return 0
+        rows = self._conn.execute(
+            "SELECT key, slot FROM vectors ORDER BY last_used LIMIT ?", (evict,)
+        ).fetchall()
+        self._conn.executemany(
+            "DELETE FROM vectors WHERE key = ?", [(key,) for key, _ in rows]
+        )
+        self._conn.executemany(
+            "INSERT INTO free_slots (slot) VALUES (?)", [(slot,) for _, slot in rows]
+        )
+        return len(rows)
+
+    def _insert(self, vectors: Dict[str, List[float]]):
+        # Другой процесс мог занять освобожденные слоты: лишние векторы не кэшируются
+        keys = self._new_keys(vectors)
+        slots = self._free_slots(len(keys))
+        if not slots:
+            return
+        for key, slot in zip(keys, slots):
+            self._data[slot] = vectors[key]
+        self._conn.executemany(
+            "DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots]
+        )
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO vectors (key, slot, last_used) VALUES (?, ?, ?)",
+            [(key, slot, now) for key, slot in zip(keys, slots)],
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+            return {
+                "entries": entries,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Модель эмбеддингов с кэшем на диске.
+
+    Ошибки кэша не прерывают работу: эмбеддинги считаются моделью.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.model_name = cache.model_name
+        self._embeddings = embeddings
+        self.cache = cache
+
+    @staticmethod
+    def _key(prefix: str, text: str) -> str:
+        return prefix + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        try:
+            return self.cache.get_many(list(dict.fromkeys(keys)))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("Ошибка чтения кэша эмбеддингов: %s", e)
+            return {}
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        try:
+            self.cache.put_many(vectors)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("Ошибка записи в кэш эмбеддингов: %s", e)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("d:", text) for text in texts]
+        found = self._lookup(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            computed = dict(
+                zip(missing, self._embeddings.embed_documents(list(missing.values())))
+            )
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Запрос и документ модель может кодировать по-разному
+        key = self._key("q:", text)
+        vector = self._lookup([key]).get(key)
+        if vector is None:
+            vector = self._embeddings.embed_query(text)
+            self._store({key: vector})
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
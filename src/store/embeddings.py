@@ -0,0 +1,81 @@
+"""
+Общий для процесса реестр моделей эмбеддингов.
+
+Если задан EMBEDDING_CACHE_DIR, эмбеддинги сохраняются в кэше на диске
+(src/store/embedding_cache.py) и не пересчитываются для уже встречавшихся
+фрагментов правил и запросов.
+"""
+
+import sqlite3
+import threading
+import logging
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, Embeddings] = {}
+_registry_lock = threading.Lock()
+
+
+class SharedEmbeddings(Embeddings):
+    """Потокобезопасная обертка над моделью эмбеддингов.
+
+    Быстрый токенизатор HuggingFace не допускает параллельных вызовов из
+    нескольких потоков, поэтому обращения к модели сериализуются.
+    """
+
+    def __init__(self, model_name: str, embeddings: Embeddings):
+        self.model_name = model_name
+        self._embeddings = embeddings
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            return self._embeddings.embed_query(text)
+
+
+def _with_cache(model_name: str, embeddings: Embeddings) -> Embeddings:
+    if not settings.embedding_cache_dir or settings.embedding_cache_max_mb <= 0:
+        return embeddings
+    # Импорт здесь: numpy и SQLite нужны только при включенном кэше
+    from src.store.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+    try:
+        cache = EmbeddingCache(
+            settings.embedding_cache_dir,
+            model_name,
+            settings.embedding_cache_max_mb * 1024 * 1024,
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Кэш эмбеддингов недоступен, работа без него: %s", e)
+        return embeddings
+    return CachedEmbeddings(embeddings, cache)
+
+
+def get_embeddings(model_name: Optional[str] = None) -> Embeddings:
+    """Получить общую модель эмбеддингов, загрузив ее при первом обращении."""
+    model_name = model_name or settings.embeddings_model
+
+    embeddings = _registry.get(model_name)
+    if embeddings is not None:
+        return embeddings
+
+    with _registry_lock:
+        embeddings = _registry.get(model_name)
+        if embeddings is None:
+            logger.info(f"Загрузка модели эмбеддингов {model_name}")
+            embeddings = _with_cache(
+                model_name,
+                SharedEmbeddings(
+                    model_name, HuggingFaceEmbeddings(model_name=model_name)
+                ),
+            )
+            _registry[model_name] = embeddings
+    return embeddings
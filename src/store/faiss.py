@@ -1,25 +1,48 @@
+import hashlib
 import os
+import threading
+from typing import Any, Dict
 from src.store.base import BaseVectorStore
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from src.core.cache import LRUCache
 from src.core.config import settings
+from src.store.embeddings import get_embeddings
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def _copy_hit(hit: Dict[str, Any]) -> Dict[str, Any]:
+    """Копия результата поиска: изменения вызывающего кода не попадут в кэш."""
+    return {**hit, "metadata": dict(hit["metadata"])}
+
 
 class FaissVectorStore(BaseVectorStore):
     def __init__(self, persist_dir: str = settings.faiss_persist_dir):
         self.persist_dir = persist_dir
-        self.emb = HuggingFaceEmbeddings(model_name=settings.embeddings_model)
+        self.emb = get_embeddings()
+        self.index_version = "empty"
+        # Результаты поиска по (запрос, k); сбрасываются при перезагрузке индекса
+        self.search_cache = LRUCache(settings.retrieval_cache_max_entries)
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._load()
 
-        index_path = os.path.join(self.persist_dir, "index.faiss")
+    def _load(self):
+        # persist_dir — ссылка на текущую версию индекса: разрешаем ее один раз,
+        # чтобы оба файла индекса читались из одной версии
+        index_dir = os.path.realpath(self.persist_dir)
+        index_path = os.path.join(index_dir, "index.faiss")
         if os.path.exists(index_path):
-            logger.info(f"Loading FAISS index from {self.persist_dir}")
+            logger.info(f"Loading FAISS index from {index_dir}")
             self.store = FAISS.load_local(
-                self.persist_dir, self.emb, allow_dangerous_deserialization=True
+                index_dir, self.emb, allow_dangerous_deserialization=True
             )
+            self.index_version = self._compute_index_version(index_dir)
             logger.info(
                 f"FAISS index loaded successfully with {self.store.index.ntotal} vectors"
             )
@@ -29,23 +52,66 @@ class FaissVectorStore(BaseVectorStore):
             )
             self.store = FAISS.from_texts(["dummy"], self.emb)
             self.store.delete([self.store.index_to_docstore_id[0]])
+            self.index_version = "empty"
+        self.search_cache.clear()
+
+    def _compute_index_version(self, index_dir: str) -> str:
+        """Хэш содержимого файлов индекса — версия набора правил."""
+        digest = hashlib.sha256()
+        for name in INDEX_FILES:
+            path = os.path.join(index_dir, name)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        return digest.hexdigest()[:16]
 
-    def save_index(self):
-        os.makedirs(self.persist_dir, exist_ok=True)
-        self.store.save_local(self.persist_dir)
+    def reload(self):
+        """Перечитать индекс с диска (после переиндексации правил)."""
+        self._load()
 
     def similarity_search(self, query, k=5):
-        logger.info(f"Performing similarity search for query: '{query}' with k={k}")
+        use_cache = self.search_cache.maxsize > 0
+        key = (self.index_version, query, k)
+        cached = self.search_cache.get(key) if use_cache else None
+        with self._stats_lock:
+            if cached is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+        if cached is not None:
+            return [_copy_hit(hit) for hit in cached]
+
+        out = self._search(query, k)
+        if use_cache:
+            self.search_cache.set(key, out)
+        return [_copy_hit(hit) for hit in out]
+
+    def _search(self, query, k):
+        logger.debug("Performing similarity search for query: %r with k=%d", query, k)
         hits = self.store.similarity_search_with_score(query, k)
-        logger.info(f"Found {len(hits)} similar documents")
+        logger.debug("Found %d similar documents", len(hits))
         out = []
         for doc, score in hits:
             out.append(
                 {
                     "title": doc.metadata.get("title", ""),
                     "text": doc.page_content,
-                    "metadata": doc.metadata,
+                    # Копия: метаданные документа хранятся в docstore индекса
+                    "metadata": dict(doc.metadata),
                     "score": float(score),
                 }
             )
         return out
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.search_cache),
+        }